@@ -0,0 +1,47 @@
+'''
+`AddrPool` benchmark: the sequence number allocation path of
+`nlm_request()`, that allocates a number for every request and
+bans it for 0xff rounds when the request is done.
+
+Usage::
+
+    python benchmark/addrpool.py [requests]
+
+Also runs concurrent requests, when several numbers are
+allocated at once, as with `IPRoute.pipeline()` or threads.
+'''
+import sys
+import time
+from pyroute2.common import AddrPool
+
+
+def serial(requests):
+    pool = AddrPool(minaddr=0x000000ff, maxaddr=0x0000ffff)
+    t0 = time.time()
+    for _ in range(requests):
+        pool.free(pool.alloc(), ban=0xff)
+    return time.time() - t0
+
+
+def window(requests, size):
+    pool = AddrPool(minaddr=0x000000ff, maxaddr=0x0000ffff)
+    inflight = [pool.alloc() for _ in range(size)]
+    t0 = time.time()
+    for i in range(requests):
+        pool.free(inflight[i % size], ban=0xff)
+        inflight[i % size] = pool.alloc()
+    return time.time() - t0
+
+
+def main(requests):
+    spent = serial(requests)
+    print('serial:     %.3fs (%.2f us/request)' %
+          (spent, spent / requests * 1e6))
+    for size in (32, 1024):
+        spent = window(requests, size)
+        print('window %-4i %.3fs (%.2f us/request)' %
+              (size, spent, spent / requests * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,79 @@
+'''
+Decoder benchmark over the recorded samples in `tests/decoder`.
+
+Usage::
+
+    python benchmark/decoder.py [rounds]
+
+Every round parses all the samples with the corresponding marshal,
+walks the NLA chains to force complete decoding and encodes the
+result back. The script prints the time spent in each stage, so
+running it against two revisions gives a before/after comparison;
+`benchmark/run.sh` does exactly that for the whole history.
+'''
+import os
+import sys
+import time
+from pyroute2.common import load_dump
+from pyroute2.netlink.rtnl.marshal import MarshalRtnl
+from pyroute2.netlink.nl80211 import MarshalNl80211
+
+samples = (('addrmsg_ipv4', MarshalRtnl),
+           ('gre_01', MarshalRtnl),
+           ('iw_info_rsp', MarshalNl80211),
+           ('iw_scan_rsp', MarshalNl80211))
+
+
+def load(path):
+    ret = []
+    for (name, marshal) in samples:
+        with open(os.path.join(path, name), 'r') as f:
+            ret.append((marshal(), load_dump(f)))
+    return ret
+
+
+def walk(msg):
+    # force lazy NLA decoding down to the leaves
+    for nla in msg.get('attrs', []):
+        value = nla[1]
+        if isinstance(value, dict):
+            walk(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    walk(item)
+
+
+def main(rounds):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'tests', 'decoder')
+    data = load(path)
+    parsed = []
+    t_parse = t_walk = t_encode = 0
+    count = 0
+    for _ in range(rounds):
+        t0 = time.time()
+        parsed = []
+        for (marshal, buf) in data:
+            parsed.extend(marshal.parse(buf))
+        t1 = time.time()
+        for msg in parsed:
+            walk(msg)
+        t2 = time.time()
+        for msg in parsed:
+            prime = type(msg)()
+            prime.setvalue(msg.dump())
+            prime.encode()
+        t3 = time.time()
+        t_parse += t1 - t0
+        t_walk += t2 - t1
+        t_encode += t3 - t2
+        count += len(parsed)
+    print('messages: %i' % count)
+    print('parse:    %.3fs (%.1f us/msg)' % (t_parse, t_parse / count * 1e6))
+    print('decode:   %.3fs (%.1f us/msg)' % (t_walk, t_walk / count * 1e6))
+    print('encode:   %.3fs (%.1f us/msg)' % (t_encode, t_encode / count * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,57 @@
+'''
+Contention benchmark: many threads share one `IPRoute` and
+issue `link('get')` concurrently.
+
+Usage::
+
+    python benchmark/demux.py [threads] [requests]
+
+The script runs the same load with the default read lock
+polling and with the single reader mode, `IPRoute(demux=True)`,
+and prints the total time and the request latency for both.
+'''
+import sys
+import time
+import threading
+from pyroute2 import IPRoute
+
+
+def worker(ipr, requests, latency):
+    for _ in range(requests):
+        t0 = time.time()
+        ipr.link('get', index=1)
+        latency.append(time.time() - t0)
+
+
+def run(demux, threads, requests):
+    latency = []
+    with IPRoute(demux=demux) as ipr:
+        # warm up
+        ipr.link('get', index=1)
+        pool = [threading.Thread(target=worker,
+                                 args=(ipr, requests, latency))
+                for _ in range(threads)]
+        t0 = time.time()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        total = time.time() - t0
+    latency.sort()
+    print('demux=%-5s total: %.3fs (%.0f req/s), latency '
+          'avg: %.1fms p99: %.1fms max: %.1fms' %
+          (demux, total, len(latency) / total,
+           sum(latency) / len(latency) * 1e3,
+           latency[int(len(latency) * 0.99)] * 1e3,
+           latency[-1] * 1e3))
+
+
+def main(threads, requests):
+    print('threads: %i, requests per thread: %i' % (threads, requests))
+    for demux in (False, True):
+        run(demux, threads, requests)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 32,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 100)
@@ -0,0 +1,70 @@
+'''
+`reconcile()` benchmark: converge a routing table with 1% drift,
+compared with flushing the table and adding all the routes again.
+
+Usage::
+
+    sudo python benchmark/reconcile.py [routes] [table]
+
+The routes are created on `lo` in the table, 1000 by default,
+and the table is flushed at the end.
+'''
+import sys
+import time
+from pyroute2 import IPRoute
+
+
+def route(i, table, **kwarg):
+    kwarg.update({'dst': '10.%i.%i.0/24' % (i // 256 % 256, i % 256),
+                  'table': table})
+    if i >= 65536:
+        kwarg['dst'] = '11.%i.%i.0/24' % (i // 256 % 256, i % 256)
+    if kwarg.get('type') is None:
+        kwarg['oif'] = 1
+    return kwarg
+
+
+def main(count, table):
+    ipr = IPRoute()
+    scope = {'table': table}
+    desired = [route(i, table) for i in range(count)]
+    try:
+        t0 = time.time()
+        report = ipr.reconcile('routes', desired, scope=scope)
+        print('initial:    %.3fs, %i added' %
+              (time.time() - t0, len(report['add'])))
+
+        # 1% drift: remove, add and change 1/3 each
+        step = 300
+        drift = []
+        for (i, obj) in enumerate(desired):
+            if i % step == 0:
+                continue
+            elif i % step == 1:
+                drift.append(route(i, table, type='blackhole'))
+            else:
+                drift.append(obj)
+        drift.extend([route(count + i, table)
+                      for i in range(count // step)])
+        t0 = time.time()
+        report = ipr.reconcile('routes', drift, scope=scope)
+        print('reconcile:  %.3fs, %i added, %i replaced, %i deleted, '
+              '%i kept, %i errors' %
+              (time.time() - t0, len(report['add']),
+               len(report['replace']), len(report['delete']),
+               report['keep'], len(report['errors'])))
+
+        t0 = time.time()
+        ipr.flush_routes(table=table)
+        with ipr.pipeline(window=256) as p:
+            for obj in desired:
+                p.route('add', **obj)
+        print('flush+add:  %.3fs' % (time.time() - t0))
+    finally:
+        ipr.flush_routes(table=table)
+        ipr.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
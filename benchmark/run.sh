@@ -5,7 +5,7 @@
 } || {
     stop_label=$1
 }
-modules="ipdb.py ipdb-route.py"
+modules="ipdb.py ipdb-route.py decoder.py addrpool.py"
 
 function get_stop() {
     git log -1 $1 | awk '{print $2; exit}'
@@ -19,7 +19,9 @@ from pyroute2.netlink.rtnl.req import (IPRouteRequest,
 from pyroute2.iproute import (IPRoute,
                               IPBatch,
                               RawIPRoute,
-                              RemoteIPRoute)
+                              RemoteIPRoute,
+                              AsyncIPRoute,
+                              IPRoutePool)
 from pyroute2.ipset import IPSet
 from pyroute2.ipdb.main import IPDB
 from pyroute2.ndb.main import NDB
@@ -89,6 +91,8 @@ classes = [IPRouteRequest,
            IPBatch,
            RawIPRoute,
            RemoteIPRoute,
+           AsyncIPRoute,
+           IPRoutePool,
            IPSet,
            NDB,
            IPDB,
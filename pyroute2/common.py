@@ -371,8 +371,18 @@ def load_dump(f, meta=None):
 class AddrPool(object):
     '''
     Address pool
+
+    The addresses are bits in a list of int cells, and `alloc()`
+    takes the lowest free one; `self.hint` points to the first
+    cell that can have free bits, so the full cells are not
+    scanned on every call.
+
+    Banned addresses, see `free(addr, ban)`, are kept in a ring
+    of buckets, indexed by the `alloc()` round when the ban
+    expires, so `alloc()` checks only one bucket.
     '''
     cell = 0xffffffffffffffff
+    ban_ring_size = 0x100
 
     def __init__(self,
                  minaddr=0xf,
@@ -386,7 +396,8 @@ class AddrPool(object):
         self.allocated = 0
         if self.release and not isinstance(self.release, int):
             raise TypeError()
-        self.ban = []
+        self.round = 0
+        self.ban = [[] for _ in range(self.ban_ring_size)]
         while mx:
             mx >>= 8
             self.cell_size += 1
@@ -395,56 +406,58 @@ class AddrPool(object):
         self.cells = int((maxaddr - minaddr) / self.cell_size + 1)
         # initial array
         self.addr_map = [self.cell]
+        self.hint = 0
         self.minaddr = minaddr
         self.maxaddr = maxaddr
         self.lock = threading.RLock()
 
     def alloc(self):
         with self.lock:
-            # gc self.ban:
-            for item in tuple(self.ban):
-                if item['counter'] == 0:
-                    self.free(item['addr'])
-                    self.ban.remove(item)
-                else:
-                    item['counter'] -= 1
-
-            # iterate through addr_map
-            base = 0
-            for cell in self.addr_map:
-                if cell:
-                    # not allocated addr
-                    bit = 0
-                    while True:
-                        if (1 << bit) & self.addr_map[base]:
-                            self.addr_map[base] ^= 1 << bit
-                            break
-                        bit += 1
-                    ret = (base * self.cell_size + bit)
-
-                    if self.reverse:
-                        ret = self.maxaddr - ret
+            # release the addresses with the ban expired
+            self.round += 1
+            slot = self.round % self.ban_ring_size
+            if self.ban[slot]:
+                bucket = self.ban[slot]
+                self.ban[slot] = []
+                for (expire, addr) in bucket:
+                    if expire == self.round:
+                        self.free(addr)
                     else:
-                        ret = ret + self.minaddr
-
-                    if self.minaddr <= ret <= self.maxaddr:
-                        if self.release:
-                            self.free(ret, ban=self.release)
-                        self.allocated += 1
-                        return ret
-                    else:
-                        self.free(ret)
-                        raise KeyError('no free address available')
+                        # long bans take several laps of the ring
+                        self.ban[slot].append((expire, addr))
 
+            # find the first cell with free addresses
+            base = self.hint
+            while base < len(self.addr_map) and not self.addr_map[base]:
                 base += 1
-            # no free address available
-            if len(self.addr_map) < self.cells:
-                # create new cell to allocate address from
-                self.addr_map.append(self.cell)
-                return self.alloc()
+            if base == len(self.addr_map):
+                if len(self.addr_map) < self.cells:
+                    # create new cell to allocate address from
+                    self.addr_map.append(self.cell)
+                else:
+                    self.hint = base
+                    raise KeyError('no free address available')
+            self.hint = base
+
+            # the lowest set bit
+            cell = self.addr_map[base]
+            bit = (cell & -cell).bit_length() - 1
+            ret = (base * self.cell_size + bit)
+
+            if self.reverse:
+                ret = self.maxaddr - ret
             else:
+                ret = ret + self.minaddr
+
+            if not self.minaddr <= ret <= self.maxaddr:
                 raise KeyError('no free address available')
 
+            self.addr_map[base] ^= 1 << bit
+            self.allocated += 1
+            if self.release:
+                self.free(ret, ban=self.release)
+            return ret
+
     def locate(self, addr):
         if self.reverse:
             addr = self.maxaddr - addr
@@ -466,15 +479,20 @@ class AddrPool(object):
             if value == 'free' and is_allocated:
                 self.allocated -= 1
                 self.addr_map[base] |= 1 << bit
+                self.hint = min(self.hint, base)
             elif value == 'allocated' and not is_allocated:
                 self.allocated += 1
                 self.addr_map[base] &= ~(1 << bit)
 
     def free(self, addr, ban=0):
+        '''
+        Free the address. With `ban` > 0 the address remains
+        allocated for `ban` more `alloc()` calls.
+        '''
         with self.lock:
             if ban != 0:
-                self.ban.append({'addr': addr,
-                                 'counter': ban})
+                expire = self.round + ban + 1
+                self.ban[expire % self.ban_ring_size].append((expire, addr))
             else:
                 base, bit, is_allocated = self.locate(addr)
                 if len(self.addr_map) <= base:
@@ -483,6 +501,7 @@ class AddrPool(object):
                     raise KeyError('address is not allocated')
                 self.allocated -= 1
                 self.addr_map[base] ^= 1 << bit
+                self.hint = min(self.hint, base)
 
 
 def _fnv1_python2(data):
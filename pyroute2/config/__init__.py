@@ -7,8 +7,11 @@ SocketBase = socket.socket
 MpPipe = multiprocessing.Pipe
 MpQueue = multiprocessing.Queue
 MpProcess = multiprocessing.Process
+MpPool = multiprocessing.Pool
 ipdb_nl_async = True
 nlm_generator = False
+nla_lazy = True
+link_resolver = False
 
 commit_barrier = 0
 gc_timeout = 60
@@ -1,6 +1,7 @@
 import time
 import errno
 import traceback
+from itertools import groupby
 from socket import AF_INET
 from socket import AF_INET6
 from socket import inet_ntop
@@ -13,9 +14,11 @@ from pyroute2.common import dqn2int
 from pyroute2.common import View
 from pyroute2.common import Dotkeys
 from pyroute2.netlink import rtnl
+from pyroute2.netlink import NLM_F_ACK
 from pyroute2.netlink.exceptions import NetlinkError
 from pyroute2.netlink.rtnl.ifinfmsg import IFF_MASK
 from pyroute2.netlink.rtnl.ifinfmsg import ifinfmsg
+from pyroute2.iproute.linux import RTNLCapture
 from pyroute2.ipdb.transactional import Transactional
 from pyroute2.ipdb.transactional import with_transaction
 from pyroute2.ipdb.transactional import SYNC_TIMEOUT
@@ -62,6 +65,24 @@ def _br_time_check(x, y):
     return abs(x - y) < 5
 
 
+def _bypass_addr_delete(x):
+    # When you remove a primary IP addr, all the
+    # subnetwork can be removed. In this case you
+    # will fail, but it is OK, no need to roll back
+    if isinstance(x, NetlinkError):
+        # bypass only errno 99,
+        # 'Cannot assign address'
+        return x.code == errno.EADDRNOTAVAIL
+    # bypass illegal IP requests
+    return isinstance(x, socket_error) and \
+        isinstance(x.args[0], basestring) and \
+        x.args[0].startswith('illegal IP')
+
+
+def _bypass_addr_add(x):
+    return isinstance(x, NetlinkError) and x.code == errno.EEXIST
+
+
 class Interface(Transactional):
     '''
     Objects of this class represent network interface and
@@ -502,6 +523,61 @@ class Interface(Transactional):
                 return []
             raise error
 
+    def _run_batch(self, requests, bypass=None):
+        # Run the `RTNL_API` requests, `(key, method, argv, kwarg)`,
+        # as a pipelined batch, see `nlm_request_batch()`, and
+        # check the ACK of every one. The consecutive requests of
+        # the same type go in one batch.
+        #
+        # The errors accepted by `bypass()` are skipped. With the
+        # partial commit other errors are collected, otherwise
+        # the first one is raised, when the batch is complete.
+        #
+        # -> the set of the keys of the failed requests
+        nl = self.nl
+        failed = set()
+
+        def fail(key, error):
+            if bypass is not None and bypass(error):
+                return
+            if not self.partial:
+                raise error
+            self.errors.append(error)
+            failed.add(key)
+
+        if not hasattr(nl, 'nlm_request_batch'):
+            for (key, method, argv, kwarg) in requests:
+                try:
+                    getattr(nl, method)(*argv, **kwarg)
+                except Exception as error:
+                    fail(key, error)
+            return failed
+
+        capture = RTNLCapture(nl)
+        spans = []  # (key, first request, last request + 1)
+        for (key, method, argv, kwarg) in requests:
+            start = len(capture.requests)
+            try:
+                getattr(capture, method)(*argv, **kwarg)
+                spans.append((key, start, len(capture.requests)))
+            except Exception as error:
+                # the requests are not sent
+                del capture.requests[start:]
+                fail(key, error)
+        results = []
+        for ((msg_type, msg_flags), batch) in groupby(capture.requests,
+                                                     lambda x: x[1:]):
+            results.extend(nl.nlm_request_batch([x[0] for x in batch],
+                                                msg_type,
+                                                msg_flags | NLM_F_ACK))
+        # one API call can capture any number of requests
+        for (key, start, end) in spans:
+            for ret in results[start:end]:
+                if isinstance(ret, Exception):
+                    fail(key, ret)
+                    break
+        return failed
+
     def _resolve_port(self, port):
         # for now just a stupid resolver, will be
         # improved later with search by mac, etc.
@@ -713,12 +789,13 @@ class Interface(Transactional):
             if removed['vlans'] or added['vlans']:
 
                 self['vlans'].set_target(transaction['vlans'])
+                requests = []
 
                 for i in removed['vlans']:
                     # remove vlan from the port
-                    run(nl.vlan_filter, 'del',
-                        index=self['index'],
-                        vlan_info=self['vlans'][i][0])
+                    requests.append((i, 'vlan_filter', ('del', ),
+                                     {'index': self['index'],
+                                      'vlan_info': self['vlans'][i][0]}))
 
                 for i in added['vlans']:
                     # add vlan to the port
@@ -732,8 +809,14 @@ class Interface(Transactional):
                         # so bypass the check
                         with self._direct_state:
                             self.add_vlan(vinfo['vid'])
-                    run(nl.vlan_filter, 'add', **req)
-
+                    requests.append((i, 'vlan_filter', ('add', ), req))
+
+                # wait only for the changes that are not failed
+                failed = transaction._run_batch(requests)
+                if failed:
+                    self['vlans'].set_target((transaction['vlans'] -
+                                              failed) |
+                                             (removed['vlans'] & failed))
                 self['vlans'].target.wait(SYNC_TIMEOUT)
                 if not self['vlans'].target.is_set():
                     raise CommitException('vlans target is not set')
@@ -742,6 +825,7 @@ class Interface(Transactional):
             # Ports
             if removed['ports'] or added['ports']:
                 self['ports'].set_target(transaction['ports'])
+                requests = []
 
                 for i in removed['ports']:
                     # detach port
@@ -749,7 +833,8 @@ class Interface(Transactional):
                         (self.ipdb.interfaces[i]
                          .set_target('master', None)
                          .mirror_target('master', 'link'))
-                        run(nl.link, 'update', index=i, master=0)
+                        requests.append((i, 'link', ('update', ),
+                                         {'index': i, 'master': 0}))
                     else:
                         transaction.errors.append(KeyError(i))
 
@@ -759,10 +844,17 @@ class Interface(Transactional):
                         (self.ipdb.interfaces[i]
                          .set_target('master', self['index'])
                          .mirror_target('master', 'link'))
-                        run(nl.link, 'update', index=i, master=self['index'])
+                        requests.append((i, 'link', ('update', ),
+                                         {'index': i,
+                                          'master': self['index']}))
                     else:
                         transaction.errors.append(KeyError(i))
 
+                failed = transaction._run_batch(requests)
+                if failed:
+                    self['ports'].set_target((transaction['ports'] -
+                                              failed) |
+                                             (removed['ports'] & failed))
                 self['ports'].target.wait(SYNC_TIMEOUT)
                 if self['ports'].target.is_set():
                     for msg in self.nl.get_vlans(index=self['index']):
@@ -781,10 +873,13 @@ class Interface(Transactional):
                     port = self.ipdb.interfaces[i]
                     # port update
                     target = port._local_targets['master']
-                    target.wait(SYNC_TIMEOUT)
+                    if i not in failed:
+                        target.wait(SYNC_TIMEOUT)
                     with port._write_lock:
                         del port._local_targets['master']
                         del port._local_targets['link']
+                    if i in failed:
+                        continue
                     if not target.is_set():
                         raise CommitException('master target failed')
                     if i in added['ports']:
@@ -885,26 +980,17 @@ class Interface(Transactional):
                              key=lambda x: self['ipaddr'][x]['flags'],
                              reverse=True)
                 # 8<--------------------------------------
-                for i in rip:
-                    # When you remove a primary IP addr, all the
-                    # subnetwork can be removed. In this case you
-                    # will fail, but it is OK, no need to roll back
-                    try:
-                        run(nl.addr, 'delete', self['index'], i[0], i[1])
-                    except NetlinkError as x:
-                        # bypass only errno 99,
-                        # 'Cannot assign address'
-                        if x.code != errno.EADDRNOTAVAIL:
-                            raise
-                    except socket_error as x:
-                        # bypass illegal IP requests
-                        if isinstance(x.args[0], basestring) and \
-                                x.args[0].startswith('illegal IP'):
-                            continue
-                        raise
+                # All the changes are sent as pipelined batches,
+                # and the target is awaited once for all of them
+                failed = transaction._run_batch([(i, 'addr',
+                                                  ('delete', self['index'],
+                                                   i[0], i[1]),
+                                                  {}) for i in rip],
+                                                bypass=_bypass_addr_delete)
                 ###
                 # Add addresses
                 # 8<--------------------------------------
+                requests = []
                 for i in ip2add:
                     # Try to fetch additional address attributes
                     try:
@@ -915,13 +1001,16 @@ class Interface(Transactional):
                                                   'scope')])
                     except KeyError:
                         kwarg = None
-                    try:
-                        # feed the address to the OS
-                        run(nl.addr, 'add', self['index'], i[0], i[1],
-                            **kwarg if kwarg else {})
-                    except NetlinkError as x:
-                        if x.code != errno.EEXIST:
-                            raise
+                    # feed the address to the OS
+                    requests.append((i, 'addr',
+                                     ('add', self['index'], i[0], i[1]),
+                                     kwarg or {}))
+                failed |= transaction._run_batch(requests,
+                                                 bypass=_bypass_addr_add)
+                if failed:
+                    self['ipaddr'].set_target((transaction['ipaddr'] -
+                                               failed) |
+                                              (ip2remove & failed))
 
                 # 8<--------------------------------------
                 # some interfaces do not send IPv6 address
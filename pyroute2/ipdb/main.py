@@ -435,6 +435,18 @@ tables, so does IPDB::
     In [2]: len(ipdb.routes.tables[255])
     Out[2]: 11  # => 11 automatic routes in the table local
 
+Loading big routing tables, like the full BGP view, into the
+route objects takes a lot of time and memory. The tables can be
+either ignored with `ignore_rtables`, or loaded lazily::
+
+    # True -- all the tables, or a table number, or a list
+    ipdb = IPDB(lazy_rtables=[100, 200], lazy_rtables_cache=1024)
+
+The lazy tables keep the routes as the compact records, and
+create the route objects on the first access by the key, the
+destination or a filter. Up to `lazy_rtables_cache` route
+objects per table are kept, see `LazyRoutingTable`.
+
 It is important to understand, that routing tables keys in
 IPDB are not only the destination prefix. The key consists
 of 'prefix/mask' string and the route priority (if any)::
@@ -721,6 +733,7 @@ from pyroute2.ipdb import rules
 from pyroute2.ipdb import routes
 from pyroute2.ipdb import interfaces
 from pyroute2.ipdb.routes import BaseRoute
+from pyroute2.ipdb.routes import LazyRoutingTable
 from pyroute2.ipdb.exceptions import ShutdownException
 from pyroute2.ipdb.transactional import SYNC_TIMEOUT
 from pyroute2.ipdb.linkedset import IPaddrSet
@@ -808,14 +821,28 @@ class IPDB(object):
     The class that maintains information about network setup
     of the host. Monitoring netlink events allows it to react
     immediately. It uses no polling.
+
+    The events are applied in batches, the main loop counters
+    are in `stats`: `batches`, `messages`, `coalesced` and
+    `max_batch`.
     '''
 
+    # the main loop batch limit, messages
+    _batch_size = 4096
+    # the updates to coalesce within a batch, see `_coalesce()`;
+    # the addresses are not coalesced, since the socket key is
+    # IFA_ADDRESS, but the DB key is IFA_LOCAL
+    _coalesce_events = ('RTM_NEWLINK',
+                        'RTM_NEWNEIGH',
+                        'RTM_NEWROUTE')
+
     def __init__(self, nl=None, mode='implicit',
                  restart_on_error=None, nl_async=None,
                  sndbuf=1048576, rcvbuf=1048576,
                  nl_bind_groups=RTMGRP_DEFAULTS,
                  ignore_rtables=None, callbacks=None,
-                 sort_addresses=False, plugins=None):
+                 sort_addresses=False, plugins=None,
+                 lazy_rtables=None, lazy_rtables_cache=1024):
         plugins = plugins or ['interfaces', 'routes', 'rules']
         pmap = {'interfaces': interfaces,
                 'routes': routes,
@@ -843,15 +870,31 @@ class IPDB(object):
             self._ignore_rtables = ignore_rtables
         else:
             self._ignore_rtables = []
+        if isinstance(lazy_rtables, bool) or lazy_rtables is None:
+            self._lazy_rtables = bool(lazy_rtables)
+        elif isinstance(lazy_rtables, int):
+            self._lazy_rtables = [lazy_rtables, ]
+        else:
+            self._lazy_rtables = lazy_rtables
+        self._lazy_rtables_cache = lazy_rtables_cache
         self._stop = False
         # see also 'register_callback'
         self._post_callbacks = {}
         self._pre_callbacks = {}
 
         # local event queues
-        # - callbacks event queue
-        self._cbq = queue.Queue(maxsize=8192)
+        # - callbacks event queue: the batches of messages,
+        #   up to `_cbq_size` messages in total
+        self._cbq = queue.Queue()
+        self._cbq_size = 8192
+        self._cbq_count = 0
+        self._cbq_lock = threading.Lock()
         self._cbq_drop = 0
+        # main loop counters, see `_serve_messages()`
+        self.stats = {'batches': 0,
+                      'messages': 0,
+                      'coalesced': 0,
+                      'max_batch': 0}
         # - users event queue
         self._evq = None
         self._evq_lock = threading.Lock()
@@ -927,6 +970,9 @@ class IPDB(object):
             idx_list.append(self.ipaddr)
             idx_list.append(self.neighbours)
         if 'routes' in self._loaded:
+            for table in tuple(self.routes.tables.values()):
+                if isinstance(table, LazyRoutingTable):
+                    table.unload()
             idx_list.extend([self.routes.tables[x] for x
                              in self.routes.tables.keys()])
         if 'rules' in self._loaded:
@@ -1021,7 +1067,11 @@ class IPDB(object):
         processed by IPDB and all corresponding objects are
         created or deleted. Using ipdb reference in "post"
         callbacks you will access the most up-to-date state
-        of the IP database.
+        of the IP database. The messages are processed in
+        batches, so unless there are "pre" callbacks, the
+        state can already include the next messages of the
+        batch; the callbacks get the messages in the order
+        they arrived anyways.
 
         "Post" callbacks are executed asynchronously in
         separate threads. These threads can work as long
@@ -1376,17 +1426,20 @@ class IPDB(object):
         ###
 
         while not self._stop:
-            msg = self._cbq.get()
+            messages = self._cbq.get()
             self._cbq.task_done()
-            if isinstance(msg, ShutdownException):
+            if isinstance(messages, ShutdownException):
                 return
-            elif isinstance(msg, Exception):
-                raise msg
-            for cb in tuple(self._post_callbacks.values()):
-                try:
-                    cb(self, msg, msg['event'])
-                except:
-                    pass
+            elif isinstance(messages, Exception):
+                raise messages
+            with self._cbq_lock:
+                self._cbq_count -= len(messages)
+            for msg in messages:
+                for cb in tuple(self._post_callbacks.values()):
+                    try:
+                        cb(self, msg, msg['event'])
+                    except:
+                        pass
 
     def _serve_main(self):
         ###
@@ -1397,7 +1450,15 @@ class IPDB(object):
 
         while not self._stop:
             try:
-                messages = self.mnl.get()
+                messages = list(self.mnl.get())
+                # collect the messages received so far into one
+                # batch, see `_serve_messages()`
+                pending = getattr(self.mnl, 'pending', None)
+                while pending is not None and \
+                        len(messages) < self._batch_size and \
+                        not self._stop and \
+                        pending():
+                    messages.extend(self.mnl.get())
                 ##
                 # Check it again
                 #
@@ -1426,50 +1487,139 @@ class IPDB(object):
                     log.error('Emergency shutdown, cleanup manually')
                     raise RuntimeError('Emergency shutdown')
 
-            for msg in messages:
-                # Run pre-callbacks
-                # NOTE: pre-callbacks are synchronous
+            self._serve_messages(messages)
+
+    def _coalesce(self, messages):
+        '''
+        Return the messages to apply to the DB, w/o the updates
+        superseded within the batch: an `RTM_NEW*` is dropped, if
+        the next message about the same object, see the socket
+        `coalesce_key()`, is also an `RTM_NEW*` of the same family.
+        An `RTM_NEWLINK` for an interface not in the DB yet is
+        kept, if there is any other message about the interface
+        in between, like an address or a neighbour, since their
+        records are created with the interface one.
+        '''
+        key = getattr(self.mnl, 'coalesce_key', None)
+        if key is None:
+            return messages
+        known = self.interfaces if 'interfaces' in self._loaded else {}
+        pending = set()  # the objects with the next update known
+        links = {}       # index -> the pending link key
+        ret = []
+        for msg in reversed(messages):
+            event = msg.get('event', None)
+            okey = key(msg)
+            if okey is not None:
+                okey = (okey, msg.get('family', None))
+            update = okey is not None and event in self._coalesce_events
+            if update and okey in pending:
+                continue
+            index = msg.get('index', None)
+            if index is None:
+                index = msg.get('ifindex', None)
+            if index is not None and \
+                    index not in known and \
+                    links.get(index, okey) != okey:
+                pending.discard(links.pop(index))
+            if update:
+                pending.add(okey)
+                if event == 'RTM_NEWLINK':
+                    links[index] = okey
+            else:
+                pending.discard(okey)
+            ret.append(msg)
+        ret.reverse()
+        return ret
+
+    def _cbq_put(self, messages):
+        '''
+        Queue the messages for the post-callbacks; the queue
+        is limited by the number of the messages, and the
+        messages that don't fit are dropped
+        '''
+        with self._cbq_lock:
+            room = max(0, self._cbq_size - self._cbq_count)
+            if room < len(messages):
+                self._cbq_drop += len(messages) - room
+                messages = messages[:room]
+            if not messages:
+                return
+            self._cbq_count += len(messages)
+            if self._cbq_drop:
+                log.warning('dropped %d events', self._cbq_drop)
+                self._cbq_drop = 0
+        try:
+            self._cbq.put_nowait(messages)
+        except Exception:
+            log.error('Emergency shutdown, cleanup manually')
+            raise RuntimeError('Emergency shutdown')
+
+    def _serve_messages(self, messages):
+        '''
+        Apply the messages to the DB and run the callbacks, as
+        the main loop does; see also `pyroute2.netlink.record`.
+
+        The batch is applied under one `exclusive` lock
+        acquisition, w/o the superseded updates, see `_coalesce()`.
+        The pre-callbacks see the DB as it was prior to every
+        message, so if there are any, the messages are applied
+        one by one, every one right after its pre-callbacks. The
+        post-callbacks and the event queue get all the messages,
+        in the same order, right after the messages are applied:
+        with the pre-callbacks message by message, as before the
+        batching, otherwise after the whole batch. The counters
+        are in `stats`.
+        '''
+        messages = tuple(messages)
+        if not messages:
+            return
+
+        if self._pre_callbacks:
+            batches = [(msg, ) for msg in messages]
+        else:
+            batches = [messages]
+
+        for batch in batches:
+            # Run pre-callbacks
+            # NOTE: pre-callbacks are synchronous
+            for msg in batch:
                 for (cuid, cb) in tuple(self._pre_callbacks.items()):
                     try:
                         cb(self, msg, msg['event'])
                     except:
                         pass
 
-                with self.exclusive:
+            with self.exclusive:
+                apply = self._coalesce(batch)
+                self.stats['coalesced'] += len(batch) - len(apply)
+                for msg in apply:
                     event = msg.get('event', None)
                     if event in self._event_map:
                         for func in self._event_map[event]:
                             func(msg)
 
-                    # Post-callbacks
+                # Post-callbacks, the batch at once
+                self._cbq_put(batch)
+
+        with self.exclusive:
+            self.stats['batches'] += 1
+            self.stats['messages'] += len(messages)
+            self.stats['max_batch'] = max(self.stats['max_batch'],
+                                          len(messages))
+
+            # Users event queue; the messages go one by one,
+            # since `qsize` limits the number of the messages
+            if self._evq:
+                for msg in messages:
                     try:
-                        self._cbq.put_nowait(msg)
-                        if self._cbq_drop:
-                            log.warning('dropped %d events',
-                                        self._cbq_drop)
-                            self._cbq_drop = 0
+                        self._evq.put_nowait(msg)
+                        if self._evq_drop:
+                            log.warning("dropped %d events",
+                                        self._evq_drop)
+                            self._evq_drop = 0
                     except queue.Full:
-                        self._cbq_drop += 1
-                    except Exception:
+                        self._evq_drop += 1
+                    except Exception as e:
                         log.error('Emergency shutdown, cleanup manually')
                         raise RuntimeError('Emergency shutdown')
-
-                    #
-                    # Why not to put these two pieces of the code
-                    # it in a routine?
-                    #
-                    # TODO: run performance tests with routines
-
-                    # Users event queue
-                    if self._evq:
-                        try:
-                            self._evq.put_nowait(msg)
-                            if self._evq_drop:
-                                log.warning("dropped %d events",
-                                            self._evq_drop)
-                                self._evq_drop = 0
-                        except queue.Full:
-                            self._evq_drop += 1
-                        except Exception as e:
-                            log.error('Emergency shutdown, cleanup manually')
-                            raise RuntimeError('Emergency shutdown')
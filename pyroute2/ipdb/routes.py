@@ -1,15 +1,17 @@
 import time
 import types
-import struct
 import logging
 import traceback
+import weakref
 import threading
 from collections import namedtuple
+from collections import OrderedDict
 from socket import AF_UNSPEC
 from socket import AF_INET6
 from socket import AF_INET
 from socket import inet_pton
 from socket import inet_ntop
+from binascii import hexlify
 from pyroute2.common import AF_MPLS
 from pyroute2.common import basestring
 from pyroute2.netlink import rtnl
@@ -21,6 +23,7 @@ from pyroute2.netlink.rtnl import rt_type
 from pyroute2.netlink.rtnl import rt_proto
 from pyroute2.netlink.rtnl import encap_type
 from pyroute2.netlink.rtnl.rtmsg import rtmsg
+from pyroute2.netlink.rtnl.rtmsg import RTM_F_FIB_MATCH
 from pyroute2.netlink.rtnl.req import IPRouteRequest
 from pyroute2.netlink.rtnl.ifaddrmsg import IFA_F_SECONDARY
 from pyroute2.ipdb.exceptions import CommitException
@@ -34,6 +37,14 @@ groups = rtnl.RTMGRP_IPV4_ROUTE |\
     rtnl.RTMGRP_IPV6_ROUTE |\
     rtnl.RTMGRP_MPLS_ROUTE
 IP6_RT_PRIO_USER = 1024
+# the fields indexed in `RoutingTable`
+route_indices = ('dst',
+                 'dst_len',
+                 'oif',
+                 'iif',
+                 'gateway',
+                 'family',
+                 'ipdb_scope')
 
 
 class Metrics(Transactional):
@@ -209,11 +220,19 @@ class BaseRoute(Transactional):
                    'gateway': _normalize_ipaddr,
                    'prefsrc': _normalize_ipaddr}
 
+    _table = None
+
     def __init__(self, ipdb, mode=None, parent=None, uid=None):
         Transactional.__init__(self, ipdb, mode, parent, uid)
         with self._direct_state:
             self['ipdb_priority'] = 0
 
+    def __setitem__(self, key, value):
+        Transactional.__setitem__(self, key, value)
+        # update the table indices, see `RoutingTable.filter()`
+        if key in route_indices and self._table is not None:
+            self._table.reindex(self, key)
+
     @with_transaction
     def add_nh(self, prime):
         with self._write_lock:
@@ -480,21 +499,13 @@ class BaseRoute(Transactional):
                 if old_key != new_key:
                     # assume we can not move routes between tables (yet ;)
                     if self['family'] == AF_MPLS:
-                        route_index = self.ipdb.routes.tables['mpls'].idx
+                        route_index = self.ipdb.routes.tables['mpls']
                     else:
                         route_index = (self.ipdb
                                        .routes
-                                       .tables[self['table'] or 254]
-                                       .idx)
+                                       .tables[self['table'] or 254])
                     # re-link the route record
-                    if new_key in route_index:
-                        raise CommitException('route idx conflict')
-                    else:
-                        route_index[new_key] = {'key': new_key,
-                                                'route': self}
-                    # wipe the old key, if needed
-                    if old_key in route_index:
-                        del route_index[old_key]
+                    route_index.rekey(old_key, new_key, self)
                 self.nl.route(devop, **transaction)
                 # delete old record, if required
                 if (old_key != new_key) and (devop == 'set'):
@@ -745,7 +756,7 @@ class Route(BaseRoute):
                 isinstance(value, basestring) and \
                 value in ('0.0.0.0/0', '::/0'):
             ret = 'default'
-        Transactional.__setitem__(self, key, ret)
+        BaseRoute.__setitem__(self, key, ret)
 
     def __getitem__(self, key):
         ret = Transactional.__getitem__(self, key)
@@ -837,29 +848,225 @@ class MPLSRoute(BaseRoute):
             return ret
 
 
+class PrefixTrie(object):
+    '''
+    Binary trie of IP addresses, to find the addresses within
+    a network in the time proportional to the prefix length and
+    the number of the addresses found. Invalid addresses are
+    ignored.
+    '''
+
+    def __init__(self):
+        # family -> node, node: [child 0, child 1, address]
+        self.root = {AF_INET: [None, None, None],
+                     AF_INET6: [None, None, None]}
+
+    @staticmethod
+    def parse(addr):
+        # -> (family, int, bits) or None
+        if not isinstance(addr, basestring):
+            return None
+        family = AF_INET6 if addr.find(':') > -1 else AF_INET
+        try:
+            value = int(hexlify(inet_pton(family, addr)), 16)
+        except (OSError, ValueError, TypeError):
+            return None
+        return (family, value, 32 if family == AF_INET else 128)
+
+    def add(self, addr):
+        key = self.parse(addr)
+        if key is None:
+            return
+        (family, value, bits) = key
+        node = self.root[family]
+        for shift in range(bits - 1, -1, -1):
+            bit = (value >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        node[2] = addr
+
+    def remove(self, addr):
+        key = self.parse(addr)
+        if key is None:
+            return
+        (family, value, bits) = key
+        path = []
+        node = self.root[family]
+        for shift in range(bits - 1, -1, -1):
+            bit = (value >> shift) & 1
+            if node[bit] is None:
+                return
+            path.append((node, bit))
+            node = node[bit]
+        node[2] = None
+        # prune the empty branch
+        for (parent, bit) in reversed(path):
+            child = parent[bit]
+            if child[0] is None and child[1] is None and child[2] is None:
+                parent[bit] = None
+            else:
+                break
+
+    def within(self, network, prefixlen):
+        '''
+        Return the list of the addresses within the network
+        '''
+        key = self.parse(network)
+        if key is None:
+            return []
+        (family, value, bits) = key
+        node = self.root[family]
+        for shift in range(bits - 1, bits - 1 - prefixlen, -1):
+            node = node[(value >> shift) & 1]
+            if node is None:
+                return []
+        ret = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node[2] is not None:
+                ret.append(node[2])
+            stack.extend([x for x in node[:2] if x is not None])
+        return ret
+
+
 class RoutingTable(object):
+    '''
+    The routing table. The records are `{'route': ..., 'key': ...}`
+    dicts, stored in `idx` by the `RouteKey`.
+
+    The table keeps also the secondary indices on the `indices`
+    fields, `{field: {value: {id(route): record}}}`, so `filter()`
+    and the lookups by a dict or by `dst` don't scan the table.
+    The routes report the changes of the indexed fields with
+    `reindex()`. The gateways are kept also in a `PrefixTrie`,
+    see `filter_gateway()`.
+    '''
 
     route_class = Route
+    indices = route_indices
 
     def __init__(self, ipdb, prime=None):
         self.ipdb = ipdb
         self.lock = threading.Lock()
         self.idx = {}
         self.kdx = {}
+        # the indices lock must be the last to acquire, since
+        # the routes call `reindex()` under their own locks
+        self.sdx_lock = threading.Lock()
+        self.sdx = dict([(x, {}) for x in self.indices])
+        self.sdx_values = {}  # id(route) -> {field: indexed value}
+        self.gateways = PrefixTrie()
 
     def __nogc__(self):
-        return self.filter(lambda x: x['route']['ipdb_scope'] != 'gc')
+        with self.sdx_lock:
+            gc = tuple(self.sdx['ipdb_scope'].get('gc', {}))
+        if not gc:
+            return tuple(self.idx.values())
+        return [x for x in tuple(self.idx.values())
+                if id(x['route']) not in gc]
 
     def __repr__(self):
         return repr([x['route'] for x in self.__nogc__()])
 
     def __len__(self):
-        return len(self.keys())
+        with self.sdx_lock:
+            return len(self.idx) - len(self.sdx['ipdb_scope'].get('gc', {}))
 
     def __iter__(self):
         for record in self.__nogc__():
             yield record['route']
 
+    def _sdx_add(self, field, value, route_id, record):
+        # must be called under `sdx_lock`
+        index = self.sdx[field]
+        if value not in index:
+            index[value] = {}
+            if field == 'gateway':
+                self.gateways.add(value)
+        index[value][route_id] = record
+
+    def _sdx_del(self, field, value, route_id):
+        # must be called under `sdx_lock`
+        index = self.sdx[field]
+        record = index[value].pop(route_id, None)
+        if not index[value]:
+            del index[value]
+            if field == 'gateway':
+                self.gateways.remove(value)
+        return record
+
+    def _unindex(self, route_id):
+        # must be called under `sdx_lock`
+        values = self.sdx_values.pop(route_id, None)
+        if values is None:
+            return
+        for (field, value) in values.items():
+            self._sdx_del(field, value, route_id)
+
+    def index(self, record):
+        '''
+        Add the record to the indices, or update it there
+        '''
+        route = record['route']
+        with self.sdx_lock:
+            self._unindex(id(route))
+            values = {}
+            for field in self.indices:
+                value = dict.get(route, field)
+                values[field] = value
+                self._sdx_add(field, value, id(route), record)
+            self.sdx_values[id(route)] = values
+        route._table = self
+
+    def unindex(self, record):
+        '''
+        Remove the record from the indices
+        '''
+        route = record['route']
+        with self.sdx_lock:
+            self._unindex(id(route))
+        if route._table is self:
+            route._table = None
+
+    def reindex(self, route, field):
+        '''
+        Update the index on the field for the route, if indexed
+        '''
+        if field not in self.sdx:
+            return
+        with self.sdx_lock:
+            values = self.sdx_values.get(id(route))
+            if values is None:
+                return
+            value = dict.get(route, field)
+            if values[field] == value:
+                return
+            record = self._sdx_del(field, values[field], id(route))
+            self._sdx_add(field, value, id(route), record)
+            values[field] = value
+
+    def store(self, key, record):
+        # put the record into `idx` and the indices
+        prev = self.idx.get(key)
+        if prev is not None and prev['route'] is not record['route']:
+            self.unindex(prev)
+        self.idx[key] = record
+        self.index(record)
+
+    def rekey(self, old_key, new_key, route):
+        '''
+        Move the route record to the new key
+        '''
+        if new_key in self.idx:
+            raise CommitException('route idx conflict')
+        prev = self.idx.pop(old_key, None)
+        if prev is not None and prev['route'] is not route:
+            self.unindex(prev)
+        self.store(new_key, {'key': new_key,
+                             'route': route})
+
     def gc(self):
         now = time.time()
         for route in self.filter({'ipdb_scope': 'gc'}):
@@ -871,6 +1078,7 @@ class RoutingTable(object):
                     route['route']['ipdb_scope'] = 'system'
             except:
                 del self.idx[route['key']]
+                self.unindex(route)
 
     def keys(self, key='dst'):
         with self.lock:
@@ -880,6 +1088,40 @@ class RoutingTable(object):
         for key in self.keys():
             yield (key, self[key])
 
+    def candidates(self, target):
+        '''
+        Return the records to check against the dict target: the
+        smallest index bucket, that matches the target, or all
+        the records, if no indexed fields are in the target
+        '''
+        ret = None
+        with self.sdx_lock:
+            for (key, value) in target.items():
+                if key not in self.sdx:
+                    continue
+                try:
+                    bucket = self.sdx[key].get(value, {})
+                except TypeError:
+                    # unhashable values can not be looked up
+                    continue
+                if ret is None or len(bucket) < len(ret):
+                    ret = bucket
+                    if not ret:
+                        break
+            if ret is not None:
+                return tuple(ret.values())
+        return tuple(self.idx.values())
+
+    def filter_gateway(self, network, prefixlen):
+        '''
+        Return the records with the gateway within the network
+        '''
+        ret = []
+        with self.sdx_lock:
+            for gateway in self.gateways.within(network, prefixlen):
+                ret.extend(self.sdx['gateway'][gateway].values())
+        return ret
+
     def filter(self, target, oneshot=False):
         #
         if isinstance(target, types.FunctionType):
@@ -892,7 +1134,7 @@ class RoutingTable(object):
             raise TypeError('target type not supported: %s' % type(target))
 
         ret = []
-        for record in tuple(self.idx.values()):
+        for record in self.candidates(target):
             for key, value in tuple(target.items()):
                 if (key not in record['route']) or \
                         (value != record['route'][key]):
@@ -955,6 +1197,7 @@ class RoutingTable(object):
         with self.lock:
             item = self.describe(key, forward=False)
             del self.idx[self.route_class.make_key(item['route'])]
+            self.unindex(item)
 
     def load(self, msg):
         key = self.route_class.make_key(msg)
@@ -972,6 +1215,9 @@ class RoutingTable(object):
             if isinstance(value, nlmsg):
                 record['route'].load_netlink(value)
             elif isinstance(value, self.route_class):
+                if record['key'] is not None and \
+                        record['route'] is not value:
+                    self.unindex(record)
                 record['route'] = value
             elif isinstance(value, dict):
                 with record['route']._direct_state:
@@ -979,10 +1225,10 @@ class RoutingTable(object):
 
             key = self.route_class.make_key(record['route'])
             if record['key'] is None:
-                self.idx[key] = {'route': record['route'],
-                                 'key': key}
+                self.store(key, {'route': record['route'],
+                                 'key': key})
             else:
-                self.idx[key] = record
+                self.store(key, record)
                 if record['key'] != key:
                     del self.idx[record['key']]
                     record['key'] = key
@@ -1019,18 +1265,489 @@ class MPLSTable(RoutingTable):
         raise KeyError('record not found')
 
 
+class LazyRoutingTable(RoutingTable):
+    '''
+    The routing table that creates the `Route` objects only on
+    demand. The routes not accessed yet are kept in `compact`
+    as the raw `rtmsg` data by the `RouteKey`, with the small
+    indices on `dst`, `oif`, `iif` and `gateway`, including the
+    multipath nexthops; the events for them update only these
+    records.
+
+    A route is loaded on the first lookup by the key, by `dst`
+    or by a filter, that needs the fields missing in the compact
+    record; the iteration loads the routes one by one. Up to
+    `size` loaded routes are kept in the LRU order, the least
+    recently used routes are turned back into the compact ones,
+    unless they are in a transaction or not in the `system`
+    scope. An evicted object, that is still referenced by the
+    program, is reused on the next event or lookup.
+    '''
+
+    # the fields known w/o loading the route, see `summary()`;
+    # the compact records are `(raw data, oif, iif, gateway,
+    # ((nexthop oif, nexthop gateway), ...))`
+    compact_fields = ('dst',
+                      'dst_len',
+                      'table',
+                      'family',
+                      'priority',
+                      'oif',
+                      'iif',
+                      'gateway',
+                      'ipdb_scope')
+
+    def __init__(self, ipdb, prime=None, size=1024):
+        super(LazyRoutingTable, self).__init__(ipdb, prime)
+        self.size = size
+        self.clock = threading.RLock()
+        self.compact = {}                     # key -> compact record
+        self.cdx = {'dst': {},                # dst -> (key, ...)
+                    'oif': {},                # field -> value -> {key}
+                    'iif': {},
+                    'gateway': {}}
+        self.compact_gateways = PrefixTrie()
+        self.cache = OrderedDict()            # key -> raw data, LRU
+        self.evicted = weakref.WeakValueDictionary()
+        self.suspects = {}                    # key -> time, see `gc()`
+
+    def __len__(self):
+        return super(LazyRoutingTable, self).__len__() + len(self.compact)
+
+    def __iter__(self):
+        for route in super(LazyRoutingTable, self).__iter__():
+            yield route
+        for key in tuple(self.compact):
+            record = self.materialise(key)
+            if record is not None:
+                yield record['route']
+
+    def __repr__(self):
+        return repr(list(self))
+
+    @staticmethod
+    def pack(msg):
+        # -> the raw message data
+        if not msg.length or len(msg.data) < msg.offset + msg.length:
+            msg.reset()
+            msg.encode()
+        return bytes(msg.data[msg.offset:msg.offset + msg.length])
+
+    @staticmethod
+    def _compact_refs(record):
+        # -> {(field, value), ...} to index the compact record by
+        refs = set(zip(('oif', 'iif', 'gateway'), record[1:4]))
+        for (oif, gateway) in record[4]:
+            refs.add(('oif', oif))
+            refs.add(('gateway', gateway))
+        return [x for x in refs if x[1] is not None]
+
+    def _compact_add(self, key, record):
+        # must be called under `clock`
+        self._compact_del(key)
+        self.compact[key] = record
+        self.cdx['dst'][key.dst] = self.cdx['dst'].get(key.dst, ()) + (key, )
+        for (field, value) in self._compact_refs(record):
+            index = self.cdx[field]
+            if value not in index:
+                index[value] = set()
+                if field == 'gateway':
+                    self.compact_gateways.add(value)
+            index[value].add(key)
+
+    def _compact_del(self, key):
+        # must be called under `clock`
+        record = self.compact.pop(key, None)
+        if record is None:
+            return None
+        self.suspects.pop(key, None)
+        keys = tuple([x for x in self.cdx['dst'][key.dst] if x != key])
+        if keys:
+            self.cdx['dst'][key.dst] = keys
+        else:
+            del self.cdx['dst'][key.dst]
+        for (field, value) in self._compact_refs(record):
+            index = self.cdx[field]
+            index[value].discard(key)
+            if not index[value]:
+                del index[value]
+                if field == 'gateway':
+                    self.compact_gateways.remove(value)
+        return record
+
+    def summary(self, key, record):
+        '''
+        Return the `compact_fields` of the compact record
+        '''
+        if key.dst == 'default':
+            dst_len = 0
+        else:
+            dst_len = int(key.dst.split('/')[1])
+        return {'dst': key.dst,
+                'dst_len': dst_len,
+                'table': key.table,
+                'family': key.family,
+                'priority': key.priority,
+                'oif': record[1],
+                'iif': record[2],
+                'gateway': record[3],
+                'ipdb_scope': 'system'}
+
+    def decode(self, key):
+        # -> a new route object from the compact record or `None`
+        record = self.compact.get(key)
+        if record is None:
+            return None
+        msg = rtmsg(record[0])
+        msg.decode()
+        route = self.route_class(self.ipdb)
+        route.load_netlink(msg)
+        return route
+
+    def materialise(self, key):
+        '''
+        Load the route from the compact record, return the
+        table record or `None`, if there is no such route
+        '''
+        with self.clock:
+            if key in self.idx:
+                self.touch(key)
+                return self.idx[key]
+            record = self._compact_del(key)
+            if record is None:
+                return None
+            msg = rtmsg(record[0])
+            msg.decode()
+            route = self.evicted.pop(key, None)
+            if route is None:
+                route = self.route_class(self.ipdb)
+            route.load_netlink(msg)
+            ret = {'route': route,
+                   'key': key}
+            self.store(key, ret)
+            self.cache[key] = record[0]
+            self.evict()
+            return ret
+
+    def touch(self, key):
+        # move the loaded route to the end of the LRU
+        with self.clock:
+            raw = self.cache.pop(key, None)
+            if raw is not None:
+                self.cache[key] = raw
+
+    def evict(self):
+        '''
+        Turn the least recently used routes into the compact
+        records, down to `size` loaded routes
+        '''
+        with self.clock:
+            pinned = []
+            while len(self.cache) > self.size:
+                (key, raw) = self.cache.popitem(last=False)
+                record = self.idx.get(key)
+                if record is None:
+                    continue
+                route = record['route']
+                if route['ipdb_scope'] != 'system' or \
+                        route.current_tx is not None or \
+                        route.global_tx:
+                    pinned.append((key, raw))
+                    continue
+                del self.idx[key]
+                self.unindex(record)
+                self.evicted[key] = route
+                nexthops = tuple([(dict.get(x, 'oif'),
+                                   dict.get(x, 'gateway'))
+                                  for x in dict.get(route, 'multipath')
+                                  or ()])
+                self._compact_add(key, (raw,
+                                        dict.get(route, 'oif'),
+                                        dict.get(route, 'iif'),
+                                        dict.get(route, 'gateway'),
+                                        nexthops))
+            for (key, raw) in pinned:
+                self.cache[key] = raw
+
+    def unload(self):
+        '''
+        Drop all the compact records
+        '''
+        with self.clock:
+            for key in tuple(self.compact):
+                self._compact_del(key)
+            self.cache.clear()
+
+    def load(self, msg):
+        key = self.route_class.make_key(msg)
+        raw = self.pack(msg)
+        with self.clock:
+            if key not in self.idx:
+                route = self.evicted.pop(key, None)
+                if route is None:
+                    nexthops = tuple([(x['oif'], x.get_attr('RTA_GATEWAY'))
+                                      for x in
+                                      msg.get_attr('RTA_MULTIPATH') or ()])
+                    self._compact_add(key, (raw,
+                                            msg.get_attr('RTA_OIF'),
+                                            msg.get_attr('RTA_IIF'),
+                                            msg.get_attr('RTA_GATEWAY'),
+                                            nexthops))
+                    return key
+                # the evicted object is still in use, reload it
+                self._compact_del(key)
+                self.store(key, {'route': route,
+                                 'key': key})
+        self[key] = msg
+        with self.clock:
+            self.cache.pop(key, None)
+            self.cache[key] = raw
+            self.evict()
+        return key
+
+    def discard(self, msg):
+        '''
+        Remove the compact record on `RTM_DELROUTE`, return `True`
+        if the route was not loaded
+        '''
+        key = self.route_class.make_key(msg)
+        with self.clock:
+            if key in self.idx or key in self.evicted:
+                return False
+            return self._compact_del(key) is not None
+
+    def forget(self, field, value):
+        '''
+        Remove the compact records with `field == value`, also
+        in any multipath nexthop
+        '''
+        with self.clock:
+            for key in tuple(self.cdx[field].get(value, ())):
+                self._compact_del(key)
+
+    def suspect(self, network, prefixlen):
+        '''
+        Mark the compact records with the gateway, or any
+        multipath nexthop gateway, within the network to be
+        checked by `gc()`
+        '''
+        now = time.time()
+        with self.clock:
+            for gateway in self.compact_gateways.within(network, prefixlen):
+                for key in self.cdx['gateway'][gateway]:
+                    self.suspects[key] = now
+
+    def gc(self):
+        super(LazyRoutingTable, self).gc()
+        now = time.time()
+        with self.clock:
+            keys = [x for (x, y) in self.suspects.items()
+                    if now - y >= 2 and x in self.compact]
+            records = [self.compact[x] for x in keys]
+        if not keys:
+            return
+        # look the routes up with their oif and gateway, the route
+        # is alive, if the kernel reports exactly the same FIB entry
+        requests = []
+        for (key, (raw, oif, iif, gateway, nexthops)) in zip(keys, records):
+            if key.dst == 'default':
+                dst = '::' if key.family == AF_INET6 else '0.0.0.0'
+            else:
+                dst = key.dst.split('/')[0]
+            request = {'dst': dst,
+                       'family': key.family,
+                       'table': key.table,
+                       'flags': RTM_F_FIB_MATCH}
+            if oif is not None:
+                request['oif'] = oif
+            if gateway is not None:
+                request['gateway'] = gateway
+            requests.append(request)
+        result = self.ipdb.nl.route_lookup_many(requests,
+                                                fields=('dst',
+                                                        'dst_len',
+                                                        'table'))
+        alive = set()
+        unknown = []
+        for (key, ret) in zip(keys, result):
+            if isinstance(ret, dict):
+                if ret['dst'] is None:
+                    dst = 'default'
+                else:
+                    dst = '%s/%s' % (ret['dst'], ret['dst_len'])
+                if dst == key.dst:
+                    alive.add(key)
+                    continue
+            unknown.append(key)
+        # the lookup goes via the policy rules, so the routes can be
+        # hidden by other tables or more specific routes: check the
+        # rest with the dumps filtered by the table, by the kernel
+        # if it supports the strict check, and by the prefix
+        for (family, table, dst) in set([(x.family, x.table, x.dst)
+                                         for x in unknown]):
+            if dst == 'default':
+                spec = {'dst_len': 0}
+            else:
+                (prefix, dst_len) = dst.split('/')
+                # `dst` would make it `route get`
+                spec = {'RTA_DST': prefix, 'dst_len': int(dst_len)}
+            for msg in self.ipdb.nl.get_routes(family=family,
+                                               table=table,
+                                               **spec):
+                if dst != 'default' or msg.get_attr('RTA_DST') is None:
+                    alive.add(self.route_class.make_key(msg))
+        with self.clock:
+            for key in keys:
+                if key in alive:
+                    self.suspects.pop(key, None)
+                else:
+                    self._compact_del(key)
+
+    def keys(self, key='dst'):
+        ret = super(LazyRoutingTable, self).keys(key)
+        for (rkey, record) in tuple(self.compact.items()):
+            if key in self.compact_fields:
+                ret.append(self.summary(rkey, record)[key])
+            else:
+                record = self.materialise(rkey)
+                if record is not None:
+                    ret.append(record['route'][key])
+        return ret
+
+    def rekey(self, old_key, new_key, route):
+        with self.clock:
+            if new_key in self.compact:
+                raise CommitException('route idx conflict')
+            super(LazyRoutingTable, self).rekey(old_key, new_key, route)
+            self.cache.pop(old_key, None)
+
+    def candidates_compact(self, target):
+        '''
+        Return the keys of the compact records to check against
+        the dict target
+        '''
+        if target.get('ipdb_scope', 'system') != 'system':
+            return ()
+        with self.clock:
+            ret = None
+            for (field, index) in self.cdx.items():
+                if field not in target:
+                    continue
+                try:
+                    bucket = index.get(target[field], ())
+                except TypeError:
+                    continue
+                if ret is None or len(bucket) < len(ret):
+                    ret = bucket
+            if ret is None:
+                ret = self.compact
+            return tuple(ret)
+
+    def filter(self, target, oneshot=False):
+        if isinstance(target, types.FunctionType):
+            ret = list(super(LazyRoutingTable, self).filter(target))
+            for key in tuple(self.compact):
+                record = self.materialise(key)
+                if record is not None and target(record):
+                    ret.append(record)
+            return ret
+
+        if isinstance(target, basestring):
+            target = {'dst': target}
+
+        ret = super(LazyRoutingTable, self).filter(target, oneshot)
+        if ret and oneshot:
+            return ret
+
+        for key in self.candidates_compact(target):
+            record = self.compact.get(key)
+            if record is None:
+                continue
+            summary = self.summary(key, record)
+            complete = True
+            for (field, value) in target.items():
+                if field not in summary:
+                    complete = False
+                elif summary[field] != value:
+                    break
+            else:
+                if not complete:
+                    # check the other fields before loading the route
+                    route = self.decode(key)
+                    if route is None:
+                        continue
+                    for (field, value) in target.items():
+                        if (field not in route) or (value != route[field]):
+                            break
+                    else:
+                        complete = True
+                if not complete:
+                    continue
+                record = self.materialise(key)
+                if record is not None:
+                    ret.append(record)
+                    if oneshot:
+                        return ret
+        return ret
+
+    def describe(self, target, forward=False):
+        if isinstance(target, int):
+            keys = [x['key'] for x in self.__nogc__()]
+            keys.extend(tuple(self.compact))
+            target = keys[target]
+
+        key = None
+        if isinstance(target, (tuple, list)):
+            key = RouteKey(*target)
+        elif isinstance(target, nlmsg):
+            key = self.route_class.make_key(target)
+        if key is not None:
+            if key in self.idx:
+                self.touch(key)
+            else:
+                self.materialise(key)
+            return self.idx[key]
+
+        ret = super(LazyRoutingTable, self).describe(target, forward)
+        if ret['key'] is not None:
+            self.touch(ret['key'])
+        return ret
+
+    def __delitem__(self, key):
+        with self.lock:
+            item = self.describe(key, forward=False)
+            key = self.route_class.make_key(item['route'])
+            del self.idx[key]
+            self.unindex(item)
+        with self.clock:
+            self.cache.pop(key, None)
+
+
 class RoutingTableSet(object):
 
     def __init__(self, ipdb):
         self.ipdb = ipdb
         self._gctime = time.time()
         self.ignore_rtables = ipdb._ignore_rtables or []
-        self.tables = {254: RoutingTable(self.ipdb)}
+        self.lazy_rtables = ipdb._lazy_rtables or []
+        self.lazy_rtables_cache = ipdb._lazy_rtables_cache
+        self.tables = {254: self.make_table(254)}
         self._event_map = {'RTM_NEWROUTE': self.load_netlink,
                            'RTM_DELROUTE': self.load_netlink,
                            'RTM_DELLINK': self.gc_mark_link,
                            'RTM_DELADDR': self.gc_mark_addr}
 
+    def make_table(self, table):
+        '''
+        Create the routing table object, see `LazyRoutingTable`
+        '''
+        if table == 'mpls':
+            return MPLSTable(self.ipdb)
+        if self.lazy_rtables is True or table in self.lazy_rtables:
+            return LazyRoutingTable(self.ipdb,
+                                    size=self.lazy_rtables_cache)
+        return RoutingTable(self.ipdb)
+
     def _register(self):
         for msg in self.ipdb.nl.get_routes(family=AF_INET):
             self.load_netlink(msg)
@@ -1067,14 +1784,12 @@ class RoutingTableSet(object):
         multipath = spec.pop('multipath', [])
         if spec.get('family', 0) == AF_MPLS:
             table = 'mpls'
-            if table not in self.tables:
-                self.tables[table] = MPLSTable(self.ipdb)
             route = MPLSRoute(self.ipdb)
         else:
             table = spec.get('table', 254)
-            if table not in self.tables:
-                self.tables[table] = RoutingTable(self.ipdb)
             route = Route(self.ipdb)
+        if table not in self.tables:
+            self.tables[table] = self.make_table(table)
         route.update(spec)
         with route._direct_state:
             route['ipdb_scope'] = 'create'
@@ -1115,6 +1830,10 @@ class RoutingTableSet(object):
 
         # RTM_DELROUTE
         if msg['event'] == 'RTM_DELROUTE':
+            # the route is not loaded, drop the compact record
+            if isinstance(self.tables.get(table), LazyRoutingTable) and \
+                    self.tables[table].discard(msg):
+                return
             try:
                 # locate the record
                 record = self.tables[table][msg]
@@ -1130,10 +1849,7 @@ class RoutingTableSet(object):
 
         # RTM_NEWROUTE
         if table not in self.tables:
-            if table == 'mpls':
-                self.tables[table] = MPLSTable(self.ipdb)
-            else:
-                self.tables[table] = RoutingTable(self.ipdb)
+            self.tables[table] = self.make_table(table)
         self.tables[table].load(msg)
 
     def gc_mark_addr(self, msg):
@@ -1174,19 +1890,18 @@ class RoutingTableSet(object):
 
         if family == AF_INET:
             addr = msg.get_attr('IFA_LOCAL')
-            net = struct.unpack('>I', inet_pton(family, addr))[0] &\
-                (0xffffffff << (32 - msg['prefixlen']))
-
-            # now iterate all registered routes and mark those with
-            # gateway from that network
-            for record in self.filter({'family': family}):
-                gw = record['route'].get('gateway')
-                if gw:
-                    gwnet = struct.unpack('>I', inet_pton(family, gw))[0] & net
-                    if gwnet == net:
-                        with record['route']._direct_state:
-                            record['route']['ipdb_scope'] = 'gc'
-                            record['route']._gctime = time.time()
+
+            # now look up the routes with gateway from that network,
+            # see `PrefixTrie`, and mark them
+            for table in tuple(self.tables.values()):
+                if table is None:
+                    continue
+                if isinstance(table, LazyRoutingTable):
+                    table.suspect(addr, msg['prefixlen'])
+                for record in table.filter_gateway(addr, msg['prefixlen']):
+                    with record['route']._direct_state:
+                        record['route']['ipdb_scope'] = 'gc'
+                        record['route']._gctime = time.time()
 
         elif family == AF_INET6:
             # Unlike IPv4, IPv6 route updates are sent after addr
@@ -1203,6 +1918,13 @@ class RoutingTableSet(object):
         if msg['family'] != 0:
             return
 
+        # the kernel drops the routes via the link, so drop
+        # also the compact records, not to load them
+        for table in tuple(self.tables.values()):
+            if isinstance(table, LazyRoutingTable):
+                table.forget('oif', msg['index'])
+                table.forget('iif', msg['index'])
+
         for record in self.filter({'oif': msg['index']}):
             with record['route']._direct_state:
                 record['route']['ipdb_scope'] = 'gc'
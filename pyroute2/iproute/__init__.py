@@ -9,6 +9,7 @@ so several classes with almost the same API are available:
     * `IPRoute` -- simple RTNL API
     * `NetNS` -- RTNL API in a network namespace
     * `IPBatch` -- RTNL packet compiler
+    * `IPRoutePool` -- a pool of `IPRoute` sockets for threads
     * `ShellIPR` -- run RTNL in a (remote) shell
 
 Responses as lists
@@ -149,11 +150,21 @@ else:
     from pyroute2.iproute.linux import IPRoute
     from pyroute2.iproute.linux import RawIPRoute
 
+from pyroute2.iproute.pool import IPRoutePool
+
+try:
+    from pyroute2.iproute.aio import AsyncIPRoute
+except (ImportError, SyntaxError):
+    AsyncIPRoute = failed_class('AsyncIPRoute requires Python 3.5+ '
+                                'and Linux')
+
 classes = [RTNL_API,
            IPBatch,
            IPRoute,
            RawIPRoute,
-           RemoteIPRoute]
+           RemoteIPRoute,
+           AsyncIPRoute,
+           IPRoutePool]
 
 constants = [RTM_GETLINK,
              RTM_NEWLINK,
@@ -0,0 +1,282 @@
+'''
+AsyncIPRoute
+============
+
+`AsyncIPRoute` provides the `RTNL_API` over `AsyncNetlinkSocket`:
+all the API methods are coroutines, they take the same arguments
+and return the same results, but always as lists or tuples, not
+generators::
+
+    import asyncio
+    from pyroute2 import AsyncIPRoute
+
+    async def main():
+        ipr = AsyncIPRoute()
+        for link in await ipr.get_links():
+            print(link.get_attr('IFLA_IFNAME'))
+        await ipr.addr('add', index=1, address='10.0.0.1', mask=24)
+        ipr.close()
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+Broadcast messages are available with `async for` after
+`bind()`, see `pyroute2.netlink.aio`.
+
+The `RTNL_API` methods build the requests with the private
+`_<method>_request()` methods, see `RTNLRequest`, and the
+coroutines await `nlm_request()` for the same requests. The
+methods that run several requests, like `flush_routes()` or
+`reconcile()`, are implemented here with the same helpers as
+the sync ones, and `pipeline()` packs the requests with
+`nlm_request_batch()`, see `AsyncPipeline`.
+'''
+import asyncio
+from pyroute2.netlink import NLM_F_REQUEST
+from pyroute2.netlink import NLM_F_CREATE
+from pyroute2.netlink import NLM_F_EXCL
+from pyroute2.netlink import NLM_F_ACK
+from pyroute2.netlink import NLM_F_DUMP
+from pyroute2.netlink.rtnl import RTM_DELADDR
+from pyroute2.netlink.rtnl import RTM_DELROUTE
+from pyroute2.netlink.rtnl import RTM_DELRULE
+from pyroute2.netlink.rtnl import RTM_GETROUTE
+from pyroute2.netlink.exceptions import NetlinkError
+from pyroute2.netlink.aio import AsyncNetlinkSocket
+from pyroute2.netlink.nlsocket import compile_match
+from pyroute2.netlink.rtnl.iprsocket import IPRSocketMixin
+from pyroute2.iproute.linux import RTNL_API
+from pyroute2.iproute.linux import RTNLRequest
+
+
+class AsyncIPRSocket(IPRSocketMixin, AsyncNetlinkSocket):
+    '''
+    RTNL socket for asyncio
+    '''
+
+    def __init__(self, *argv, **kwarg):
+        loop = kwarg.pop('loop', None)
+        super(AsyncIPRSocket, self).__init__(*argv, **kwarg)
+        self.loop = loop
+
+
+class AsyncIPRoute(RTNL_API, AsyncIPRSocket):
+    '''
+    asyncio version of `IPRoute`, see the module description
+    '''
+
+    async def _request(self, request):
+        # the same as `RTNL_API._request()`, but awaits the response
+        if not isinstance(request, RTNLRequest):
+            return request
+        try:
+            ret = await self.nlm_request(request.msg,
+                                         msg_type=request.msg_type,
+                                         msg_flags=request.msg_flags,
+                                         **request.kwarg)
+        except NetlinkError as e:
+            ret = request.failed(e)
+        else:
+            ret = request.result(ret)
+        if hasattr(ret, '__next__'):
+            ret = tuple(ret)
+        return ret
+
+    async def get_links(self, *argv, **kwarg):
+        links = argv or [0]
+        if links[0] == 'all':  # compat syntax
+            links = [0]
+        cmd = 'dump' if links[0] == 0 else 'get'
+        result = []
+        for index in links:
+            kwarg['index'] = index
+            result.extend(await self.link(cmd, **kwarg))
+        return result
+
+    async def link_lookup(self, **kwarg):
+        name = tuple(kwarg.keys())[0]
+        return self._link_lookup_result(name, kwarg[name],
+                                        await self.get_links())
+
+    async def _flush(self, objects, msg_type, msg_flags):
+        objects = list(objects)
+        ret = await self.nlm_request_batch(objects, msg_type,
+                                           msg_flags | NLM_F_ACK,
+                                           copy=self._flush_copy(objects))
+        return self._flush_result(objects, ret)
+
+    async def flush_routes(self, *argv, **kwarg):
+        return await self._flush(await self.get_routes(*argv, **kwarg),
+                                 RTM_DELROUTE, NLM_F_REQUEST)
+
+    async def flush_addr(self, *argv, **kwarg):
+        flags = NLM_F_CREATE | NLM_F_EXCL | NLM_F_REQUEST
+        return await self._flush(await self.get_addr(*argv, **kwarg),
+                                 RTM_DELADDR, flags)
+
+    async def flush_rules(self, *argv, **kwarg):
+        flags = NLM_F_CREATE | NLM_F_EXCL | NLM_F_REQUEST
+        return await self._flush(await self.get_rules(*argv, **kwarg),
+                                 RTM_DELRULE, flags)
+
+    async def route_lookup_many(self, dsts,
+                                fields=('oif', 'gateway', 'prefsrc', 'table'),
+                                window=256,
+                                **kwarg):
+        (msgs, tables) = self._route_lookup_msgs(dsts, kwarg)
+        ret = await self.nlm_request_batch(msgs, RTM_GETROUTE,
+                                           NLM_F_REQUEST,
+                                           window=window)
+        return self._route_lookup_result(fields, tables, ret)
+
+    async def reconcile(self, kind, desired, scope=None, dry_run=False):
+        from pyroute2.iproute.reconcile import Reconciler
+        from pyroute2.iproute.reconcile import flags_replace
+        reconciler = Reconciler(self, kind)
+        wanted = reconciler.prepare(desired)
+        current = await getattr(self, reconciler.dump)(
+            **reconciler.dump_scope(scope))
+        (report, delete, requests) = reconciler.diff(wanted, current)
+        if dry_run:
+            return report
+        if delete:
+            reconciler.deleted(report,
+                               await self._flush(delete,
+                                                 reconciler.msg_del,
+                                                 reconciler.flags_del))
+        if requests:
+            reconciler.sent(report, requests,
+                            await self.nlm_request_batch(
+                                [x[2] for x in requests],
+                                reconciler.msg_new,
+                                flags_replace,
+                                copy=True))
+        return report
+
+    def pipeline(self, window=64):
+        '''
+        Return the pipeline, see `AsyncPipeline`
+        '''
+        return AsyncPipeline(self, window)
+
+
+class AsyncPipeline(object):
+    '''
+    Pipelined requests for `AsyncIPRoute`: the API calls only
+    build the requests and return the operation numbers, and
+    `wait()` sends them with `nlm_request_batch()`, up to `window`
+    requests in flight. The results are the same as of
+    `RTNL_API.pipeline()`::
+
+        async with ipr.pipeline(window=256) as p:
+            for dst in networks:
+                p.route('add', dst=dst, gateway='10.0.0.1')
+
+        for (dst, ret) in zip(networks, p.results):
+            if isinstance(ret, NetlinkError):
+                print(dst, ret)
+
+    The consecutive requests of the same type are packed together;
+    the dumps and the requests with a callback are sent one by one,
+    in the same order. Only the API calls that build one request,
+    like `link()` or `route()`, are available.
+    '''
+
+    def __init__(self, sock, window=64):
+        self.sock = sock
+        self.window = max(1, window)
+        self.requests = []
+        self.results = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.wait()
+
+    def __getattr__(self, attr):
+        if attr.startswith('_') or \
+                not hasattr(RTNL_API, '_%s_request' % attr):
+            raise AttributeError(attr)
+        build = getattr(RTNL_API, '_%s_request' % attr)
+
+        def call(*argv, **kwarg):
+            self.requests.append(build(self.sock, *argv, **kwarg))
+            return len(self.results) + len(self.requests) - 1
+
+        return call
+
+    @staticmethod
+    def batched(request):
+        # NLM_F_DUMP shares bits with NLM_F_EXCL and NLM_F_REPLACE
+        return isinstance(request, RTNLRequest) and \
+            (request.msg_flags & NLM_F_DUMP) != NLM_F_DUMP and \
+            request.kwarg.get('callback') is None
+
+    async def send(self, requests):
+        match = [x.kwarg.get('match') for x in requests]
+        ret = await self.sock.nlm_request_batch([x.msg for x in requests],
+                                                requests[0].msg_type,
+                                                requests[0].msg_flags |
+                                                NLM_F_ACK,
+                                                window=self.window)
+        for (request, match, response) in zip(requests, match, ret):
+            try:
+                if isinstance(response, NetlinkError):
+                    response = request.failed(response)
+                else:
+                    if match is not None:
+                        match = compile_match(match)
+                        response = tuple(x for x in response if match(x))
+                    response = request.result(response)
+            except NetlinkError as e:
+                response = e
+            self.results.append(response)
+
+    async def wait(self):
+        '''
+        Send the requests, return `results`
+        '''
+        (requests, self.requests) = (self.requests, [])
+        idx = 0
+        while idx < len(requests):
+            request = requests[idx]
+            if not self.batched(request):
+                try:
+                    self.results.append(await self.sock._request(request))
+                except NetlinkError as e:
+                    self.results.append(e)
+                idx += 1
+                continue
+            # the same type requests, to pack them together
+            end = idx + 1
+            while end < len(requests) and \
+                    self.batched(requests[end]) and \
+                    requests[end].msg_type == request.msg_type and \
+                    requests[end].msg_flags == request.msg_flags:
+                end += 1
+            await self.send(requests[idx:end])
+            idx = end
+        return self.results
+
+
+def api_coroutine(name):
+    method = getattr(RTNL_API, name)
+    build = getattr(RTNL_API, '_%s_request' % name)
+
+    async def call(self, *argv, **kwarg):
+        return await self._request(build(self, *argv, **kwarg))
+
+    call.__name__ = name
+    call.__doc__ = method.__doc__
+    return call
+
+
+for name in dir(RTNL_API):
+    if not name.startswith('_') and \
+            hasattr(RTNL_API, '_%s_request' % name):
+        setattr(AsyncIPRoute, name, api_coroutine(name))
+    elif name in vars(AsyncIPRoute) and \
+            asyncio.iscoroutinefunction(getattr(AsyncIPRoute, name)):
+        getattr(AsyncIPRoute, name).__doc__ = getattr(RTNL_API, name).__doc__
+
+del name
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import types
+import errno
 import logging
+from collections import deque
 from socket import AF_INET
 from socket import AF_INET6
 from socket import AF_UNSPEC
@@ -46,6 +48,7 @@ from pyroute2.netlink.rtnl import TC_H_ROOT
 from pyroute2.netlink.rtnl import rt_type
 from pyroute2.netlink.rtnl import rt_scope
 from pyroute2.netlink.rtnl import rt_proto
+from pyroute2.iproute.resolver import LinkResolver
 from pyroute2.netlink.rtnl.req import IPLinkRequest
 from pyroute2.netlink.rtnl.req import IPBridgeRequest
 from pyroute2.netlink.rtnl.req import IPBrPortRequest
@@ -54,6 +57,7 @@ from pyroute2.netlink.rtnl.req import IPRuleRequest
 from pyroute2.netlink.rtnl.tcmsg import plugins as tc_plugins
 from pyroute2.netlink.rtnl.tcmsg import tcmsg
 from pyroute2.netlink.rtnl.rtmsg import rtmsg
+from pyroute2.netlink.rtnl.rtmsg import RTM_F_LOOKUP_TABLE
 from pyroute2.netlink.rtnl import ndmsg
 from pyroute2.netlink.rtnl.ndtmsg import ndtmsg
 from pyroute2.netlink.rtnl.fibmsg import fibmsg
@@ -62,6 +66,8 @@ from pyroute2.netlink.rtnl.ifaddrmsg import ifaddrmsg
 from pyroute2.netlink.rtnl.iprsocket import IPRSocket
 from pyroute2.netlink.rtnl.iprsocket import IPBatchSocket
 from pyroute2.netlink.rtnl.riprsocket import RawIPRSocket
+from pyroute2.netlink.exceptions import NetlinkError
+from pyroute2.netlink.nlsocket import compile_match
 
 from pyroute2.common import AF_MPLS
 from pyroute2.common import basestring
@@ -78,6 +84,71 @@ def transform_handle(handle):
     return handle
 
 
+class RTNLRequest(object):
+    '''
+    The request built by an `RTNL_API` method: the arguments for
+    `nlm_request()` and the function that makes the method result
+    from the response. The sync methods run it with `_request()`,
+    `AsyncIPRoute` awaits `nlm_request()` and then calls `result()`
+    or `failed()` in the same way.
+
+    The errors with the codes in `ignore` end the response, as
+    ENODEV for the filtered dumps, see `_dump_filtered()`.
+    '''
+
+    def __init__(self, msg, msg_type, msg_flags,
+                 post=None, ignore=(), **kwarg):
+        self.msg = msg
+        self.msg_type = msg_type
+        self.msg_flags = msg_flags
+        self.post = post
+        self.ignore = ignore
+        self.kwarg = kwarg
+
+    def then(self, post):
+        '''
+        Add the function to process the result
+        '''
+        prev = self.post
+        if post is None:
+            pass
+        elif prev is None:
+            self.post = post
+        else:
+            self.post = lambda ret: post(prev(ret))
+        return self
+
+    def skip(self, ret):
+        try:
+            for msg in ret:
+                yield msg
+        except NetlinkError as e:
+            if e.code not in self.ignore:
+                raise
+
+    def result(self, ret):
+        if self.ignore and not isinstance(ret, (tuple, list)):
+            ret = self.skip(ret)
+            if not config.nlm_generator:
+                ret = tuple(ret)
+        if self.post is not None:
+            ret = self.post(ret)
+        return ret
+
+    def failed(self, error):
+        if isinstance(error, NetlinkError) and error.code in self.ignore:
+            return self.result(())
+        raise error
+
+
+def dump_result(dump):
+    # the tuple, or the generator for the dumps with
+    # `config.nlm_generator`
+    if dump and config.nlm_generator:
+        return None
+    return tuple
+
+
 class RTNL_API(object):
     '''
     `RTNL_API` should not be instantiated by itself. It is intended
@@ -128,27 +199,57 @@ class RTNL_API(object):
 
     def _match(self, match, msgs):
         # filtered results, the generator version
+        match = compile_match(match)
         for msg in msgs:
-            if hasattr(match, '__call__'):
-                if match(msg):
-                    yield msg
-            elif isinstance(match, dict):
-                matches = []
-                for key in match:
-                    KEY = msg.name2nla(key)
-                    if isinstance(match[key], types.FunctionType):
-                        if msg.get(key) is not None:
-                            matches.append(match[key](msg.get(key)))
-                        elif msg.get_attr(KEY) is not None:
-                            matches.append(match[key](msg.get_attr(KEY)))
-                        else:
-                            matches.append(False)
-                    else:
-                        matches.append(msg.get(key) == match[key] or
-                                       msg.get_attr(KEY) ==
-                                       match[key])
-                if all(matches):
-                    yield msg
+            if match(msg):
+                yield msg
+
+    def _request(self, request):
+        # run the request built by an API method, see `RTNLRequest`;
+        # the methods that need no request return the result as is
+        if not isinstance(request, RTNLRequest):
+            return request
+        try:
+            ret = self.nlm_request(request.msg,
+                                   msg_type=request.msg_type,
+                                   msg_flags=request.msg_flags,
+                                   **request.kwarg)
+        except NetlinkError as e:
+            return request.failed(e)
+        return request.result(ret)
+
+    def _dump_filtered(self, msg, msg_type, match, filters):
+        '''
+        The dump request with the kernel side filtering,
+        NETLINK_GET_STRICT_CHK.
+
+        `filters` maps `match` keys to NLA names, or to `None` for
+        the header fields. Only integer values are passed to the
+        kernel, the rest is left as is. The result is filtered
+        with `match` anyways, so the kernel filters only reduce
+        the amount of data to receive and to parse.
+
+        Unknown interfaces in the filter cause ENODEV, so return
+        an empty result in that case, as the Python filter would.
+        '''
+        for key, nla in filters.items():
+            value = match.get(key)
+            if not isinstance(value, int) or isinstance(value, bool):
+                continue
+            if nla is None:
+                msg[key] = value
+            else:
+                msg['attrs'].append([nla, value])
+
+        return RTNLRequest(msg, msg_type, NLM_F_REQUEST | NLM_F_DUMP,
+                           ignore=(errno.ENODEV, ),
+                           strict=True,
+                           match=match)
+
+    def _use_strict(self, match, kwarg):
+        return match is None and \
+            bool(kwarg) and \
+            getattr(self, 'capabilities', {}).get('strict_check', False)
 
     # 8<---------------------------------------------------------------
     #
@@ -159,38 +260,51 @@ class RTNL_API(object):
         Get all queue disciplines for all interfaces or for specified
         one.
         '''
+        return self._request(self._get_qdiscs_request(index))
+
+    def _get_qdiscs_request(self, index=None):
         msg = tcmsg()
         msg['family'] = AF_UNSPEC
-        ret = self.nlm_request(msg, RTM_GETQDISC)
-        if index is None:
-            return ret
-        else:
-            return [x for x in ret if x['index'] == index]
+        ret = RTNLRequest(msg, RTM_GETQDISC, NLM_F_REQUEST | NLM_F_DUMP)
+        if index is not None:
+            ret.then(lambda x: [y for y in x if y['index'] == index])
+        return ret
 
     def get_filters(self, index=0, handle=0, parent=0):
         '''
         Get filters for specified interface, handle and parent.
         '''
+        return self._request(self._get_filters_request(index,
+                                                       handle,
+                                                       parent))
+
+    def _get_filters_request(self, index=0, handle=0, parent=0):
         msg = tcmsg()
         msg['family'] = AF_UNSPEC
         msg['index'] = index
         msg['handle'] = handle
         msg['parent'] = parent
-        return self.nlm_request(msg, RTM_GETTFILTER)
+        return RTNLRequest(msg, RTM_GETTFILTER, NLM_F_REQUEST | NLM_F_DUMP)
 
     def get_classes(self, index=0):
         '''
         Get classes for specified interface.
         '''
+        return self._request(self._get_classes_request(index))
+
+    def _get_classes_request(self, index=0):
         msg = tcmsg()
         msg['family'] = AF_UNSPEC
         msg['index'] = index
-        return self.nlm_request(msg, RTM_GETTCLASS)
+        return RTNLRequest(msg, RTM_GETTCLASS, NLM_F_REQUEST | NLM_F_DUMP)
 
     def get_vlans(self, **kwarg):
         '''
         Dump available vlan info on bridge ports
         '''
+        return self._request(self._get_vlans_request(**kwarg))
+
+    def _get_vlans_request(self, **kwarg):
         # IFLA_EXT_MASK, extended info mask
         #
         # include/uapi/linux/rtnetlink.h
@@ -202,10 +316,10 @@ class RTNL_API(object):
         # maybe place it as mapping into ifinfomsg.py?
         #
         match = kwarg.get('match', None) or kwarg or None
-        return self.link('dump',
-                         family=AF_BRIDGE,
-                         ext_mask=2,
-                         match=match)
+        return self._link_request('dump',
+                                  family=AF_BRIDGE,
+                                  ext_mask=2,
+                                  match=match)
 
     def get_links(self, *argv, **kwarg):
         '''
@@ -262,16 +376,35 @@ class RTNL_API(object):
 
             # and filter them by a function:
             ip.get_neighbours(AF_BRIDGE, match=lambda x: x['state'] == 2)
+
+        If the kernel supports strict checking, the `ifindex`
+        and `master` filters are applied by the kernel.
         '''
-        return self.neigh('dump', family=family, match=match or kwarg)
+        return self._request(self._get_neighbours_request(family,
+                                                          match,
+                                                          **kwarg))
+
+    def _get_neighbours_request(self, family=AF_UNSPEC, match=None,
+                                **kwarg):
+        if self._use_strict(match, kwarg):
+            msg = ndmsg.ndmsg()
+            msg['family'] = family or AF_INET
+            return self._dump_filtered(msg, RTM_GETNEIGH, kwarg,
+                                       {'ifindex': 'NDA_IFINDEX',
+                                        'master': 'NDA_MASTER'})
+        return self._neigh_request('dump', family=family,
+                                   match=match or kwarg)
 
     def get_ntables(self, family=AF_UNSPEC):
         '''
         Get neighbour tables
         '''
+        return self._request(self._get_ntables_request(family))
+
+    def _get_ntables_request(self, family=AF_UNSPEC):
         msg = ndtmsg()
         msg['family'] = family
-        return self.nlm_request(msg, RTM_GETNEIGHTBL)
+        return RTNLRequest(msg, RTM_GETNEIGHTBL, NLM_F_REQUEST | NLM_F_DUMP)
 
     def get_addr(self, family=AF_UNSPEC, match=None, **kwarg):
         '''
@@ -299,8 +432,21 @@ class RTNL_API(object):
         A custom predicate can be used as a filter::
 
             ip.get_addr(match=lambda x: x['index'] == 1)
+
+        If the kernel supports strict checking, the `index`
+        filter is applied by the kernel.
         '''
-        return self.addr('dump', family=family, match=match or kwarg)
+        return self._request(self._get_addr_request(family, match,
+                                                    **kwarg))
+
+    def _get_addr_request(self, family=AF_UNSPEC, match=None, **kwarg):
+        if self._use_strict(match, kwarg):
+            msg = ifaddrmsg()
+            msg['family'] = family
+            return self._dump_filtered(msg, RTM_GETADDR, kwarg,
+                                       {'index': None})
+        return self._addr_request('dump', family=family,
+                                  match=match or kwarg)
 
     def get_rules(self, family=AF_UNSPEC, match=None, **kwarg):
         '''
@@ -311,10 +457,15 @@ class RTNL_API(object):
             ip.get_rules() # get all the rules for all families
             ip.get_rules(family=AF_INET6)  # get only IPv6 rules
         '''
-        return self.rule((RTM_GETRULE,
-                          NLM_F_REQUEST | NLM_F_ROOT | NLM_F_ATOMIC),
-                         family=family,
-                         match=match or kwarg)
+        return self._request(self._get_rules_request(family, match,
+                                                     **kwarg))
+
+    def _get_rules_request(self, family=AF_UNSPEC, match=None, **kwarg):
+        return self._rule_request((RTM_GETRULE,
+                                   NLM_F_REQUEST | NLM_F_ROOT |
+                                   NLM_F_ATOMIC),
+                                  family=family,
+                                  match=match or kwarg)
 
     def get_routes(self, family=255, match=None, **kwarg):
         '''
@@ -334,14 +485,29 @@ class RTNL_API(object):
         But it returns all the routes for all the families if one
         uses an invalid value here. Hack but true. And let's hope
         the kernel team will not fix this bug.
+
+        If the kernel supports strict checking, the `table`,
+        `oif`, `proto` and `type` filters are applied by the kernel.
         '''
+        return self._request(self._get_routes_request(family, match,
+                                                      **kwarg))
+
+    def _get_routes_request(self, family=255, match=None, **kwarg):
         # get a particular route?
         if isinstance(kwarg.get('dst'), basestring):
-            return self.route('get', dst=kwarg['dst'])
+            return self._route_request('get', dst=kwarg['dst'])
+        elif self._use_strict(match, kwarg):
+            msg = rtmsg()
+            msg['family'] = family
+            return self._dump_filtered(msg, RTM_GETROUTE, kwarg,
+                                       {'table': 'RTA_TABLE',
+                                        'oif': 'RTA_OIF',
+                                        'proto': None,
+                                        'type': None})
         else:
-            return self.route('dump',
-                              family=family,
-                              match=match or kwarg)
+            return self._route_request('dump',
+                                       family=family,
+                                       match=match or kwarg)
     # 8<---------------------------------------------------------------
 
     # 8<---------------------------------------------------------------
@@ -352,10 +518,25 @@ class RTNL_API(object):
         '''
         Get default routes
         '''
+        return self._request(self._get_default_routes_request(family,
+                                                              table))
+
+    def _get_default_routes_request(self, family=AF_UNSPEC,
+                                    table=DEFAULT_TABLE):
         # according to iproute2/ip/iproute.c:print_route()
-        return [x for x in self.get_routes(family, table=table)
-                if (x.get_attr('RTA_DST', None) is None and
-                    x['dst_len'] == 0)]
+        return (self
+                ._get_routes_request(family, table=table)
+                .then(lambda ret: [x for x in ret
+                                   if (x.get_attr('RTA_DST', None) is None
+                                       and x['dst_len'] == 0)]))
+
+    def get_resolver(self):
+        '''
+        Return the `LinkResolver` object, that caches the
+        interface names and indices, or `None`; see
+        `pyroute2.iproute.resolver`
+        '''
+        return None
 
     def link_lookup(self, **kwarg):
         '''
@@ -370,39 +551,94 @@ class RTNL_API(object):
 
         Please note, that link_lookup() returns list, not one
         value.
+
+        The `index`, `ifname`, `address`, `master` and `kind`
+        lookups use the resolver cache, if any, see
+        `get_resolver()`; other ones dump all the links.
         '''
         name = tuple(kwarg.keys())[0]
         value = kwarg[name]
 
+        resolver = self.get_resolver()
+        field = str(name).lower()
+        if field.startswith('ifla_'):
+            field = field[5:]
+        if resolver is not None and field in resolver.fields:
+            return resolver.lookup(field, value)
+
+        return self._link_lookup_result(name, value, self.get_links())
+
+    def _link_lookup_result(self, name, value, links):
         name = str(name).upper()
         if not name.startswith('IFLA_'):
             name = 'IFLA_%s' % (name)
 
+        # the same semantics as the resolver has: `index` is the
+        # header field, and `kind` is nested into IFLA_LINKINFO
+        if name == 'IFLA_INDEX':
+            return [k['index'] for k in links if k['index'] == value]
+        if name == 'IFLA_KIND':
+            return [k['index'] for k in links if
+                    k.get_nested('IFLA_LINKINFO',
+                                 'IFLA_INFO_KIND') == value]
+
         return [k['index'] for k in
-                [i for i in self.get_links() if 'attrs' in i] if
+                [i for i in links if 'attrs' in i] if
                 [l for l in k['attrs'] if l[0] == name and l[1] == value]]
+
     # 8<---------------------------------------------------------------
 
     # 8<---------------------------------------------------------------
     #
     # Shortcuts to flush RTNL objects
     #
+    def _flush(self, objects, msg_type, msg_flags):
+        # Send the dump results back as the delete requests,
+        # packed into big datagrams; the messages decoded
+        # from the raw data are copied w/o encoding, as
+        # iproute2 does.
+        #
+        # Set the error in the header of every object that
+        # failed to be deleted.
+        objects = list(objects)
+        ret = self.nlm_request_batch(objects, msg_type,
+                                     msg_flags | NLM_F_ACK,
+                                     copy=self._flush_copy(objects))
+        return self._flush_result(objects, ret)
+
+    def _flush_copy(self, objects):
+        return all([x.length and len(x.data) >= x.offset + x.length
+                    for x in objects])
+
+    def _flush_result(self, objects, ret):
+        for (obj, result) in zip(objects, ret):
+            if isinstance(result, Exception):
+                obj['header']['error'] = result
+        return objects
+
     def flush_routes(self, *argv, **kwarg):
         '''
         Flush routes -- purge route records from a table.
         Arguments are the same as for `get_routes()`
         routine. Actually, this routine implements a pipe from
-        `get_routes()` to `nlm_request()`.
+        `get_routes()` to `nlm_request_batch()`: the delete
+        requests are packed into big datagrams and acked.
+
+        Return the list of the routes; if a route could not be
+        deleted, `route['header']['error']` is the error::
+
+            for route in ipr.flush_routes(table=100):
+                if route['header']['error']:
+                    print(route.get_attr('RTA_DST'),
+                          route['header']['error'])
         '''
-        ret = []
-        for route in self.get_routes(*argv, **kwarg):
-            self.put(route, msg_type=RTM_DELROUTE, msg_flags=NLM_F_REQUEST)
-            ret.append(route)
-        return ret
+        return self._flush(self.get_routes(*argv, **kwarg),
+                           RTM_DELROUTE, NLM_F_REQUEST)
 
     def flush_addr(self, *argv, **kwarg):
         '''
-        Flush IP addresses.
+        Flush IP addresses. Return the list of the addresses, the
+        errors are reported as in `flush_routes()`.
 
         Examples::
 
@@ -413,17 +649,16 @@ class RTNL_API(object):
             ipr.flush_addr(label='eth0')
         '''
         flags = NLM_F_CREATE | NLM_F_EXCL | NLM_F_REQUEST
-        ret = []
-        for addr in self.get_addr(*argv, **kwarg):
-            self.put(addr, msg_type=RTM_DELADDR, msg_flags=flags)
-            ret.append(addr)
-        return ret
+        return self._flush(self.get_addr(*argv, **kwarg),
+                           RTM_DELADDR, flags)
 
     def flush_rules(self, *argv, **kwarg):
         '''
         Flush rules. Please keep in mind, that by default the function
         operates on **all** rules of **all** families. To work only on
         IPv4 rules, one should explicitly specify `family=AF_INET`.
+        Return the list of the rules, the errors are reported as in
+        `flush_routes()`.
 
         Examples::
 
@@ -434,11 +669,63 @@ class RTNL_API(object):
             ipr.flush_rules(family=socket.AF_INET6, table=250)
         '''
         flags = NLM_F_CREATE | NLM_F_EXCL | NLM_F_REQUEST
-        ret = []
-        for rule in self.get_rules(*argv, **kwarg):
-            self.put(rule, msg_type=RTM_DELRULE, msg_flags=flags)
-            ret.append(rule)
-        return ret
+        return self._flush(self.get_rules(*argv, **kwarg),
+                           RTM_DELRULE, flags)
+    # 8<---------------------------------------------------------------
+
+    # 8<---------------------------------------------------------------
+    #
+    # State reconciliation
+    #
+    def reconcile(self, kind, desired, scope=None, dry_run=False):
+        '''
+        Converge the objects in the scope to the desired state:
+        add the missing ones, replace the changed ones and delete
+        the rest, with batched requests. Return the report::
+
+            report = ipr.reconcile('routes',
+                                   [{'dst': '10.0.0.0/24',
+                                     'gateway': '192.168.0.1',
+                                     'table': 100}],
+                                   scope={'table': 100})
+            # {'add': [...], 'replace': [...], 'delete': [...],
+            #  'keep': 0, 'errors': []}
+
+        The kind is `routes`, `addresses`, `neighbours` or `fdb`,
+        the desired objects are the keyword arguments for the
+        `route()`, `addr()`, `neigh()` or `fdb()` calls, and the
+        scope is the filter for the dump. See
+        `pyroute2.iproute.reconcile` for details.
+        '''
+        from pyroute2.iproute.reconcile import Reconciler
+        return Reconciler(self, kind).run(desired, scope, dry_run)
+
+    # 8<---------------------------------------------------------------
+    #
+    # Pipelined requests
+    #
+    def pipeline(self, window=64):
+        '''
+        Return a pipeline: the same RTNL API, but every call
+        only sends the request and returns the operation number,
+        while the responses are collected later, so there may be
+        up to `window` requests in flight. The results, the
+        response messages or `NetlinkError` for every operation,
+        are available in `results` when the pipeline is done::
+
+            with ipr.pipeline(window=256) as p:
+                for dst in networks:
+                    p.route('add', dst=dst, gateway='10.0.0.1')
+
+            for (dst, ret) in zip(networks, p.results):
+                if isinstance(ret, NetlinkError):
+                    print(dst, ret)
+
+        All the requests are sent with `NLM_F_ACK`. The dumps,
+        like `get_links()`, are not pipelined: such calls wait
+        for the response and return it as usual.
+        '''
+        return Pipeline(self, window)
     # 8<---------------------------------------------------------------
 
     # 8<---------------------------------------------------------------
@@ -456,6 +743,9 @@ class RTNL_API(object):
         Possible keywords are NLA names for the `protinfo_bridge` class,
         without the prefix and in lower letters.
         '''
+        return self._request(self._brport_request(command, **kwarg))
+
+    def _brport_request(self, command, **kwarg):
         if (command in ('dump', 'show')) and ('match' not in kwarg):
             match = kwarg
         else:
@@ -476,16 +766,9 @@ class RTNL_API(object):
         msg['family'] = AF_BRIDGE
         protinfo = IPBrPortRequest(kwarg)
         msg['attrs'].append(('IFLA_PROTINFO', protinfo, 0x8000))
-        ret = self.nlm_request(msg,
-                               msg_type=command,
-                               msg_flags=msg_flags)
-        if match is not None:
-            ret = self._match(match, ret)
-
-        if not (command == RTM_GETLINK and config.nlm_generator):
-            ret = tuple(ret)
-
-        return ret
+        return RTNLRequest(msg, command, msg_flags,
+                           post=dump_result(command == RTM_GETLINK),
+                           match=match)
 
     def vlan_filter(self, command, **kwarg):
         '''
@@ -614,6 +897,9 @@ class RTNL_API(object):
             ip.vlan_filter("del", index=2, vlan_info={"vid": 200})
 
         '''
+        return self._request(self._vlan_filter_request(command, **kwarg))
+
+    def _vlan_filter_request(self, command, **kwarg):
         flags_req = NLM_F_REQUEST | NLM_F_ACK
         commands = {'add': (RTM_SETLINK, flags_req),
                     'del': (RTM_DELLINK, flags_req)}
@@ -622,7 +908,7 @@ class RTNL_API(object):
         kwarg['kwarg_filter'] = IPBridgeRequest
 
         (command, flags) = commands.get(command, command)
-        return tuple(self.link((command, flags), **kwarg))
+        return self._link_request((command, flags), **kwarg).then(tuple)
 
     def fdb(self, command, **kwarg):
         '''
@@ -693,6 +979,9 @@ class RTNL_API(object):
             ip.fdb('dump', vlan=200)
 
         '''
+        return self._request(self._fdb_request(command, **kwarg))
+
+    def _fdb_request(self, command, **kwarg):
         kwarg['family'] = AF_BRIDGE
         # nud -> state
         if 'nud' in kwarg:
@@ -711,7 +1000,7 @@ class RTNL_API(object):
                 # self (default) or master
                 kwarg['flags'] = kwarg.get('flags', 0) | ndmsg.flags['self']
         #
-        return self.neigh(command, **kwarg)
+        return self._neigh_request(command, **kwarg)
 
     # 8<---------------------------------------------------------------
     #
@@ -762,6 +1051,9 @@ class RTNL_API(object):
 
             ip.neigh('dump')
         '''
+        return self._request(self._neigh_request(command, **kwarg))
+
+    def _neigh_request(self, command, **kwarg):
         if (command == 'dump') and ('match' not in kwarg):
             match = kwarg
         else:
@@ -801,16 +1093,9 @@ class RTNL_API(object):
             if kwarg[key] is not None:
                 msg['attrs'].append([nla, kwarg[key]])
 
-        ret = self.nlm_request(msg,
-                               msg_type=command,
-                               msg_flags=flags)
-        if match is not None:
-            ret = self._match(match, ret)
-
-        if not (command == RTM_GETNEIGH and config.nlm_generator):
-            ret = tuple(ret)
-
-        return ret
+        return RTNLRequest(msg, command, flags,
+                           post=dump_result(command == RTM_GETNEIGH),
+                           match=match)
 
     def link(self, command, **kwarg):
         '''
@@ -1050,6 +1335,9 @@ class RTNL_API(object):
 
             ip.link("get", index=ip.link_lookup(ifname="br0")[0])
         '''
+        return self._request(self._link_request(command, **kwarg))
+
+    def _link_request(self, command, **kwarg):
         if (command == 'dump') and ('match' not in kwarg):
             match = kwarg
         else:
@@ -1058,7 +1346,7 @@ class RTNL_API(object):
         if command[:4] == 'vlan':
             log.warning('vlan filters are managed via `vlan_filter()`')
             log.warning('this compatibility hack will be removed soon')
-            return self.vlan_filter(command[5:], **kwarg)
+            return self._vlan_filter_request(command[5:], **kwarg)
 
         flags_dump = NLM_F_REQUEST | NLM_F_DUMP
         flags_req = NLM_F_REQUEST | NLM_F_ACK
@@ -1110,16 +1398,9 @@ class RTNL_API(object):
             if kwarg[key] is not None:
                 msg['attrs'].append([nla, kwarg[key]])
 
-        ret = self.nlm_request(msg,
-                               msg_type=command,
-                               msg_flags=msg_flags)
-        if match is not None:
-            ret = self._match(match, ret)
-
-        if not (command == RTM_GETLINK and config.nlm_generator):
-            ret = tuple(ret)
-
-        return ret
+        return RTNLRequest(msg, command, msg_flags,
+                           post=dump_result(command == RTM_GETLINK),
+                           match=match)
 
     def addr(self, command, index=None, address=None, mask=None,
              family=None, scope=None, match=None, **kwarg):
@@ -1170,6 +1451,12 @@ class RTNL_API(object):
                     mask=24,
                     local='10.1.1.1')
         '''
+        return self._request(self._addr_request(command, index, address,
+                                                mask, family, scope,
+                                                match, **kwarg))
+
+    def _addr_request(self, command, index=None, address=None, mask=None,
+                      family=None, scope=None, match=None, **kwarg):
         flags_dump = NLM_F_REQUEST | NLM_F_DUMP
         flags_create = NLM_F_REQUEST | NLM_F_ACK | NLM_F_CREATE | NLM_F_EXCL
         commands = {'add': (RTM_NEWADDR, flags_create),
@@ -1222,18 +1509,11 @@ class RTNL_API(object):
             if kwarg[key] is not None:
                 msg['attrs'].append([nla, kwarg[key]])
 
-        ret = self.nlm_request(msg,
-                               msg_type=command,
-                               msg_flags=flags,
-                               terminate=lambda x: x['header']['type'] ==
-                               NLMSG_ERROR)
-        if match:
-            ret = self._match(match, ret)
-
-        if not (command == RTM_GETADDR and config.nlm_generator):
-            ret = tuple(ret)
-
-        return ret
+        return RTNLRequest(msg, command, flags,
+                           post=dump_result(command == RTM_GETADDR),
+                           terminate=lambda x: x['header']['type'] ==
+                           NLMSG_ERROR,
+                           match=match or None)
 
     def tc(self, command, kind=None, index=0, handle=0, **kwarg):
         '''
@@ -1296,6 +1576,10 @@ class RTNL_API(object):
             help(ip.tc("modules")["htb"])
             print(ip.tc("help", "htb"))
         '''
+        return self._request(self._tc_request(command, kind, index,
+                                              handle, **kwarg))
+
+    def _tc_request(self, command, kind=None, index=0, handle=0, **kwarg):
         if command == 'modules':
             return tc_plugins
 
@@ -1357,7 +1641,52 @@ class RTNL_API(object):
             msg['attrs'].append(['TCA_KIND', kind])
         if opts is not None:
             msg['attrs'].append(['TCA_OPTIONS', opts])
-        return tuple(self.nlm_request(msg, msg_type=command, msg_flags=flags))
+        return RTNLRequest(msg, command, flags, post=tuple)
+
+    def _route_msg(self, kwarg):
+        # build rtmsg from the `IPRouteRequest` kwarg;
+        # the kwarg is consumed
+        msg = rtmsg()
+
+        # table is mandatory; by default == 254
+        # if table is not defined in kwarg, save it there
+        # also for nla_attr:
+        table = kwarg.get('table', 254)
+        msg['table'] = table if table <= 255 else 252
+        msg['family'] = kwarg.pop('family', AF_INET)
+        msg['scope'] = kwarg.pop('scope', rt_scope['universe'])
+        msg['dst_len'] = kwarg.pop('dst_len', None) or kwarg.pop('mask', 0)
+        msg['src_len'] = kwarg.pop('src_len', 0)
+        msg['tos'] = kwarg.pop('tos', 0)
+        msg['flags'] = kwarg.pop('flags', 0)
+        msg['type'] = kwarg.pop('type', rt_type['unspec'])
+        msg['proto'] = kwarg.pop('proto', rt_proto['unspec'])
+        msg['attrs'] = []
+
+        if msg['family'] == AF_MPLS:
+            for key in tuple(kwarg):
+                if key not in ('dst', 'newdst', 'via', 'multipath', 'oif'):
+                    kwarg.pop(key)
+
+        for key in kwarg:
+            nla = rtmsg.name2nla(key)
+            if kwarg[key] is not None:
+                msg['attrs'].append([nla, kwarg[key]])
+                # fix IP family, if needed
+                if msg['family'] in (AF_UNSPEC, 255):
+                    if key in ('dst', 'src', 'gateway', 'prefsrc', 'newdst') \
+                            and isinstance(kwarg[key], basestring):
+                        msg['family'] = AF_INET6 if kwarg[key].find(':') >= 0 \
+                            else AF_INET
+                    elif key == 'multipath' and len(kwarg[key]) > 0:
+                        hop = kwarg[key][0]
+                        attrs = hop.get('attrs', [])
+                        for attr in attrs:
+                            if attr[0] == 'RTA_GATEWAY':
+                                msg['family'] = AF_INET6 if \
+                                    attr[1].find(':') >= 0 else AF_INET
+                                break
+        return msg
 
     def route(self, command, **kwarg):
         '''
@@ -1482,6 +1811,9 @@ class RTNL_API(object):
 
         Dump all routes.
         '''
+        return self._request(self._route_request(command, **kwarg))
+
+    def _route_request(self, command, **kwarg):
         # 8<----------------------------------------------------
         # FIXME
         # flags should be moved to some more general place
@@ -1514,57 +1846,91 @@ class RTNL_API(object):
                     'show': (RTM_GETROUTE, flags_dump),
                     'dump': (RTM_GETROUTE, flags_dump)}
         (command, flags) = commands.get(command, command)
-        msg = rtmsg()
+        msg = self._route_msg(kwarg)
 
-        # table is mandatory; by default == 254
-        # if table is not defined in kwarg, save it there
-        # also for nla_attr:
-        table = kwarg.get('table', 254)
-        msg['table'] = table if table <= 255 else 252
-        msg['family'] = kwarg.pop('family', AF_INET)
-        msg['scope'] = kwarg.pop('scope', rt_scope['universe'])
-        msg['dst_len'] = kwarg.pop('dst_len', None) or kwarg.pop('mask', 0)
-        msg['src_len'] = kwarg.pop('src_len', 0)
-        msg['tos'] = kwarg.pop('tos', 0)
-        msg['flags'] = kwarg.pop('flags', 0)
-        msg['type'] = kwarg.pop('type', rt_type['unspec'])
-        msg['proto'] = kwarg.pop('proto', rt_proto['unspec'])
-        msg['attrs'] = []
-
-        if msg['family'] == AF_MPLS:
-            for key in tuple(kwarg):
-                if key not in ('dst', 'newdst', 'via', 'multipath', 'oif'):
-                    kwarg.pop(key)
-
-        for key in kwarg:
-            nla = rtmsg.name2nla(key)
-            if kwarg[key] is not None:
-                msg['attrs'].append([nla, kwarg[key]])
-                # fix IP family, if needed
-                if msg['family'] in (AF_UNSPEC, 255):
-                    if key in ('dst', 'src', 'gateway', 'prefsrc', 'newdst') \
-                            and isinstance(kwarg[key], basestring):
-                        msg['family'] = AF_INET6 if kwarg[key].find(':') >= 0 \
-                            else AF_INET
-                    elif key == 'multipath' and len(kwarg[key]) > 0:
-                        hop = kwarg[key][0]
-                        attrs = hop.get('attrs', [])
-                        for attr in attrs:
-                            if attr[0] == 'RTA_GATEWAY':
-                                msg['family'] = AF_INET6 if \
-                                    attr[1].find(':') >= 0 else AF_INET
-                                break
-
-        ret = self.nlm_request(msg,
-                               msg_type=command,
-                               msg_flags=flags,
-                               callback=callback)
-        if match:
-            ret = self._match(match, ret)
-
-        if not (command == RTM_GETROUTE and config.nlm_generator):
-            ret = tuple(ret)
+        return RTNLRequest(msg, command, flags,
+                           post=dump_result(command == RTM_GETROUTE),
+                           callback=callback,
+                           match=match or None)
 
+    def route_lookup_many(self, dsts,
+                          fields=('oif', 'gateway', 'prefsrc', 'table'),
+                          window=256,
+                          **kwarg):
+        '''
+        Look up the routes to many destinations, like
+        `route('get', dst=...)` for every one, but with up to
+        `window` requests in one datagram, see `nlm_request_batch()`.
+        Other keyword arguments, like `oif`, `src` or `mark`, are
+        common for all the requests.
+
+        Return the list in the order of `dsts`: a dict with the
+        requested `fields` for every destination, `None` for the
+        missing ones, or `NetlinkError`, e.g. for unreachable
+        destinations. Only the requested attributes are decoded::
+
+            ret = ipr.route_lookup_many(['10.0.0.1', '10.1.0.1'],
+                                        fields=('oif', 'gateway'))
+            # [{'oif': 2, 'gateway': '10.0.0.254'},
+            #  NetlinkError(101, 'Network is unreachable')]
+
+        The fields are the `rtmsg` fields or NLA names w/o the
+        prefix; `table` is `RTA_TABLE`, if any.
+
+        A destination may be a dict with the keywords for this
+        request only, e.g. `{'dst': 'default', 'family': AF_INET6}`.
+        The family is guessed from the address, if not set.
+
+        The kernel looks the destinations up via the policy rules,
+        as for the packets, and ignores `table`. With `table` set
+        the requests get `RTM_F_LOOKUP_TABLE`, so the kernel reports
+        the table, where the route was found, and the routes from
+        other tables are returned as `None`.
+        '''
+        (msgs, tables) = self._route_lookup_msgs(dsts, kwarg)
+        ret = self.nlm_request_batch(msgs, RTM_GETROUTE, NLM_F_REQUEST,
+                                     window=window)
+        return self._route_lookup_result(fields, tables, ret)
+
+    def _route_lookup_msgs(self, dsts, kwarg):
+        msgs = []
+        tables = []
+        for dst in dsts:
+            request = dict(kwarg)
+            if isinstance(dst, dict):
+                request.update(dst)
+            else:
+                request['dst'] = dst
+            if 'family' not in request:
+                request['family'] = AF_INET6 \
+                    if str(request['dst']).find(':') >= 0 else AF_INET
+            table = request.get('table')
+            if table is not None:
+                request['flags'] = (request.get('flags', 0) |
+                                    RTM_F_LOOKUP_TABLE)
+            tables.append(table)
+            msgs.append(self._route_msg(IPRouteRequest(request)))
+        return (msgs, tables)
+
+    def _route_lookup_result(self, fields, tables, results):
+        nlas = [(x, rtmsg.name2nla(x)) for x in fields]
+        ret = []
+        for (table, result) in zip(tables, results):
+            if isinstance(result, Exception):
+                ret.append(result)
+                continue
+            msg = result[0]
+            if table is not None and \
+                    (msg.get_attr('RTA_TABLE') or msg['table']) != table:
+                ret.append(None)
+                continue
+            record = {}
+            for (field, nla) in nlas:
+                value = msg.get_attr(nla)
+                if value is None:
+                    value = msg.get(field)
+                record[field] = value
+            ret.append(record)
         return ret
 
     def rule(self, command, *argv, **kwarg):
@@ -1634,6 +2000,9 @@ class RTNL_API(object):
                          dst='10.64.75.141',
                          fwmark=10)
         '''
+        return self._request(self._rule_request(command, *argv, **kwarg))
+
+    def _rule_request(self, command, *argv, **kwarg):
         flags_base = NLM_F_REQUEST | NLM_F_ACK
         flags_make = flags_base | NLM_F_CREATE | NLM_F_EXCL
         flags_dump = NLM_F_REQUEST | NLM_F_ROOT | NLM_F_ATOMIC
@@ -1673,18 +2042,170 @@ class RTNL_API(object):
             if kwarg[key] is not None:
                 msg['attrs'].append([nla, kwarg[key]])
 
-        ret = self.nlm_request(msg,
-                               msg_type=command,
-                               msg_flags=flags)
-
+        ret = RTNLRequest(msg, command, flags)
         if 'match' in kwarg:
-            ret = self._match(kwarg['match'], ret)
+            match = kwarg['match']
+            ret.then(lambda x: self._match(match, x))
+        return ret.then(dump_result(command == RTM_GETRULE))
+    # 8<---------------------------------------------------------------
 
-        if not (command == RTM_GETRULE and config.nlm_generator):
-            ret = tuple(ret)
 
-        return ret
-    # 8<---------------------------------------------------------------
+class RTNLCapture(RTNL_API):
+    '''
+    The `RTNL_API` object that saves the requests instead of
+    sending them, as `(msg, msg_type, msg_flags)`; the dumps go
+    to the socket
+    '''
+
+    def __init__(self, sock):
+        # skip `RTNL_API.__init__()`, there is no socket
+        self.sock = sock
+        self.requests = []
+
+    def __getattr__(self, attr):
+        return getattr(self.sock, attr)
+
+    def nlm_request(self, msg, msg_type,
+                    msg_flags=NLM_F_REQUEST | NLM_F_DUMP,
+                    terminate=None,
+                    callback=None,
+                    strict=False,
+                    match=None):
+        if (msg_flags & NLM_F_DUMP) == NLM_F_DUMP:
+            return self.sock.nlm_request(msg, msg_type, msg_flags,
+                                         terminate=terminate,
+                                         callback=callback,
+                                         strict=strict,
+                                         match=match)
+        self.requests.append((msg, msg_type, msg_flags))
+        return ()
+
+
+class RTNLPipeline(RTNL_API):
+    '''
+    The `RTNL_API` object that sends the requests through
+    the pipeline, see `RTNL_API.pipeline()`
+    '''
+
+    def __init__(self, sock, pipeline):
+        # skip `RTNL_API.__init__()`, there is no socket
+        self.sock = sock
+        self.pipeline = pipeline
+
+    def __getattr__(self, attr):
+        return getattr(self.sock, attr)
+
+    def nlm_request(self, msg, msg_type,
+                    msg_flags=NLM_F_REQUEST | NLM_F_DUMP,
+                    terminate=None,
+                    callback=None,
+                    strict=False,
+                    match=None):
+        # NLM_F_DUMP shares bits with NLM_F_EXCL and NLM_F_REPLACE
+        if (msg_flags & NLM_F_DUMP) == NLM_F_DUMP:
+            return self.sock.nlm_request(msg, msg_type, msg_flags,
+                                         terminate=terminate,
+                                         callback=callback,
+                                         strict=strict,
+                                         match=match)
+        self.pipeline.send(msg, msg_type, msg_flags | NLM_F_ACK,
+                           terminate, callback, match)
+        return ()
+
+
+class Pipeline(object):
+    '''
+    Pipelined RTNL requests, see `RTNL_API.pipeline()`
+    '''
+
+    def __init__(self, sock, window=64):
+        self.sock = sock
+        self.window = max(1, window)
+        self.api = RTNLPipeline(sock, self)
+        self.results = []
+        self.inflight = deque()   # [(operation, msg_seq, ...), ...]
+        self.operation = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wait()
+
+    def __getattr__(self, attr):
+        method = getattr(RTNL_API, attr)
+        if attr.startswith('_') or not callable(method):
+            raise AttributeError(attr)
+
+        def call(*argv, **kwarg):
+            self.operation = len(self.results)
+            self.results.append(())
+            try:
+                ret = method(self.api, *argv, **kwarg)
+                if isinstance(ret, types.GeneratorType):
+                    ret = tuple(ret)
+                if ret and not self.results[self.operation]:
+                    # a dump, the response is here already
+                    self.results[self.operation] = ret
+            except Exception as e:
+                self.results[self.operation] = e
+                raise
+            finally:
+                self.operation = None
+            return len(self.results) - 1
+
+        return call
+
+    def send(self, msg, msg_type, msg_flags, terminate, callback, match):
+        if self.operation is None:
+            raise RuntimeError('request out of the pipeline operation')
+        while len(self.inflight) >= self.window:
+            self.receive()
+        msg_seq = self.sock.addr_pool.alloc()
+        try:
+            self.sock.put(msg, msg_type, msg_flags, msg_seq=msg_seq)
+        except Exception:
+            self.sock.addr_pool.free(msg_seq, ban=0xff)
+            raise
+        self.inflight.append((self.operation, msg_seq,
+                              terminate, callback, match))
+
+    def receive(self):
+        '''
+        Collect the response for the oldest request in flight
+        '''
+        (operation, msg_seq, terminate, callback, match) = \
+            self.inflight.popleft()
+        if match is not None:
+            match = compile_match(match)
+        try:
+            ret = tuple(self.sock.get(msg_seq=msg_seq,
+                                      terminate=terminate,
+                                      callback=callback,
+                                      match=match))
+            if match is not None:
+                ret = tuple(msg for msg in ret if match(msg))
+        except NetlinkError as e:
+            ret = e
+        finally:
+            # see `NetlinkMixin.nlm_request()` for the ban
+            self.sock.backlog_unregister(msg_seq)
+            self.sock.addr_pool.free(msg_seq, ban=0xff)
+        # one operation can consist of several requests:
+        # the first error fails the whole operation
+        if not isinstance(self.results[operation], Exception):
+            if isinstance(ret, Exception):
+                self.results[operation] = ret
+            else:
+                self.results[operation] += ret
+
+    def wait(self):
+        '''
+        Collect all the responses, return `results`
+        '''
+        while self.inflight:
+            self.receive()
+        return self.results
 
 
 class IPBatch(RTNL_API, IPBatchSocket):
@@ -1719,7 +2240,27 @@ class IPRoute(RTNL_API, IPRSocket):
     '''
     Regular ordinary utility class, see RTNL API for the list of methods.
     '''
-    pass
+
+    resolver = None
+
+    def get_resolver(self):
+        '''
+        Return the `LinkResolver`, it is started on the first
+        call, if `config.link_resolver` is True
+        '''
+        with self.sys_lock:
+            if self.resolver is None and \
+                    config.link_resolver and \
+                    not self.closed:
+                self.resolver = LinkResolver()
+            return self.resolver
+
+    def close(self):
+        with self.sys_lock:
+            if self.resolver is not None:
+                self.resolver.close()
+                self.resolver = None
+        super(IPRoute, self).close()
 
 
 class RawIPRoute(RTNL_API, RawIPRSocket):
@@ -0,0 +1,214 @@
+'''
+IPRoutePool
+===========
+
+One `IPRoute` object can be used from many threads, but the
+threads then take turns on its locks. Opening a new socket for
+every call costs a socket and a bind per request. `IPRoutePool`
+keeps a set of `IPRoute` sockets and checks out a free one for
+every call, so the threads run their requests in parallel::
+
+    from pyroute2 import IPRoutePool
+
+    pool = IPRoutePool(size=16)
+
+    # any RTNL API call checks out a socket for the call time
+    pool.link('set', index=2, state='up')
+    links = pool.get_links()
+
+    # several calls on the same socket
+    with pool.socket() as ipr:
+        idx = ipr.link_lookup(ifname='eth0')[0]
+        ipr.addr('add', index=idx, address='10.0.0.1', mask=24)
+
+    pool.close()
+
+The pool creates the sockets on demand, up to `size`; when all
+the sockets are busy, the call waits up to `timeout` seconds for
+a free one, and then raises `RuntimeError`. The most recently
+used sockets are checked out first, so the rest stay idle, and
+the sockets that are idle more than `idle` seconds are closed.
+
+A socket is checked prior to the checkout: it must not be closed,
+and must have no pending data or errors, since nobody should
+write to an idle socket. A socket that raises `OSError` is closed,
+not returned to the pool; `NetlinkError` is not a socket error.
+
+The API calls return lists or tuples: with `nlm_generator` the
+generators are read out before the socket is returned. The pooled
+sockets are not bound to multicast groups, use a separate `IPRoute`
+object to receive the broadcast messages.
+'''
+import time
+import types
+import select
+import threading
+from collections import deque
+from pyroute2 import config
+from pyroute2.iproute.linux import RTNL_API
+
+if config.uname[0][-3:] == 'BSD':
+    from pyroute2.iproute.bsd import IPRoute
+else:
+    from pyroute2.iproute.linux import IPRoute
+
+
+class PooledSocket(object):
+    '''
+    The context manager that checks out a socket, see
+    `IPRoutePool.socket()`
+    '''
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.sock = None
+
+    def __enter__(self):
+        self.sock = self.pool.checkout()
+        return self.sock
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.pool.checkin(self.sock, exc_value)
+        self.sock = None
+
+
+class IPRoutePool(object):
+    '''
+    A pool of `IPRoute` sockets, see the module description.
+
+        - size -- the maximum number of sockets
+        - idle -- close the sockets idle for more than `idle`
+          seconds; `None` to keep them
+        - timeout -- wait for a free socket up to `timeout`
+          seconds; `None` to wait forever
+        - factory -- the socket class, `IPRoute` by default
+
+    Other keyword arguments are passed to the factory.
+    '''
+
+    def __init__(self, size=16, idle=60, timeout=30, factory=IPRoute,
+                 **kwarg):
+        self.size = size
+        self.idle = idle
+        self.timeout = timeout
+        self.factory = factory
+        self.kwarg = kwarg
+        self.lock = threading.Condition()
+        self.free = deque()   # [(sock, last used), ...], LIFO
+        self.busy = set()
+        self.closed = False
+        self.stats = {'created': 0,
+                      'closed': 0,
+                      'checkouts': 0,
+                      'waits': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getattr__(self, attr):
+        method = getattr(RTNL_API, attr)
+        if attr.startswith('_') or not callable(method):
+            raise AttributeError(attr)
+
+        def call(*argv, **kwarg):
+            with self.socket() as sock:
+                ret = getattr(sock, attr)(*argv, **kwarg)
+                if isinstance(ret, types.GeneratorType):
+                    ret = tuple(ret)
+                return ret
+
+        return call
+
+    def socket(self):
+        '''
+        Return the context manager, that checks out a socket
+        for the `with` block
+        '''
+        return PooledSocket(self)
+
+    @staticmethod
+    def healthy(sock):
+        if sock.closed:
+            return False
+        poll = select.poll()
+        poll.register(sock.fileno(), select.POLLIN | select.POLLERR)
+        return not poll.poll(0)
+
+    def discard(self, sock):
+        try:
+            sock.close()
+        except Exception:
+            pass
+        self.stats['closed'] += 1
+
+    def trim(self):
+        '''
+        Close the sockets idle for more than `idle` seconds
+        '''
+        if self.idle is None:
+            return
+        deadline = time.time() - self.idle
+        with self.lock:
+            # the oldest sockets are at the left end
+            while self.free and self.free[0][1] < deadline:
+                self.discard(self.free.popleft()[0])
+
+    def checkout(self):
+        '''
+        Return a free socket, creating it if needed; the socket
+        must be returned with `checkin()`
+        '''
+        self.trim()
+        ctime = time.time()
+        with self.lock:
+            while True:
+                if self.closed:
+                    raise RuntimeError('the pool is closed')
+                if self.free:
+                    sock = self.free.pop()[0]
+                    if not self.healthy(sock):
+                        self.discard(sock)
+                        continue
+                    break
+                if len(self.busy) < self.size:
+                    sock = self.factory(**self.kwarg)
+                    self.stats['created'] += 1
+                    break
+                if self.timeout is None:
+                    wait = None
+                else:
+                    wait = self.timeout - (time.time() - ctime)
+                    if wait <= 0:
+                        raise RuntimeError('no free sockets in the pool')
+                self.stats['waits'] += 1
+                self.lock.wait(wait)
+            self.busy.add(sock)
+            self.stats['checkouts'] += 1
+            return sock
+
+    def checkin(self, sock, error=None):
+        '''
+        Return the socket to the pool; if `error` is a socket
+        error, the socket is closed
+        '''
+        with self.lock:
+            self.busy.discard(sock)
+            if self.closed or isinstance(error, (OSError, IOError)):
+                self.discard(sock)
+            else:
+                self.free.append((sock, time.time()))
+            self.lock.notify()
+
+    def close(self):
+        '''
+        Close the free sockets; the busy ones are closed when
+        they are returned
+        '''
+        with self.lock:
+            self.closed = True
+            while self.free:
+                self.discard(self.free.pop()[0])
+            self.lock.notify_all()
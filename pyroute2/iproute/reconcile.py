@@ -0,0 +1,273 @@
+'''
+State reconciliation
+====================
+
+Converge the kernel objects to the desired state with the minimal
+set of changes, instead of flushing and adding them again::
+
+    desired = [{'dst': '10.0.%i.0/24' % x,
+                'gateway': '192.168.0.1',
+                'table': 100} for x in range(256)]
+    report = ipr.reconcile('routes', desired, scope={'table': 100})
+
+`RTNL_API.reconcile()` dumps the objects in the scope once, and
+matches them with the desired ones by the key, the same as the
+NDB uses, see `DBSchema.indices`:
+
+    - routes -- family, dst_len, tos, dst, priority, table
+    - addresses -- index, address, local
+    - fdb -- ifindex, lladdr
+    - neighbours -- ifindex, dst
+
+The NDB keys the neighbours by `lladdr` as well, but the kernel
+keys the ARP/ND records by `dst`, so `dst` is used here. Then the
+missing objects are added, the changed ones are replaced, and the
+objects in the scope that are not desired are deleted. The requests
+are packed into big datagrams, see `nlm_request_batch()`.
+
+The desired objects are the keyword arguments for `route()`,
+`addr()`, `neigh()` or `fdb()`, and the requests are built with
+these methods, so the same shortcuts work. The requests and the
+dump are compared in the binary form, that needs no normalization
+of the values: an object is changed, if any NLA of the request is
+missing or differs in the dump, or any field given explicitly,
+like `proto`, `type`, `mask` or `state`, differs. Other fields get
+the defaults in the request, and are not compared.
+
+The scope is the filter for `get_routes()`, `get_addr()` or
+`get_neighbours()`, and the desired objects must belong to it,
+otherwise they are sent again on every call. The report::
+
+    {'add': [...],       # the desired objects that were missing
+     'replace': [...],   # the desired objects that were changed
+     'delete': [...],    # the dumped messages that were deleted
+     'keep': 1000,       # the number of the objects w/o changes
+     'errors': [(action, obj, NetlinkError), ...]}
+
+With `dry_run=True` nothing is changed, and the report shows
+the planned changes. An address can not be replaced in place,
+if the prefix length changes, so the changed addresses are
+deleted and added again.
+'''
+import struct
+from socket import AF_INET6
+from pyroute2.config import AF_BRIDGE
+from pyroute2.netlink import NLA_F_NESTED
+from pyroute2.netlink import NLA_F_NET_BYTEORDER
+from pyroute2.netlink import NLM_F_REQUEST
+from pyroute2.netlink import NLM_F_CREATE
+from pyroute2.netlink import NLM_F_EXCL
+from pyroute2.netlink import NLM_F_REPLACE
+from pyroute2.netlink import NLM_F_ACK
+from pyroute2.netlink import compile_struct
+from pyroute2.netlink.rtnl import RTM_NEWROUTE
+from pyroute2.netlink.rtnl import RTM_DELROUTE
+from pyroute2.netlink.rtnl import RTM_NEWADDR
+from pyroute2.netlink.rtnl import RTM_DELADDR
+from pyroute2.netlink.rtnl import RTM_NEWNEIGH
+from pyroute2.netlink.rtnl import RTM_DELNEIGH
+from pyroute2.netlink.rtnl.rtmsg import rtmsg
+from pyroute2.netlink.rtnl.ndmsg import ndmsg
+from pyroute2.netlink.rtnl.ifaddrmsg import ifaddrmsg
+from pyroute2.ndb.dbschema import DBSchema
+from pyroute2.iproute.linux import RTNLCapture
+
+flags_replace = NLM_F_REQUEST | NLM_F_ACK | NLM_F_CREATE | NLM_F_REPLACE
+flags_delete = NLM_F_REQUEST | NLM_F_CREATE | NLM_F_EXCL
+flags_route = NLM_F_REQUEST
+
+
+class Reconciler(object):
+    '''
+    Reconcile one kind of objects, see the module description.
+
+        - sock -- the `RTNL_API` object
+        - kind -- `routes`, `addresses`, `neighbours` or `fdb`
+    '''
+
+    # kind -> (message class, key, API method, dump method,
+    #          dump family, RTM_NEW*, RTM_DEL*, delete flags,
+    #          replace in place)
+    #
+    # the delete flags are the same as in the flush_*() methods
+    kinds = {'routes': (rtmsg,
+                        DBSchema.indices['routes'],
+                        'route', 'get_routes', 255,
+                        RTM_NEWROUTE, RTM_DELROUTE, flags_route,
+                        True),
+             'addresses': (ifaddrmsg,
+                           DBSchema.indices['addresses'],
+                           'addr', 'get_addr', None,
+                           RTM_NEWADDR, RTM_DELADDR, flags_delete,
+                           False),
+             'neighbours': (ndmsg,
+                            ('ifindex', 'NDA_DST'),
+                            'neigh', 'get_neighbours', None,
+                            RTM_NEWNEIGH, RTM_DELNEIGH, flags_delete,
+                            True),
+             'fdb': (ndmsg,
+                     DBSchema.indices['neighbours'],
+                     'fdb', 'get_neighbours', AF_BRIDGE,
+                     RTM_NEWNEIGH, RTM_DELNEIGH, flags_delete,
+                     True)}
+
+    # the API keywords for the fields
+    aliases = {'mask': ('prefixlen', 'dst_len'),
+               'nud': ('state', )}
+
+    def __init__(self, sock, kind):
+        if kind not in self.kinds:
+            raise ValueError('unknown kind %s' % kind)
+        self.sock = sock
+        self.kind = kind
+        (self.msg_class,
+         self.key,
+         self.api,
+         self.dump,
+         self.family,
+         self.msg_new,
+         self.msg_del,
+         self.flags_del,
+         self.in_place) = self.kinds[kind]
+        self.header_size = compile_struct(self.msg_class.header).size
+        self.codec = compile_struct(self.msg_class.fields)
+        self.fields = set([x[0] for x in self.msg_class.fields])
+        proto = self.msg_class()
+        self.nla_names = {}
+        for nla in self.msg_class.nla_map:
+            name = nla[1] if isinstance(nla[0], int) else nla[0]
+            prime = proto.name2prime(name)
+            if prime is not None:
+                self.nla_names[prime['type']] = name
+
+    def scan(self, msg):
+        # -> {field: value, NLA name: payload}, the first NLA of
+        # every type is used, as in get_attr()
+        if not msg.length or len(msg.data) < msg.offset + msg.length:
+            msg.reset()
+            msg.encode()
+        data = msg.data
+        end = msg.offset + msg.length
+        record = {}
+        position = self.codec.decode(record, data,
+                                     msg.offset + self.header_size)
+        position = (position + 4 - 1) & ~ (4 - 1)
+        while position <= end - 4:
+            (size, nla_type) = struct.unpack_from('HH', data, position)
+            nla_type &= ~(NLA_F_NESTED | NLA_F_NET_BYTEORDER)
+            size = min(max(size, 4), end - position)
+            name = self.nla_names.get(nla_type)
+            if name is not None and name not in record:
+                record[name] = bytes(data[position + 4:position + size])
+            position += (size + 4 - 1) & ~ (4 - 1)
+        # the kernel doesn't report some default values
+        if self.msg_class is rtmsg:
+            record.setdefault('RTA_TABLE',
+                              struct.pack('I', record['table']))
+            record.setdefault('RTA_PRIORITY',
+                              struct.pack('I', 1024 if record['family'] ==
+                                          AF_INET6 else 0))
+        elif self.msg_class is ifaddrmsg:
+            record.setdefault('IFA_LOCAL', record.get('IFA_ADDRESS'))
+        return record
+
+    def explicit(self, obj):
+        # -> the fields set in the desired object
+        ret = set()
+        for name in obj:
+            if name in self.fields:
+                ret.add(name)
+            for field in self.aliases.get(name, ()):
+                if field in self.fields:
+                    ret.add(field)
+        return ret
+
+    def differs(self, obj, want, have):
+        for (name, value) in want.items():
+            if name not in self.fields and have.get(name) != value:
+                return True
+        for name in self.explicit(obj):
+            if want[name] != have[name]:
+                return True
+        return False
+
+    def run(self, desired, scope=None, dry_run=False):
+        '''
+        Compute the diff and apply it, return the report
+        '''
+        wanted = self.prepare(desired)
+        current = getattr(self.sock, self.dump)(**self.dump_scope(scope))
+        (report, delete, requests) = self.diff(wanted, current)
+        if dry_run:
+            return report
+        if delete:
+            self.deleted(report, self.sock._flush(delete, self.msg_del,
+                                                  self.flags_del))
+        if requests:
+            self.sent(report, requests,
+                      self.sock.nlm_request_batch([x[2] for x in requests],
+                                                  self.msg_new,
+                                                  flags_replace,
+                                                  copy=True))
+        return report
+
+    def prepare(self, desired):
+        # -> {key: (obj, request msg, scanned request)}
+        capture = RTNLCapture(self.sock)
+        wanted = {}
+        for obj in desired:
+            getattr(capture, self.api)('add', **obj)
+            msg = capture.requests.pop()[0]
+            msg.encode()
+            want = self.scan(msg)
+            wanted[tuple([want.get(x) for x in self.key])] = (obj, msg, want)
+        return wanted
+
+    def dump_scope(self, scope):
+        scope = dict(scope or {})
+        if self.family is not None:
+            scope.setdefault('family', self.family)
+        return scope
+
+    def diff(self, wanted, current):
+        # -> (report, messages to delete, [(action, obj, msg), ...])
+        report = {'add': [],
+                  'replace': [],
+                  'delete': [],
+                  'keep': 0,
+                  'errors': []}
+        changed = set()
+        delete = []
+        for msg in current:
+            have = self.scan(msg)
+            if self.kind == 'neighbours' and have['family'] == AF_BRIDGE:
+                continue
+            key = tuple([have.get(x) for x in self.key])
+            if key not in wanted or key in changed:
+                report['delete'].append(msg)
+                delete.append(msg)
+            elif self.differs(wanted[key][0], wanted[key][2], have):
+                changed.add(key)
+                if not self.in_place:
+                    delete.append(msg)
+            else:
+                report['keep'] += 1
+                del wanted[key]
+
+        requests = []
+        for (key, (obj, msg, want)) in wanted.items():
+            action = 'replace' if key in changed else 'add'
+            report[action].append(obj)
+            requests.append((action, obj, msg))
+        return (report, delete, requests)
+
+    def deleted(self, report, msgs):
+        for msg in msgs:
+            if msg['header'].get('error'):
+                report['errors'].append(('delete', msg,
+                                         msg['header']['error']))
+
+    def sent(self, report, requests, results):
+        for ((action, obj, msg), result) in zip(requests, results):
+            if isinstance(result, Exception):
+                report['errors'].append((action, obj, result))
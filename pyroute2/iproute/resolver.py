@@ -0,0 +1,163 @@
+'''
+LinkResolver
+============
+
+`link_lookup()` used to dump all the links and to scan them
+for every call, that costs tens of milliseconds on a host with
+thousands of interfaces. `LinkResolver` keeps the interfaces
+in dicts, loaded with one dump, and keeps them up to date with
+the `RTM_NEWLINK` and `RTM_DELLINK` broadcasts::
+
+    from pyroute2.iproute.resolver import LinkResolver
+
+    resolver = LinkResolver()
+    resolver.lookup('ifname', 'eth0')              # -> [2]
+    resolver.lookup('master', 5)                   # -> [7, 8]
+    resolver.get(2)  # -> {'index': 2, 'ifname': 'eth0', ...}
+    resolver.close()
+
+The resolver uses its own socket, bound to `RTMGRP_LINK`, and
+doesn't start threads: every call first reads the broadcasts
+queued in the socket. The kernel sends the broadcast prior to
+the response to the request, so the changes made by the program
+itself are always visible, as well as the changes made by other
+programs that are done by the time of the call. If the socket
+overruns, the cache is reloaded.
+
+The cached fields are `index`, `ifname`, `address`, `master`
+and `kind`. `IPRoute.link_lookup()` uses the resolver for these
+fields if `config.link_resolver` is set to True; it is off by
+default, since every `IPRoute` object would open one more socket
+and get all the link broadcasts::
+
+    from pyroute2 import config
+    config.link_resolver = True
+'''
+import errno
+import select
+import threading
+from socket import AF_UNSPEC
+from pyroute2.netlink import NLM_F_REQUEST
+from pyroute2.netlink import NLM_F_DUMP
+from pyroute2.netlink.rtnl import RTM_NEWLINK
+from pyroute2.netlink.rtnl import RTM_DELLINK
+from pyroute2.netlink.rtnl import RTM_GETLINK
+from pyroute2.netlink.rtnl import RTMGRP_LINK
+from pyroute2.netlink.rtnl.ifinfmsg import ifinfmsg
+from pyroute2.netlink.rtnl.iprsocket import IPRSocket
+
+
+class LinkResolver(object):
+    '''
+    Interface cache, see the module description.
+
+        - factory -- the RTNL socket class, `IPRSocket`
+          by default
+    '''
+
+    fields = ('index', 'ifname', 'address', 'master', 'kind')
+
+    def __init__(self, factory=IPRSocket):
+        self.lock = threading.RLock()
+        self.nl = factory()
+        self.nl.bind(groups=RTMGRP_LINK)
+        self.poll = select.poll()
+        self.poll.register(self.nl.fileno(), select.POLLIN)
+        self.links = {}                          # index -> record
+        self.indexes = dict([(x, {}) for x in self.fields
+                             if x != 'index'])   # field -> value -> {index}
+        self.stats = {'loads': 0,
+                      'events': 0}
+        self.load()
+
+    @staticmethod
+    def record(msg):
+        linkinfo = msg.get_attr('IFLA_LINKINFO')
+        return {'index': msg['index'],
+                'ifname': msg.get_attr('IFLA_IFNAME'),
+                'address': msg.get_attr('IFLA_ADDRESS'),
+                'master': msg.get_attr('IFLA_MASTER'),
+                'kind': linkinfo.get_attr('IFLA_INFO_KIND')
+                if linkinfo is not None else None}
+
+    def add(self, msg):
+        self.remove(msg['index'])
+        record = self.record(msg)
+        self.links[record['index']] = record
+        for (field, index) in self.indexes.items():
+            index.setdefault(record[field], set()).add(record['index'])
+
+    def remove(self, idx):
+        record = self.links.pop(idx, None)
+        if record is None:
+            return
+        for (field, index) in self.indexes.items():
+            value = index.get(record[field])
+            if value is not None:
+                value.discard(idx)
+                if not value:
+                    del index[record[field]]
+
+    def load(self):
+        '''
+        Reload the cache with a dump
+        '''
+        with self.lock:
+            msg = ifinfmsg()
+            msg['family'] = AF_UNSPEC
+            links = tuple(self.nl.nlm_request(msg, RTM_GETLINK,
+                                              NLM_F_REQUEST | NLM_F_DUMP))
+            self.links = {}
+            for index in self.indexes.values():
+                index.clear()
+            for msg in links:
+                self.add(msg)
+            self.stats['loads'] += 1
+
+    def sync(self):
+        '''
+        Apply the queued broadcasts
+        '''
+        with self.lock:
+            while self.nl.backlog[0] or self.poll.poll(0):
+                try:
+                    msgs = self.nl.get()
+                except (OSError, IOError) as e:
+                    if e.errno != errno.ENOBUFS:
+                        raise
+                    self.load()
+                    continue
+                for msg in msgs:
+                    # AF_BRIDGE messages are about the bridge ports,
+                    # RTM_DELLINK means the port is released
+                    if msg.get('family') != AF_UNSPEC:
+                        continue
+                    if msg['header']['type'] == RTM_NEWLINK:
+                        self.add(msg)
+                    elif msg['header']['type'] == RTM_DELLINK:
+                        self.remove(msg['index'])
+                    self.stats['events'] += 1
+
+    def lookup(self, field, value):
+        '''
+        Return the sorted list of the indices of the interfaces
+        with `field == value`
+        '''
+        with self.lock:
+            self.sync()
+            if field == 'index':
+                return [value] if value in self.links else []
+            return sorted(self.indexes[field].get(value, ()))
+
+    def get(self, idx):
+        '''
+        Return the record of the interface or `None`
+        '''
+        with self.lock:
+            self.sync()
+            record = self.links.get(idx)
+            return dict(record) if record is not None else None
+
+    def close(self):
+        with self.lock:
+            self.nl.close()
@@ -118,9 +118,12 @@ should be described as follows::
 
 Format strings are passed directly to the `struct` module,
 so you can use all the notations like `>I`, `16s` etc. All
-fields are parsed from the stream separately, so if you
-want to explicitly fix alignemt, as if it were C struct,
-use the `pack` attribute::
+fields are parsed from the stream as if they were packed
+one after another, without any alignment between them --
+the library compiles the whole `fields` spec into one
+`struct.Struct` object per byte order on the first use. So
+if you want to explicitly fix alignemt, as if it were C
+struct, use the `pack` attribute::
 
     class tstats(nla):
         pack = 'struct'
@@ -311,18 +314,38 @@ encoding and decoding algo
 The message encoding works as follows:
 
 1. Reserve space for the message header (if there is)
-2. Iterate defined `fields`, encoding values with `struct.pack()`
+2. Encode defined `fields` with the precompiled `struct.Struct`
 3. Iterate NLA from the `attrs` field, looking up types in `nla_map`
 4. Encode the header
 
 Since every NLA is also an `nlmsg` object, there is a recursion.
+Simple NLA, like integers, strings or addresses, are an exception:
+their encoded size is known from the compiled format and the value,
+so they are packed into the message buffer directly, without
+creating NLA objects, see `nla_encoder`.
 
 The decoding process is a bit simpler:
 
 1. Decode the header
-2. Iterate `fields`, decoding values with `struct.unpack()`
+2. Decode `fields` with the precompiled `struct.Struct`
 3. Iterate NLA until the message ends
 
+On the step 3 the decoder only reads NLA headers, and creates
+for every NLA a `nla_slot` with the name, the offset and the length.
+The NLA object is created and decoded on the first access to the
+slot value, so nested NLAs that nobody reads are never decoded.
+Set `pyroute2.config.nla_lazy = False` to create NLA objects on the
+step 3; they will be decoded on the first access anyways.
+
+`get_attr()` and `get_attrs()` use an index `name -> positions` that
+is built on the first call and rebuilt if the `attrs` list is replaced
+or its length changes, so the lookup doesn't scan the whole chain.
+
+The `fields` and `header` specs are compiled only once, see
+`nlmsg_codec` and `compile_struct()`. Specs with variable length
+fields (`s` or `z` without size) can not be compiled, so they
+are still encoded and decoded field by field.
+
 If the `fields` attribute is an empty list, the step 2 will be skipped.
 The step 3 will be skipped in the case of the empty `nla_map`. If both
 attributes are empty lists, only the header will be encoded/decoded.
@@ -400,6 +423,7 @@ from socket import inet_ntop
 from socket import AF_INET
 from socket import AF_INET6
 from socket import AF_UNSPEC
+from pyroute2 import config
 from pyroute2.common import AF_MPLS
 from pyroute2.common import hexdump
 from pyroute2.common import basestring
@@ -564,6 +588,7 @@ NETLINK_RX_RING = 6
 NETLINK_TX_RING = 7
 
 NETLINK_LISTEN_ALL_NSID = 8
+NETLINK_GET_STRICT_CHK = 12
 
 clean_cbs = {}
 
@@ -572,6 +597,474 @@ clean_cbs = {}
 cache_fmt = {}
 cache_hdr = {}
 cache_jit = {}
+cache_struct = {}
+cache_nla_enc = {}
+
+
+class nlmsg_codec(object):
+    '''
+    Precompiled codec for a `fields` or `header` spec.
+
+    The spec is split into segments: a run of fields with the
+    same byte order becomes one `struct.Struct`, so the whole
+    structure is packed or unpacked with one call per segment,
+    usually just one, instead of one call per field. For every
+    field the codec keeps the name, the position of its first
+    value in the unpacked tuple and the values count; `x` pads
+    have no values and are skipped on encoding.
+
+    Fields with native sizes that differ from the standard ones,
+    e.g. `L` on 64-bit platforms, get their own native segments.
+
+    The `packed` attribute contains the struct for the C-like
+    aligned layout, see `pack = 'struct'`, and the list of the
+    names to set, `_`-prefixed names are skipped.
+
+    If the spec contains variable length fields, `segments` is
+    `None`, and the caller should fall back to field by field
+    processing.
+    '''
+
+    __slots__ = ('spec',
+                 'segments',
+                 'packed',
+                 'size')
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.segments = None
+        self.packed = None
+        self.size = 0
+        spec = tuple(spec or ())
+        if any(fmt in ('s', 'z') for (name, fmt) in spec):
+            return
+        try:
+            self.segments = self.compile(spec)
+        except struct.error:
+            return
+        self.size = sum([x[0].size for x in self.segments])
+        try:
+            # byte order prefixes are not allowed in the middle
+            # of a format, such specs can not be packed
+            self.packed = (struct.Struct(''.join([x[1] for x in spec])),
+                           tuple([x[0] for x in spec if x[0][0] != '_']))
+        except struct.error:
+            pass
+
+    @staticmethod
+    def compile(spec):
+        chunks = []
+        for (name, fmt) in spec:
+            if fmt[0] in '@=<>!':
+                order, body = fmt[0], fmt[1:]
+            else:
+                order, body = '@', fmt
+            if order == '!':
+                order = '>'
+            elif order == '@' and \
+                    struct.calcsize(fmt) == struct.calcsize('=' + body):
+                order = '='
+            count = len(struct.unpack(fmt, bytes(bytearray(
+                struct.calcsize(fmt)))))
+            if chunks and order != '@' and chunks[-1][0] == order:
+                chunks[-1][1].append((name, body, count))
+            else:
+                chunks.append((order, [(name, body, count)]))
+        segments = []
+        for (order, fields) in chunks:
+            layout = []
+            idx = 0
+            for (name, body, count) in fields:
+                layout.append((name, idx, count))
+                idx += count
+            if all([x[2] == 1 for x in layout]):
+                names = tuple([x[0] for x in layout])
+            else:
+                names = None
+            segments.append((struct.Struct(order +
+                                           ''.join([x[1] for x in fields])),
+                             tuple(layout),
+                             names))
+        return segments
+
+    def decode(self, msg, data, offset):
+        '''
+        Unpack the spec from `data` at `offset` into the `msg`
+        dictionary, return the offset right after the spec
+        '''
+        for (st, layout, names) in self.segments:
+            values = st.unpack_from(data, offset)
+            offset += st.size
+            if names is not None:
+                msg.update(zip(names, values))
+            else:
+                for (name, idx, count) in layout:
+                    if count == 1:
+                        msg[name] = values[idx]
+                    else:
+                        msg[name] = values[idx:idx + count]
+        return offset
+
+    def encode(self, msg, data, offset):
+        '''
+        Pack values from the `msg` dictionary into `data` at
+        `offset`; the buffer must be already extended. Return
+        the offset right after the spec
+        '''
+        get = msg.get
+        for (st, layout, names) in self.segments:
+            if names is not None:
+                # the fast path: plain scalar values
+                try:
+                    st.pack_into(data, offset, *[get(x, 0) for x in names])
+                    offset += st.size
+                    continue
+                except struct.error:
+                    pass
+            args = []
+            for (name, idx, count) in layout:
+                if count == 0:
+                    continue
+                value = get(name, 0)
+                if type(value) in (list, tuple, set):
+                    args.extend(value)
+                elif isinstance(value, unicode):
+                    args.append(value.encode('utf-8'))
+                elif isinstance(value, float):
+                    args.append(int(value))
+                else:
+                    args.append(value)
+            try:
+                st.pack_into(data, offset, *args)
+            except struct.error:
+                log.error(''.join(traceback.format_stack()))
+                log.error(traceback.format_exc())
+                log.error("error pack: %s %s" % (st.format, args))
+                raise
+            offset += st.size
+        return offset
+
+
+def compile_struct(spec):
+    '''
+    Return the precompiled `nlmsg_codec` for a `fields` or
+    `header` spec. Specs are compiled on the first request,
+    and the cache holds the reference to the spec, so the
+    object id can not be reused while the codec is cached.
+    '''
+    codec = cache_struct.get(id(spec), None)
+    if codec is None or codec.spec is not spec:
+        codec = cache_struct[id(spec)] = nlmsg_codec(spec)
+    return codec
+
+
+class nla_encoder(object):
+    '''
+    Direct encoder for simple NLA classes.
+
+    An NLA class is simple, if it has no NLA chain, only one
+    `value` field or no fields at all, like `flag`, uses the
+    generic `setvalue()` and `getvalue()`, and either the generic
+    `encode()` or one of the atoms' `encode()` with a known value
+    conversion, see `nla_value_converters()`.
+
+    The size of such NLA is known right after the value
+    conversion, so `encode_nlas()` packs it directly into the
+    parent buffer, without creating an NLA object.
+    '''
+
+    __slots__ = ('nla_class',
+                 'convert',
+                 'kind',
+                 'struct',
+                 'r_value_map')
+
+    hdr = struct.Struct('HH')
+
+    def __init__(self, nla_class, convert):
+        self.nla_class = nla_class
+        self.convert = convert
+        self.struct = None
+        self.r_value_map = dict([(x[1], x[0]) for x
+                                 in nla_class.value_map.items()])
+        if not nla_class.fields:
+            self.kind = None
+        else:
+            fmt = nla_class.fields[0][1]
+            if fmt in ('s', 'z'):
+                self.kind = fmt
+            else:
+                self.kind = 'struct'
+                self.struct = compile_struct(nla_class.fields).segments[0][0]
+
+    def prepare(self, parent, cell, prime):
+        '''
+        Return the encoded NLA with the alignment padding as
+        bytes, or `None` if the cell must be encoded with the
+        NLA object.
+        '''
+        value = cell[1]
+        if value is None or isinstance(value, dict):
+            return None
+        try:
+            value = self.r_value_map.get(value, value)
+        except TypeError:
+            pass
+        try:
+            if self.convert is not None:
+                value = self.convert(self.nla_class, parent, value)
+                if value is NotImplemented:
+                    return None
+            if self.kind is None:
+                payload = b''
+            elif self.kind == 'struct':
+                payload = self.struct.pack(value)
+            else:
+                length = len(value) + (1 if self.kind == 'z' else 0)
+                if isinstance(value, unicode):
+                    value = value.encode('utf-8')
+                payload = struct.pack('%is' % length, value)
+        except Exception:
+            # let the NLA object report the error
+            return None
+        flags = prime['nla_flags'] | self.nla_class.nla_flags
+        if isinstance(cell, tuple) and len(cell) > 2:
+            flags |= cell[2]
+        length = len(payload) + 4
+        return b''.join((self.hdr.pack(length, prime['type'] | flags),
+                         payload,
+                         b'\0' * (((length + 4 - 1) & ~ (4 - 1)) - length)))
+
+
+def nla_value_converters():
+    '''
+    Map the atoms' `encode()` functions to the value conversion
+    they do before the generic encoding
+    '''
+    def ipXaddr(nla_class, parent, value):
+        return inet_pton(nla_class.family, value)
+
+    def ipaddr(nla_class, parent, value):
+        # use real provided family, not implicit
+        if value.find(':') > -1:
+            return inet_pton(AF_INET6, value)
+        else:
+            return inet_pton(AF_INET, value)
+
+    def target(nla_class, parent, value):
+        family = nla_class.family
+        if family is None:
+            pointer = parent
+            while pointer.parent is not None:
+                pointer = pointer.parent
+            family = pointer.get('family', AF_UNSPEC)
+        if family in (AF_INET, AF_INET6):
+            return inet_pton(family, value)
+        return NotImplemented
+
+    def l2addr(nla_class, parent, value):
+        return struct.pack('BBBBBB', *[int(i, 16) for i in value.split(':')])
+
+    def string(nla_class, parent, value):
+        if isinstance(value, str) and sys.version[0] == '3':
+            return bytes(value, 'utf-8')
+        return value
+
+    ret = {}
+    for (func, convert) in ((nlmsg_base.encode, None),
+                            (nlmsg_atoms.ipXaddr.encode, ipXaddr),
+                            (nlmsg_atoms.ipaddr.encode, ipaddr),
+                            (nlmsg_atoms.target.encode, target),
+                            (nlmsg_atoms.l2addr.encode, l2addr),
+                            (nlmsg_atoms.string.encode, string)):
+        ret[getattr(func, '__func__', func)] = convert
+    return ret
+
+
+def compile_nla_encoder(nla_class):
+    '''
+    Return the `nla_encoder` for the NLA class, or `None`
+    if the class is not simple
+    '''
+    if id(nla_class) in cache_nla_enc:
+        return cache_nla_enc[id(nla_class)]
+    if 'converters' not in cache_nla_enc:
+        cache_nla_enc['converters'] = nla_value_converters()
+    converters = cache_nla_enc['converters']
+    encoder = None
+
+    def func(obj, name):
+        method = getattr(obj, name)
+        return getattr(method, '__func__', method)
+
+    fields = nla_class.fields
+    if not nla_class.nla_map and \
+            nla_class.header == nla_base.header and \
+            func(nla_class, 'encode') in converters and \
+            all([func(nla_class, x) is func(nlmsg_base, x) for x
+                 in ('__init__', 'setvalue', 'getvalue')]) and \
+            (not fields or
+             (len(fields) == 1 and
+              fields[0][0] == 'value' and
+              (fields[0][1] in ('s', 'z') or
+               (compile_struct(fields).segments is not None and
+                len(compile_struct(fields).segments) == 1)))):
+        encoder = nla_encoder(nla_class,
+                              converters[func(nla_class, 'encode')])
+    cache_nla_enc[id(nla_class)] = encoder
+    return encoder
+
+
+class nlmsg_peek(object):
+    '''
+    Raw message filter for a dict match spec, see `_match()`
+    in `RTNL_API`: for every key the message matches, if
+    the field or the NLA with the name `name2nla(key)` is
+    equal to the value.
+
+    The filter checks the spec against the raw message data,
+    without decoding the message, and returns `False` only
+    if the decoded message would not match for sure. It reads
+    only the `fields` and the NLA chain headers, and compares
+    the NLA payload with the encoded value only for integers
+    and IP addresses, where the encoding is unambiguous; the
+    keys that can not be checked this way are just skipped.
+
+    Only messages with the generic `decode()` are supported,
+    use `compile_peek()` to get the filter or `None`.
+    '''
+
+    __slots__ = ('header_size',
+                 'codec',
+                 'checks',
+                 'nla_types')
+
+    def __init__(self, msg_class, spec):
+        self.header_size = compile_struct(msg_class.header).size
+        self.codec = compile_struct(msg_class.fields)
+        self.checks = []
+        self.nla_types = {}
+        proto = msg_class()
+        names = set([x[0] for x in msg_class.fields])
+        for (key, value) in spec.items():
+            if value is None or isinstance(value, types.FunctionType):
+                continue
+            if key not in names and (key in proto or key == 'event'):
+                # header, attrs, value etc.
+                continue
+            prime = None
+            if msg_class.nla_map and msg_class.prefix:
+                prime = proto.name2prime(proto.name2nla(key))
+            nla = None
+            if prime is not None:
+                nla = self.compile_nla(prime, value)
+                if nla is None:
+                    continue
+                self.nla_types[prime['type']] = None
+            self.checks.append((key if key in names else None,
+                                value,
+                                prime['type'] if prime else None,
+                                nla))
+
+    @staticmethod
+    def compile_nla(prime, value):
+        # -> (payload, exact) or None
+        nla_class = prime['class']
+        if isinstance(nla_class, types.FunctionType) or \
+                prime['nla_array'] or \
+                prime['init'] is not None:
+            return None
+        encoder = compile_nla_encoder(nla_class)
+        if encoder is None:
+            return None
+
+        def func(obj, name):
+            method = getattr(obj, name)
+            return getattr(method, '__func__', method)
+
+        decode = func(nla_class, 'decode')
+        try:
+            if encoder.kind == 'struct' and \
+                    encoder.convert is None and \
+                    decode is func(nlmsg_base, 'decode'):
+                value = encoder.r_value_map.get(value, value)
+                return (encoder.struct.pack(value), False)
+            elif decode is func(nlmsg_atoms.ipXaddr, 'decode'):
+                return (inet_pton(nla_class.family, value), True)
+            elif decode in (func(nlmsg_atoms.ipaddr, 'decode'),
+                            func(nlmsg_atoms.target, 'decode')):
+                if getattr(nla_class, 'family', None) is not None:
+                    return (inet_pton(nla_class.family, value), True)
+                family = AF_INET6 if value.find(':') > -1 else AF_INET
+                return (inet_pton(family, value), True)
+        except Exception:
+            pass
+        return None
+
+    def __call__(self, data, offset):
+        '''
+        Return `False` if the message at `offset` doesn't match
+        '''
+        length, = struct.unpack_from('I', data, offset)
+        fields = {}
+        position = self.codec.decode(fields,
+                                     data,
+                                     offset + self.header_size)
+        # look up the first NLA of every type, like get_attr()
+        nlas = dict(self.nla_types)
+        if nlas:
+            position = (position + 4 - 1) & ~ (4 - 1)
+            end = offset + max(length, 4)
+            left = len(nlas)
+            while left and position <= end - 4:
+                (size, nla_type) = struct.unpack_from('HH', data, position)
+                nla_type &= ~(NLA_F_NESTED | NLA_F_NET_BYTEORDER)
+                size = min(max(size, 4), end - position)
+                if nla_type in nlas and nlas[nla_type] is None:
+                    nlas[nla_type] = (position + 4, size - 4)
+                    left -= 1
+                position += (size + 4 - 1) & ~ (4 - 1)
+        for (field, value, nla_type, nla) in self.checks:
+            if field is not None and fields[field] == value:
+                continue
+            if nla is None:
+                return False
+            location = nlas[nla_type]
+            if location is None:
+                return False
+            (start, size) = location
+            (payload, exact) = nla
+            if exact and size != len(payload) and size in (4, 16):
+                # IPv4 vs IPv6
+                return False
+            if size < len(payload) or (exact and size != len(payload)):
+                # can not be decoded or compared as bytes
+                continue
+            if data[start:start + len(payload)] != payload:
+                return False
+        return True
+
+
+def compile_peek(msg_class, spec):
+    '''
+    Return the `nlmsg_peek` filter for the message class and
+    the match spec, or `None` if the class is not supported
+    '''
+    def func(obj, name):
+        method = getattr(obj, name)
+        return getattr(method, '__func__', method)
+
+    if not isinstance(spec, dict) or \
+            func(msg_class, 'decode') is not func(nlmsg_base, 'decode') or \
+            msg_class.pack is not None or \
+            (msg_class.fields and msg_class.fields[0][1] in ('s', 'z')) or \
+            compile_struct(msg_class.header).segments is None or \
+            compile_struct(msg_class.fields).segments is None:
+        return None
+    peek = nlmsg_peek(msg_class, spec)
+    if not peek.checks:
+        return None
+    return peek
 
 
 class nlmsg_base(dict):
@@ -615,6 +1108,7 @@ class nlmsg_base(dict):
         "_nla_init",
         "_nla_array",
         "_nla_flags",
+        "_nla_index",
         "value",
         "_ft_decode",
         "_r_value_map",
@@ -648,7 +1142,8 @@ class nlmsg_base(dict):
         self._nla_init = init
         self._nla_array = False
         self._nla_flags = self.nla_flags
-        self['attrs'] = []
+        self._nla_index = None
+        self['attrs'] = nla_chain()
         self['value'] = NotInitialized
         self.value = NotInitialized
         # work only on non-empty mappings
@@ -719,6 +1214,11 @@ class nlmsg_base(dict):
         return ret
 
     def reset(self, buf=None):
+        # the lazy NLA slots read the current buffer, so create
+        # the NLA objects prior to dropping it
+        for cell in self.get('attrs', ()):
+            if isinstance(cell, nla_slot):
+                cell.get_nla()
         self.data = bytearray()
         self.offset = 0
         self.decoded = False
@@ -867,6 +1367,9 @@ class nlmsg_base(dict):
 
     @classmethod
     def get_size(self):
+        codec = compile_struct(self.fields)
+        if codec.segments is not None:
+            return codec.size
         size = 0
         for field in self.fields:
             size += struct.calcsize(field[1])
@@ -897,6 +1400,12 @@ class nlmsg_base(dict):
             name = "%s%s" % (self.prefix, name)
         return name
 
+    def name2prime(self, name):
+        '''
+        Return the `nla_map` entry for the NLA name, or `None`
+        '''
+        return (self.__class__.__r_nla_map or {}).get(name)
+
     def decode(self):
         '''
         Decode the message. The message should have the `buf`
@@ -952,11 +1461,9 @@ class nlmsg_base(dict):
                 offset += 4
                 self.length = self['header']['length']
             else:
-                for name, fmt in self.header:
-                    self['header'][name] = struct.unpack_from(fmt,
-                                                              self.data,
-                                                              offset)[0]
-                    offset += struct.calcsize(fmt)
+                offset = compile_struct(self.header).decode(self['header'],
+                                                            self.data,
+                                                            offset)
                 # update length from header
                 # it can not be less than 4
                 if 'header' in self:
@@ -1001,9 +1508,9 @@ class nlmsg_base(dict):
         diff = 0
         # reserve space for the header
         if self.header is not None:
-            hsize = struct.calcsize(''.join([x[1] for x in self.header]))
-            self.data.extend([0] * hsize)
-            offset += hsize
+            hcodec = compile_struct(self.header)
+            self.data.extend(bytearray(hcodec.size))
+            offset += hcodec.size
 
         # handle the array case
         if self._nla_array:
@@ -1022,50 +1529,55 @@ class nlmsg_base(dict):
                 cell.encode()
                 offset += (cell.length + 4 - 1) & ~ (4 - 1)
         elif self.getvalue() is not None:
-            for name, fmt in self.fields:
-                value = self[name]
-
-                if fmt == 's':
-                    length = len(value)
-                    efmt = '%is' % (length)
-                elif fmt == 'z':
-                    length = len(value) + 1
-                    efmt = '%is' % (length)
-                else:
-                    length = struct.calcsize(fmt)
-                    efmt = fmt
-
-                self.data.extend([0] * length)
-
-                # in python3 we should force it
-                if sys.version[0] == '3':
-                    if isinstance(value, str):
-                        value = bytes(value, 'utf-8')
-                    elif isinstance(value, float):
-                        value = int(value)
-                elif sys.version[0] == '2':
-                    if isinstance(value, unicode):
-                        value = value.encode('utf-8')
-
-                try:
-                    if fmt[-1] == 'x':
-                        struct.pack_into(efmt, self.data, offset)
-                    elif type(value) in (list, tuple, set):
-                        struct.pack_into(efmt, self.data, offset, *value)
+            codec = compile_struct(self.fields)
+            if codec.segments is not None:
+                self.data.extend(bytearray(codec.size))
+                offset = codec.encode(self, self.data, offset)
+            else:
+                for name, fmt in self.fields:
+                    value = self[name]
+
+                    if fmt == 's':
+                        length = len(value)
+                        efmt = '%is' % (length)
+                    elif fmt == 'z':
+                        length = len(value) + 1
+                        efmt = '%is' % (length)
                     else:
-                        struct.pack_into(efmt, self.data, offset, value)
-                except struct.error:
-                    log.error(''.join(traceback.format_stack()))
-                    log.error(traceback.format_exc())
-                    log.error("error pack: %s %s %s" %
-                              (efmt, value, type(value)))
-                    raise
+                        length = struct.calcsize(fmt)
+                        efmt = fmt
+
+                    self.data.extend(bytearray(length))
+
+                    # in python3 we should force it
+                    if sys.version[0] == '3':
+                        if isinstance(value, str):
+                            value = bytes(value, 'utf-8')
+                        elif isinstance(value, float):
+                            value = int(value)
+                    elif sys.version[0] == '2':
+                        if isinstance(value, unicode):
+                            value = value.encode('utf-8')
+
+                    try:
+                        if fmt[-1] == 'x':
+                            struct.pack_into(efmt, self.data, offset)
+                        elif type(value) in (list, tuple, set):
+                            struct.pack_into(efmt, self.data, offset, *value)
+                        else:
+                            struct.pack_into(efmt, self.data, offset, value)
+                    except struct.error:
+                        log.error(''.join(traceback.format_stack()))
+                        log.error(traceback.format_exc())
+                        log.error("error pack: %s %s %s" %
+                                  (efmt, value, type(value)))
+                        raise
 
-                offset += length
+                    offset += length
 
             diff = ((offset + 4 - 1) & ~ (4 - 1)) - offset
             offset += diff
-            self.data.extend([0] * diff)
+            self.data.extend(bytearray(diff))
         # write NLA chain
         if self.nla_map:
             offset = self.encode_nlas(offset)
@@ -1074,19 +1586,13 @@ class nlmsg_base(dict):
             self.length = self['header']['length'] = (offset -
                                                       self.offset -
                                                       diff)
-            offset = self.offset
-            for name, fmt in self.header:
-                struct.pack_into(fmt,
-                                 self.data,
-                                 offset,
-                                 self['header'].get(name, 0))
-                offset += struct.calcsize(fmt)
+            hcodec.encode(self['header'], self.data, self.offset)
 
     def setvalue(self, value):
         if isinstance(value, dict):
             self.update(value)
             if 'attrs' in value:
-                self['attrs'] = []
+                self['attrs'] = nla_chain()
                 for nla in value['attrs']:
                     nlv = nlmsg_base()
                     nlv.setvalue(nla[1])
@@ -1135,8 +1641,28 @@ class nlmsg_base(dict):
     def get_attrs(self, attr):
         '''
         Return attrs by name or an empty list
+
+        The decoded chains, see `nla_chain`, are indexed by
+        name; other lists, set by the user, are scanned.
         '''
-        return [i[1] for i in self['attrs'] if i[0] == attr]
+        attrs = self['attrs']
+        if not isinstance(attrs, nla_chain):
+            return [i[1] for i in attrs if i[0] == attr]
+        index = self._nla_index
+        if index is None or index[0] is not attrs or \
+                index[1] != attrs.version:
+            index = self._nla_index = (attrs, attrs.version, {})
+            for (idx, cell) in enumerate(attrs):
+                index[2].setdefault(cell[0], []).append(idx)
+        ret = []
+        for idx in index[2].get(attr, ()):
+            cell = attrs[idx]
+            if cell[0] != attr:
+                # a cell is changed in place, rebuild the index
+                self._nla_index = None
+                return self.get_attrs(attr)
+            ret.append(cell[1])
+        return ret
 
     def __setstate__(self, state):
         return self.load(state)
@@ -1224,16 +1750,8 @@ class nlmsg_base(dict):
 
     @staticmethod
     def _ft_decode_packed(self, offset):
-        names = []
-        fmt = ''
-        for field in self.fields:
-            names.append(field[0])
-            fmt += field[1]
-        value = struct.unpack_from(fmt, self.data, offset)
-        values = list(value)
-        for name in names:
-            if name[0] != '_':
-                self[name] = values.pop(0)
+        st, names = compile_struct(self.fields).packed
+        self.update(zip(names, st.unpack_from(self.data, offset)))
         # read NLA chain
         if self.nla_map:
             offset = (offset + 4 - 1) & ~ (4 - 1)
@@ -1250,23 +1768,27 @@ class nlmsg_base(dict):
     @staticmethod
     def _ft_decode_generic(self, offset):
         global cache_fmt
-        for name, fmt in self.fields:
-            ##
-            # ~~ size = struct.calcsize(efmt)
-            #
-            # The use of the cache gives here a tiny performance
-            # improvement, but it is an improvement anyways
-            #
-            size = cache_fmt.get(fmt, None) or \
-                cache_fmt.__setitem__(fmt, struct.calcsize(fmt)) or \
-                cache_fmt[fmt]
-            ##
-            value = struct.unpack_from(fmt, self.data, offset)
-            offset += size
-            if len(value) == 1:
-                self[name] = value[0]
-            else:
-                self[name] = value
+        codec = compile_struct(self.fields)
+        if codec.segments is not None:
+            offset = codec.decode(self, self.data, offset)
+        else:
+            for name, fmt in self.fields:
+                ##
+                # ~~ size = struct.calcsize(efmt)
+                #
+                # The use of the cache gives here a tiny performance
+                # improvement, but it is an improvement anyways
+                #
+                size = cache_fmt.get(fmt, None) or \
+                    cache_fmt.__setitem__(fmt, struct.calcsize(fmt)) or \
+                    cache_fmt[fmt]
+                ##
+                value = struct.unpack_from(fmt, self.data, offset)
+                offset += size
+                if len(value) == 1:
+                    self[name] = value[0]
+                else:
+                    self[name] = value
         # read NLA chain
         if self.nla_map:
             offset = (offset + 4 - 1) & ~ (4 - 1)
@@ -1354,8 +1876,13 @@ class nlmsg_base(dict):
         '''
         Encode the NLA chain. Should not be called manually, since
         it is called from `encode()` routine.
+
+        Simple NLA, see `nla_encoder`, are sized and packed
+        without NLA objects; a run of such NLA extends the
+        buffer only once.
         '''
         r_nla_map = self.__class__.__r_nla_map
+        run = []
         for i in range(len(self['attrs'])):
             cell = self['attrs'][i]
             if cell[0] in r_nla_map:
@@ -1365,6 +1892,19 @@ class nlmsg_base(dict):
                 if isinstance(msg_class, types.FunctionType):
                     # if it is a function -- use it to get the class
                     msg_class = msg_class(self)
+                # try to encode NLA directly
+                if not prime['nla_array'] and prime['init'] is None:
+                    encoder = compile_nla_encoder(msg_class)
+                    if encoder is not None:
+                        chunk = encoder.prepare(self, cell, prime)
+                        if chunk is not None:
+                            run.append(chunk)
+                            continue
+                if run:
+                    chunk = b''.join(run)
+                    self.data.extend(chunk)
+                    offset += len(chunk)
+                    run = []
                 # encode NLA
                 nla = msg_class(data=self.data,
                                 offset=offset,
@@ -1384,16 +1924,22 @@ class nlmsg_base(dict):
                     nla.decoded = True
                     self['attrs'][i] = nla_slot(prime['name'], nla)
                 offset += (nla.length + 4 - 1) & ~ (4 - 1)
+        if run:
+            chunk = b''.join(run)
+            self.data.extend(chunk)
+            offset += len(chunk)
         return offset
 
     def decode_nlas(self, offset):
         '''
         Decode the NLA chain. Should not be called manually, since
         it is called from `decode()` routine.
+
+        Only NLA headers are parsed here, see `nla_slot`.
         '''
         t_nla_map = self.__class__.__t_nla_map
+        attrs = self['attrs']
         while offset - self.offset <= self.length - 4:
-            nla = None
             # pick the length and the type
             (length, base_msg_type) = struct.unpack_from('HH', self.data,
                                                          offset)
@@ -1402,49 +1948,125 @@ class nlmsg_base(dict):
             # rewind to the beginning
             length = min(max(length, 4), (self.length - offset + self.offset))
             # we have a mapping for this NLA
-            if msg_type in t_nla_map:
+            prime = t_nla_map.get(msg_type, None)
+            slot = nla_slot(prime['name'] if prime else 'UNKNOWN',
+                            None,
+                            (self,
+                             prime,
+                             offset,
+                             length,
+                             base_msg_type & (NLA_F_NESTED |
+                                              NLA_F_NET_BYTEORDER)))
+            if not config.nla_lazy:
+                slot.get_nla()
+            list.append(attrs, slot)
+            offset += (length + 4 - 1) & ~ (4 - 1)
+        if isinstance(attrs, nla_chain):
+            attrs.version += 1
 
-                prime = t_nla_map[msg_type]
-                # get the class
-                msg_class = t_nla_map[msg_type]['class']
-                # is it a class or a function?
-                if isinstance(msg_class, types.FunctionType):
-                    # if it is a function -- use it to get the class
-                    msg_class = msg_class(self,
-                                          data=self.data,
-                                          offset=offset)
-                # decode NLA
-                nla = msg_class(data=self.data,
-                                offset=offset,
-                                parent=self,
-                                length=length,
-                                init=prime['init'])
-                nla._nla_array = prime['nla_array']
-                nla._nla_flags = base_msg_type & (NLA_F_NESTED |
-                                                  NLA_F_NET_BYTEORDER)
-                name = prime['name']
-            else:
-                name = 'UNKNOWN'
-                nla = nla_base(data=self.data,
-                               offset=offset,
-                               length=length)
+    def make_nla(self, prime, offset, length, flags):
+        '''
+        Create an NLA object from the chain. Should not be called
+        manually, since it is called from `nla_slot`.
+        '''
+        if prime is None:
+            return nla_base(data=self.data,
+                            offset=offset,
+                            length=length)
+        # get the class
+        msg_class = prime['class']
+        # is it a class or a function?
+        if isinstance(msg_class, types.FunctionType):
+            # if it is a function -- use it to get the class
+            msg_class = msg_class(self,
+                                  data=self.data,
+                                  offset=offset)
+        # decode NLA
+        nla = msg_class(data=self.data,
+                        offset=offset,
+                        parent=self,
+                        length=length,
+                        init=prime['init'])
+        nla._nla_array = prime['nla_array']
+        nla._nla_flags = flags
+        return nla
+
+
+class nla_chain(list):
+    '''
+    The NLA chain, `msg['attrs']`: a list, that counts the
+    changes in the `version` attribute, so `get_attrs()`
+    knows when to rebuild the name index.
+    '''
 
-            self['attrs'].append(nla_slot(name, nla))
-            offset += (length + 4 - 1) & ~ (4 - 1)
+    __slots__ = ('version', )
+
+    def __init__(self, *argv):
+        list.__init__(self, *argv)
+        self.version = 0
+
+    def __reduce_ex__(self, protocol):
+        return (nla_chain, (list(self), ))
+
+    def changed(method):
+        def wrapper(self, *argv, **kwarg):
+            self.version += 1
+            return method(self, *argv, **kwarg)
+        wrapper.__name__ = method.__name__
+        return wrapper
+
+    __setitem__ = changed(list.__setitem__)
+    __delitem__ = changed(list.__delitem__)
+    __iadd__ = changed(list.__iadd__)
+    __imul__ = changed(list.__imul__)
+    append = changed(list.append)
+    extend = changed(list.extend)
+    insert = changed(list.insert)
+    pop = changed(list.pop)
+    remove = changed(list.remove)
+    sort = changed(list.sort)
+    reverse = changed(list.reverse)
+    if hasattr(list, 'clear'):
+        clear = changed(list.clear)
+    if hasattr(list, '__setslice__'):
+        __setslice__ = changed(list.__setslice__)
+        __delslice__ = changed(list.__delslice__)
+    del changed
 
 
 class nla_slot(object):
+    '''
+    An element of the decoded NLA chain, `(name, value)`.
+
+    The decoder creates slots with only the NLA location
+    in the `src` attribute: `(parent, prime, offset, length,
+    flags)`. The NLA object is created with the parent's
+    `make_nla()` on the first `get_nla()` call, and decoded
+    on the first value access. The slot references the
+    parent until then, so the chain remains readable even
+    if the message itself is not referenced anymore.
+    '''
 
     __slots__ = (
         "cell",
+        "src",
     )
 
-    def __init__(self, name, value):
+    def __init__(self, name, value, src=None):
         self.cell = (name, value)
+        self.src = src
+
+    def get_nla(self):
+        if self.src is not None:
+            (parent, prime, offset, length, flags) = self.src
+            self.cell = (self.cell[0],
+                         parent.make_nla(prime, offset, length, flags))
+            self.src = None
+        return self.cell[1]
 
     def try_to_decode(self):
         try:
-            cell = self.cell[1]
+            cell = self.get_nla()
             if not cell.decoded:
                 cell.decode()
             return True
@@ -1454,10 +2076,13 @@ class nla_slot(object):
             return False
 
     def get_value(self):
-        cell = self.cell[1]
         if self.try_to_decode():
-            return cell.getvalue()
+            return self.cell[1].getvalue()
+        elif self.src is not None:
+            (parent, prime, offset, length, flags) = self.src
+            return parent.data[offset:offset + length]
         else:
+            cell = self.cell[1]
             return cell.data[cell.offset:cell.offset + cell.length]
 
     def get_flags(self):
@@ -1471,10 +2096,7 @@ class nla_slot(object):
         elif key == 0:
             return self.cell[0]
         elif isinstance(key, slice):
-            s = list(self.cell.__getitem__(key))
-            if self.cell[1] in s:
-                s[s.index(self.cell[1])] = self.get_value()
-            return s
+            return list((self.cell[0], self.get_value())[key])
         else:
             raise IndexError(key)
 
@@ -0,0 +1,362 @@
+'''
+asyncio netlink socket
+======================
+
+`AsyncNetlinkSocket` is a netlink socket for asyncio based
+programs. It uses neither threads nor the `get()` locking
+machinery: the socket is non-blocking, and the event loop
+calls the reader as soon as the data arrives::
+
+    +-------------+   put()   +--------+
+    | nlm_request | --------> | kernel |
+    +-------------+           +--------+
+          ^                       |
+          | future[seq]           |
+          |                       v
+    +-------------+   parse   +---------------+
+    | dispatch    | <-------- | loop reader   |
+    +-------------+           +---------------+
+          |
+          v
+    async for msg in socket  -- broadcast messages
+
+Every `nlm_request()` registers a future for its sequence
+number; the reader parses the data and routes the response
+messages to the futures, and all the rest, broadcast messages,
+to the queue that one can read with `async for`::
+
+    async def main():
+        ipr = AsyncIPRoute()
+        ipr.bind()
+        print(await ipr.get_links())
+        async for msg in ipr:
+            print(msg)
+
+The module requires Python 3.5+.
+'''
+import errno
+import asyncio
+import logging
+import traceback
+
+from pyroute2.common import DEFAULT_RCVBUF
+from pyroute2.netlink import nlmsg
+from pyroute2.netlink import NLMSG_DONE
+from pyroute2.netlink import NLMSG_ERROR
+from pyroute2.netlink import NLMSG_OVERRUN
+from pyroute2.netlink import NLM_F_DUMP
+from pyroute2.netlink import NLM_F_MULTI
+from pyroute2.netlink import NLM_F_REQUEST
+from pyroute2.netlink import NLM_F_ACK
+from pyroute2.netlink.nlsocket import NetlinkSocket
+from pyroute2.netlink.nlsocket import compile_match
+from pyroute2.netlink.exceptions import NetlinkError
+
+log = logging.getLogger(__name__)
+
+
+class AsyncRequest(object):
+    '''
+    A pending request: the future and the collected response
+    '''
+
+    __slots__ = ('future',
+                 'msgs',
+                 'terminate',
+                 'callback',
+                 'match')
+
+    def __init__(self, future, terminate, callback, match):
+        self.future = future
+        self.msgs = []
+        self.terminate = terminate
+        self.callback = callback
+        self.match = match
+
+    def feed(self, msg):
+        '''
+        Add the message to the response, return True when
+        the response is complete; the same terminator rules
+        as in `NetlinkMixin.get()`
+        '''
+        if self.callback is not None and self.callback(msg):
+            return False
+        error = msg['header'].get('error', None)
+        if error is not None:
+            self.set_exception(error)
+            return True
+        tmsg = None
+        if self.terminate is not None:
+            tmsg = self.terminate(msg)
+            if isinstance(tmsg, nlmsg):
+                self.append(msg)
+        if msg['header']['type'] == NLMSG_DONE or tmsg:
+            self.set_result()
+            return True
+        self.append(msg)
+        if not msg['header']['flags'] & NLM_F_MULTI:
+            self.set_result()
+            return True
+        return False
+
+    def append(self, msg):
+        if self.match is None or self.match(msg):
+            self.msgs.append(msg)
+
+    def set_result(self):
+        if not self.future.done():
+            self.future.set_result(self.msgs)
+
+    def set_exception(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+class AsyncNetlinkSocket(NetlinkSocket):
+    '''
+    Netlink socket for asyncio, see the module description.
+
+    The event loop is the current one, unless `loop` attribute
+    is set prior to `bind()` or the first request. The number
+    of queued broadcast messages is not limited.
+
+    With `bind(overrun='event')` ENOBUFS puts the `NLMSG_OVERRUN`
+    message into the broadcast queue; 'resync' works the same
+    way, the program should run the dumps itself.
+
+    The reader handles up to `read_limit` datagrams per call,
+    so a busy socket doesn't starve other loop callbacks.
+    '''
+    read_limit = 64
+
+    def __init__(self, *argv, **kwarg):
+        self.loop = kwarg.pop('loop', None)
+        self.requests = {}
+        self.events = None
+        self.reader = None
+        self.dump_lock = None
+        super(AsyncNetlinkSocket, self).__init__(*argv, **kwarg)
+        # `NetlinkMixin` wraps `nlm_request()` and `get()` to
+        # return tuples, if `config.nlm_generator` is False --
+        # it doesn't work with coroutines
+        self.__dict__.pop('nlm_request', None)
+        self.__dict__.pop('get', None)
+
+    def attach(self):
+        '''
+        Register the socket reader in the event loop. It is
+        called automatically; the socket can be recreated by
+        `bind()`, so the reader follows the current fd.
+        '''
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        fd = self._sock.fileno()
+        if self.reader == fd:
+            return
+        self.detach()
+        self._sock.setblocking(False)
+        self.loop.add_reader(fd, self.read)
+        self.reader = fd
+
+    def queue(self):
+        '''
+        The broadcast queue. It is created by the loop callbacks
+        and coroutines only, so it is bound to the running loop
+        on any Python version.
+        '''
+        if self.events is None:
+            self.events = asyncio.Queue()
+        return self.events
+
+    def detach(self):
+        if self.reader is not None:
+            self.loop.remove_reader(self.reader)
+            self.reader = None
+
+    def bind(self, groups=0, pid=None, **kwarg):
+        '''
+        The same as `NetlinkSocket.bind()`, the async cache
+        is not supported
+        '''
+        self.detach()
+        kwarg.pop('async_cache', None)
+        kwarg.pop('async', None)
+        super(AsyncNetlinkSocket, self).bind(groups, pid, **kwarg)
+        self.attach()
+
+    def read(self):
+        '''
+        The event loop reader: receive and dispatch the data
+        until the socket is empty, but not more than `read_limit`
+        datagrams; the loop calls it again for the rest
+        '''
+        for _ in range(self.read_limit):
+            try:
+                data = self.recv_ft(DEFAULT_RCVBUF)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # ENOBUFS etc. -- fail the pending requests,
+                # they can not be completed anymore
+                for request in tuple(self.requests.values()):
+                    request.set_exception(e)
+                if e.errno != errno.ENOBUFS:
+                    log.error('netlink read error: %s' % (e, ))
+                    self.detach()
+                    return
+                # no resync dumps here, they are coroutines
+                event = self.overrun_event()
+                if self.overrun is not None:
+                    self.queue().put_nowait(event)
+                return
+            # only one request pending -- can filter it
+            # prior to decoding
+            seq = match = None
+            if len(self.requests) == 1 and not self.callbacks:
+                seq, request = tuple(self.requests.items())[0]
+                match = request.match
+            try:
+                msgs = self.marshal.parse(data, seq, None, match)
+            finally:
+                self.buffer_ring.release(data)
+            self.dispatch(msgs)
+
+    def dispatch(self, msgs):
+        '''
+        Route the messages to the pending requests or to the
+        broadcast queue
+        '''
+        for msg in msgs:
+            seq = msg['header']['sequence_number']
+            if msg['header']['type'] == NLMSG_OVERRUN:
+                self.overrun_event(msg)
+            for cr in self.callbacks:
+                try:
+                    if cr[0](msg):
+                        cr[1](msg, *cr[2])
+                except Exception:
+                    log.warning("Callback fail: %s" % (cr))
+                    log.warning(traceback.format_exc())
+            request = self.requests.get(seq)
+            if request is not None:
+                if request.feed(msg):
+                    del self.requests[seq]
+            elif msg['header']['type'] != NLMSG_ERROR:
+                # drop orphaned NLMSG_ERROR messages
+                self.queue().put_nowait(msg)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and (self.events is None or self.events.empty()):
+            raise StopAsyncIteration()
+        if not self.closed:
+            self.attach()
+        msg = await self.queue().get()
+        if msg is None:
+            raise StopAsyncIteration()
+        return msg
+
+    async def nlm_request(self, msg, msg_type,
+                          msg_flags=NLM_F_REQUEST | NLM_F_DUMP,
+                          terminate=None,
+                          callback=None,
+                          strict=False,
+                          match=None):
+        '''
+        Send the request, return the list of the response
+        messages. The parameters are the same as for
+        `NetlinkMixin.nlm_request()`.
+
+        The kernel runs only one dump per socket at once, and
+        returns EBUSY for other dump requests, so the dumps are
+        serialized; other requests are not.
+        '''
+        self.attach()
+        # NLM_F_DUMP shares bits with NLM_F_EXCL and NLM_F_REPLACE
+        if (msg_flags & NLM_F_DUMP) == NLM_F_DUMP:
+            if self.dump_lock is None:
+                self.dump_lock = asyncio.Lock()
+            async with self.dump_lock:
+                return await self.request(msg, msg_type, msg_flags,
+                                          terminate, callback,
+                                          strict, match)
+        return await self.request(msg, msg_type, msg_flags,
+                                  terminate, callback,
+                                  strict, match)
+
+    async def request(self, msg, msg_type, msg_flags,
+                      terminate, callback, strict, match):
+        if match is not None:
+            match = compile_match(match)
+        msg_seq = self.addr_pool.alloc()
+        request = AsyncRequest(self.loop.create_future(),
+                               terminate,
+                               callback,
+                               match)
+        self.requests[msg_seq] = request
+        try:
+            self.put(msg, msg_type, msg_flags,
+                     msg_seq=msg_seq,
+                     strict=strict)
+            # the netlink proxy can return the response
+            # right away, see `IPRSocketMixin._gate()`
+            if self.backlog.get(msg_seq):
+                self.dispatch(self.backlog.pop(msg_seq))
+            return await asyncio.wait_for(request.future,
+                                          self.get_timeout)
+        finally:
+            self.requests.pop(msg_seq, None)
+            self.backlog.pop(msg_seq, None)
+            # see `NetlinkMixin.nlm_request()` for the ban
+            self.addr_pool.free(msg_seq, ban=0xff)
+
+    async def nlm_request_batch(self, msgs, msg_type,
+                                msg_flags=NLM_F_REQUEST | NLM_F_ACK,
+                                size=65536,
+                                copy=False,
+                                window=None):
+        '''
+        Send the requests packed into datagrams, return the list
+        of the results; the parameters are the same as for
+        `NetlinkMixin.nlm_request_batch()`
+        '''
+        self.attach()
+        ret = []
+        for (batch, seqs) in self.batch_pack(msgs, msg_type,
+                                             msg_flags, size, copy,
+                                             window):
+            requests = []
+            for msg_seq in seqs:
+                self.backlog.pop(msg_seq, None)
+                request = AsyncRequest(self.loop.create_future(),
+                                       None, None, None)
+                self.requests[msg_seq] = request
+                requests.append(request)
+            try:
+                self.batch_send(batch)
+                for request in requests:
+                    try:
+                        ret.append(tuple(await asyncio.wait_for(
+                            request.future, self.get_timeout)))
+                    except NetlinkError as e:
+                        ret.append(e)
+            finally:
+                for msg_seq in seqs:
+                    self.requests.pop(msg_seq, None)
+                    self.backlog.pop(msg_seq, None)
+                    self.addr_pool.free(msg_seq, ban=0xff)
+        return ret
+
+    def close(self):
+        if self.closed:
+            return
+        self.detach()
+        for request in tuple(self.requests.values()):
+            request.set_exception(OSError(errno.EBADF, 'socket closed'))
+        self.requests = {}
+        super(AsyncNetlinkSocket, self).close()
+        # wake up `async for` readers
+        if self.events is not None:
+            self.events.put_nowait(None)
@@ -0,0 +1,217 @@
+'''
+Classic BPF filters
+===================
+
+The kernel runs the socket filter for every datagram prior
+to queueing it to the socket, so the messages that the program
+doesn't want are dropped without copying them to the userspace
+and without decoding.
+
+`compile_bpf()` returns the `SO_ATTACH_FILTER` option value
+for the raw BPF code, a list of `[code, jt, jf, k]`. For the
+netlink sockets `NetlinkFilter` builds the code from a
+declarative spec, see `NetlinkSocket.attach_filter()`::
+
+    from pyroute2 import IPRoute
+    from pyroute2.netlink.rtnl import RTM_NEWLINK
+    from pyroute2.netlink.rtnl import RTM_DELLINK
+    from pyroute2.netlink.rtnl import RTM_NEWROUTE
+
+    ipr = IPRoute()
+    ipr.bind()
+    ipr.attach_filter([{'header': {'type': (RTM_NEWLINK, RTM_DELLINK)},
+                        'index': (2, 3)},
+                       {'header': {'type': RTM_NEWROUTE},
+                        'table': 254}])
+
+The spec is a dict or a list of dicts, and a message passes the
+filter, if it matches any of the dicts. A dict matches, if every
+field is equal to the value, or to one of the values, if the
+value is a tuple, a list or a set. The `header` dict refers to
+the `nlmsghdr` fields: `type`, `flags`, `sequence_number`, `pid`;
+other keys -- to the fixed fields of the message class, like
+`index` in `ifinfmsg` or `table` in `rtmsg`, so the `header`
+dict must list the message types to resolve them. Only integer
+fields are supported; NLA can not be checked with classic BPF.
+
+The filter sees only the first message of a datagram. That's
+fine for the broadcasts, since the kernel sends every event
+in a separate datagram, but the responses contain many messages,
+so all the messages sent to the socket port id are accepted.
+This includes also the broadcasts caused by the socket's own
+requests.
+'''
+import struct
+from ctypes import Structure
+from ctypes import addressof
+from ctypes import string_at
+from ctypes import sizeof
+from ctypes import c_ushort
+from ctypes import c_ubyte
+from ctypes import c_uint
+from ctypes import c_void_p
+from pyroute2.netlink import nlmsg
+
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+
+# instruction classes and modes
+BPF_LD = 0x00
+BPF_JMP = 0x05
+BPF_RET = 0x06
+BPF_W = 0x00
+BPF_H = 0x08
+BPF_B = 0x10
+BPF_ABS = 0x20
+BPF_JEQ = 0x10
+BPF_K = 0x00
+
+BPF_ACCEPT = 0xffffffff
+BPF_DROP = 0
+
+
+class sock_filter(Structure):
+    _fields_ = [('code', c_ushort),  # u16
+                ('jt', c_ubyte),     # u8
+                ('jf', c_ubyte),     # u8
+                ('k', c_uint)]       # u32
+
+
+class sock_fprog(Structure):
+    _fields_ = [('len', c_ushort),
+                ('filter', c_void_p)]
+
+
+def compile_bpf(code):
+    ProgramType = sock_filter * len(code)
+    program = ProgramType(*[sock_filter(*line) for line in code])
+    sfp = sock_fprog(len(code), addressof(program[0]))
+    return string_at(addressof(sfp), sizeof(sfp)), program
+
+
+class NetlinkFilter(object):
+    '''
+    Compile a declarative netlink filter spec into classic BPF
+    code, see the module description.
+
+        - spec -- a dict or a list of dicts
+        - msg_map -- message type to message class, usually
+          `marshal.msg_map` of the socket
+        - portid -- accept all the messages with this `pid`
+    '''
+
+    header_offset = 16
+    load_size = {1: BPF_B, 2: BPF_H, 4: BPF_W}
+
+    def __init__(self, spec, msg_map=None, portid=None):
+        self.msg_map = msg_map or {}
+        self.portid = portid
+        if isinstance(spec, dict):
+            spec = [spec]
+        self.spec = list(spec)
+        self.code = self.compile()
+
+    @staticmethod
+    def layout(fields, base=0):
+        # name -> (offset, size, fmt); netlink structures are
+        # packed field by field, with explicit pads
+        ret = {}
+        offset = base
+        for (name, fmt) in fields:
+            if fmt[0] in '@=<>!':
+                order, body = fmt[0], fmt[1:]
+            else:
+                order, body = '=', fmt
+            size = struct.calcsize('=' + body)
+            if order in '@=':
+                order = '='
+            elif order == '!':
+                order = '>'
+            ret[name] = (offset, size, order + body)
+            offset += size
+        return ret
+
+    def k(self, fmt, value):
+        # BPF loads the words in the network byte order
+        size = struct.calcsize(fmt)
+        raw = struct.pack(fmt, value)
+        return struct.unpack('>' + {1: 'B', 2: 'H', 4: 'I'}[size], raw)[0]
+
+    def checks(self, spec):
+        # -> [(offset, size, (k, ...)), ...]
+        ret = []
+        header = spec.get('header', {})
+        hlayout = self.layout(nlmsg.header)
+        for (name, value) in header.items():
+            if name not in hlayout:
+                raise KeyError('unknown header field %s' % name)
+            ret.append((name, hlayout[name], value))
+        fields = [x for x in spec.items() if x[0] != 'header']
+        if fields:
+            types = header.get('type')
+            if types is None:
+                raise ValueError('header type is required to '
+                                 'check the message fields')
+            if not isinstance(types, (tuple, list, set)):
+                types = (types, )
+            layouts = [self.layout(self.msg_map.get(x, nlmsg).fields,
+                                   self.header_offset) for x in types]
+            for (name, value) in fields:
+                slots = set([x.get(name) for x in layouts])
+                if len(slots) != 1 or None in slots:
+                    raise KeyError('field %s is not the same in all '
+                                   'the message types' % name)
+                ret.append((name, slots.pop(), value))
+        code = []
+        for (name, (offset, size, fmt), value) in ret:
+            if fmt[1:] not in ('b', 'B', 'h', 'H', 'i', 'I'):
+                raise TypeError('field %s is not an integer' % name)
+            if not isinstance(value, (tuple, list, set)):
+                value = (value, )
+            code.append((offset, size, tuple([self.k(fmt, x)
+                                              for x in value])))
+        return code
+
+    def compile(self):
+        # the program is a list of instructions (opcode, jt, jf, k)
+        # and labels; jt and jf are labels or None for the next
+        # instruction, the labels are resolved at the end
+        prog = []
+        if self.portid is not None:
+            prog.append((BPF_LD | BPF_W | BPF_ABS, None, None, 12))
+            prog.append((BPF_JMP | BPF_JEQ | BPF_K, 'accept', None,
+                         self.k('=I', self.portid)))
+        for (idx, spec) in enumerate(self.spec):
+            fail = 'fail%i' % idx
+            for (cidx, (offset, size, values)) in \
+                    enumerate(self.checks(spec)):
+                match = 'match%i.%i' % (idx, cidx)
+                prog.append((BPF_LD | self.load_size[size] | BPF_ABS,
+                             None, None, offset))
+                for (vidx, value) in enumerate(values):
+                    last = vidx == len(values) - 1
+                    prog.append((BPF_JMP | BPF_JEQ | BPF_K,
+                                 match,
+                                 fail if last else None,
+                                 value))
+                prog.append(match)
+            prog.append((BPF_RET | BPF_K, None, None, BPF_ACCEPT))
+            prog.append(fail)
+        prog.append((BPF_RET | BPF_K, None, None, BPF_DROP))
+        prog.append('accept')
+        prog.append((BPF_RET | BPF_K, None, None, BPF_ACCEPT))
+        # labels -> instruction positions
+        labels = {}
+        code = []
+        for line in prog:
+            if isinstance(line, str):
+                labels[line] = len(code)
+            else:
+                code.append(line)
+        ret = []
+        for (pos, (opcode, jt, jf, k)) in enumerate(code):
+            jumps = [labels[x] - pos - 1 if x else 0 for x in (jt, jf)]
+            if max(jumps) > 255:
+                raise ValueError('the filter is too big')
+            ret.append([opcode, jumps[0], jumps[1], k])
+        return ret
@@ -62,6 +62,34 @@ broadcast storm will be over, and then the CPU will be
 100% loaded with the parser for some time, when it will
 process all the messages queued so far.
 
+overrun detection
+-----------------
+
+The kernel doesn't block on a full socket buffer: it drops the
+broadcast messages and reports ENOBUFS on the next `recv()`, so
+a monitoring program loses the events and its view of the
+system state diverges. By default `get()` raises the error, as
+any other socket error. With `bind(overrun='event')` a socket
+bound to multicast groups turns the error into a message with
+the type `NLMSG_OVERRUN` (the event is `'NLMSG_OVERRUN'`) in the
+broadcast stream, and with `bind(overrun='resync')` the event is
+followed by fresh dumps of the objects of the subscribed groups,
+see `resync()`; the dump messages are the same as the events,
+`RTM_NEWLINK` and so on::
+
+    ipr = IPRoute()
+    ipr.bind(overrun='resync', rcvbuf_max=64 * 1024 * 1024)
+    while True:
+        for msg in ipr.get():
+            if msg['event'] == 'NLMSG_OVERRUN':
+                print('resync')
+            ...
+
+With `rcvbuf_max` every overrun doubles the receive buffer,
+up to the limit, using `SO_RCVBUFFORCE` if the process has
+`CAP_NET_ADMIN`, and `SO_RCVBUF` otherwise. The counters are
+in `self.overrun_stats`.
+
 when async I/O doesn't help
 ---------------------------
 
@@ -76,24 +104,172 @@ but it doesn't help much. So keep it in mind, and if you
 expect massive broadcast Netlink storms, perform stress
 testing prior to deploy a solution in the production.
 
+receive buffers
+---------------
+
+`NetlinkSocket` doesn't allocate a new buffer for every
+datagram. The data is received with `recv_into()` into
+one of the preallocated buffers from `self.buffer_ring`,
+and `Marshal.parse()` gets a `memoryview` of the buffer.
+The parser copies only the messages that are not dropped
+by the response filter, every one separately, so the
+reader returns the buffer to the ring with `release()`
+right after the parsing. If all the buffers are still
+in use, e.g. the async cache queue holds the data, a new
+buffer is allocated and added to the ring, up to
+`BufferRing.count` buffers.
+
+response filters
+----------------
+
+`nlm_request()` accepts the `match` parameter, a function or
+a dict, see `Match`. With a dict the parser checks the message
+fields and simple NLA on the raw data before decoding, and the
+messages that don't match are dropped right away; so filtering
+a big dump doesn't cost a full decode of every message.
+
+single reader mode
+------------------
+
+By default the threads sharing one socket take turns reading
+it: the thread holding the read lock receives and parses the
+data, while the others wait for it and scan the backlog. With
+`demux=True` the socket starts one reader thread instead, that
+receives and parses all the data, and routes the messages to
+per-request queues, and broadcast messages -- to the queue of
+the sequence number 0. So every `get()` just waits on its own
+queue::
+
+    ipr = IPRoute(demux=True)
+
+The reader thread collects broadcast messages as the async
+cache does, so `bind(async_cache=True)` doesn't start one more
+thread in this mode.
+
+kernel filters
+--------------
+
+Usually a monitoring program needs only some of the broadcast
+messages. `attach_filter()` compiles a declarative spec into
+a classic BPF program and attaches it to the socket, so the
+kernel drops the other messages, and they are neither copied
+to the userspace nor decoded::
+
+    ipr = IPRoute()
+    ipr.bind()
+    ipr.attach_filter({'header': {'type': (RTM_NEWLINK, RTM_DELLINK)},
+                       'index': 2})
+
+See `pyroute2.netlink.bpf` for the details.
+
+queue bounds
+------------
+
+By default the async cache queue and the broadcast backlog are
+not limited, so a program that doesn't read the broadcast
+messages fast enough, or doesn't read them at all, keeps growing.
+`bind()` accepts the limits and the overflow policy::
+
+    ipr = IPRoute()
+    ipr.bind(async_cache=True,
+             cache_size=1024,       # datagrams in the async cache
+             backlog_size=65536,    # broadcast messages
+             queue_policy='coalesce')
+
+The policies are:
+
+    - 'drop-oldest' -- drop the oldest queued item, the default
+    - 'block' -- the reader stops reading the socket, until the
+      consumer frees some room; the kernel then drops the messages
+      and reports ENOBUFS, see "overrun detection"
+    - 'drop-newest' -- drop the new item
+    - 'coalesce' -- replace the last queued message about the
+      same object, e.g. the same link, with the new one, see
+      `coalesce_key()`; otherwise drop the oldest one. The key
+      of every message is computed once, when it is queued. The
+      async cache holds raw datagrams, that can not be coalesced,
+      so it blocks with this policy
+
+The threads waiting for the responses never block: if the reader
+can not stop, that is in the shared reader mode, or in the single
+reader mode while there are pending requests, the 'block' policy
+drops the new broadcast messages, as 'drop-newest' does. The
+counters are in `self.queue_stats`: `dropped`, `coalesced`
+and `blocked` for `'cache'` and `'backlog'`. With the limits set,
+`get()` doesn't throttle the parser on packet bursts.
+
+parallel decoding
+-----------------
+
+Decoding is the most expensive part of a big dump: tens of
+thousands of routes or conntrack entries take seconds of CPU
+in the reading thread, and a filtered dump has to decode the
+messages to check them. `start_decoders()` starts a pool of
+worker processes, and then the filtered dump requests, like
+`get_routes(table=254, oif=2)` or `get_neighbours(ifindex=3)`,
+send the raw datagrams to the workers, that decode and check
+the messages, and return the raw data of the matching ones::
+
+    ipr = IPRoute()
+    ipr.start_decoders(workers=4)
+    routes = ipr.get_routes(table=254, oif=2)
+    ...
+    ipr.close()   # stops the workers as well
+
+The returned messages are decoded back in the calling thread,
+in the order of the datagrams, so the result is the same as
+w/o the workers. The functions in the match spec can not be
+sent to the workers, so they are checked in the calling thread.
+
+Only the dumps with a match spec, and without `terminate` and
+`callback`, go to the workers, and only when the socket has no
+callbacks registered and doesn't run in the single reader mode;
+all other requests are parsed in the calling thread as usual.
+A dump that fits in one datagram is parsed in the thread as
+well. The worker processes are forked, so better start them
+prior to other threads in the program. It makes sense only on
+multi-core systems.
+
+recording
+---------
+
+`start_recording()` saves the raw datagrams, that the socket
+receives and sends, into a pcap file, to replay them later with
+`pyroute2.netlink.record.Player`, e.g. to profile the decoding
+of a production event storm::
+
+    ipr = IPRoute()
+    ipr.bind()
+    ipr.start_recording('storm.pcap')
+
+See `pyroute2.netlink.record` for the details.
+
 classes
 -------
 '''
 
 import os
 import sys
+import errno
 import time
 import select
 import struct
 import logging
 import traceback
 import threading
+import types
+from collections import deque
+from multiprocessing import cpu_count
 
 from socket import SOCK_DGRAM
 from socket import MSG_PEEK
 from socket import SOL_SOCKET
 from socket import SO_RCVBUF
 from socket import SO_SNDBUF
+try:
+    from socket import SO_RCVBUFFORCE
+except ImportError:
+    SO_RCVBUFFORCE = 33
 
 from pyroute2 import config
 from pyroute2.config import AF_NETLINK
@@ -101,27 +277,277 @@ from pyroute2.common import AddrPool
 from pyroute2.common import DEFAULT_RCVBUF
 from pyroute2.netlink import nlmsg
 from pyroute2.netlink import mtypes
+from pyroute2.netlink import compile_peek
 from pyroute2.netlink import NLMSG_ERROR
 from pyroute2.netlink import NLMSG_DONE
+from pyroute2.netlink import NLMSG_OVERRUN
+from pyroute2.netlink import NLMSG_MIN_TYPE
 from pyroute2.netlink import NETLINK_ADD_MEMBERSHIP
 from pyroute2.netlink import NETLINK_DROP_MEMBERSHIP
 from pyroute2.netlink import NETLINK_GENERIC
 from pyroute2.netlink import NETLINK_LISTEN_ALL_NSID
+from pyroute2.netlink import NETLINK_GET_STRICT_CHK
 from pyroute2.netlink import NLM_F_DUMP
 from pyroute2.netlink import NLM_F_MULTI
 from pyroute2.netlink import NLM_F_REQUEST
+from pyroute2.netlink import NLM_F_ACK
 from pyroute2.netlink import SOL_NETLINK
+from pyroute2.netlink.bpf import NetlinkFilter
+from pyroute2.netlink.bpf import SO_ATTACH_FILTER
+from pyroute2.netlink.bpf import SO_DETACH_FILTER
+from pyroute2.netlink.bpf import compile_bpf
+from pyroute2.netlink.record import Recorder
 from pyroute2.netlink.exceptions import NetlinkError
 from pyroute2.netlink.exceptions import NetlinkDecodeError
 from pyroute2.netlink.exceptions import NetlinkHeaderDecodeError
 
 try:
     from Queue import Queue
+    from Queue import Empty
 except ImportError:
     from queue import Queue
+    from queue import Empty
 
 log = logging.getLogger(__name__)
 
+QUEUE_POLICIES = ('block', 'drop-oldest', 'drop-newest', 'coalesce')
+
+
+class CoalesceIndex(object):
+    '''
+    The coalesce keys of the queued items, for the 'coalesce'
+    policy, see `enqueue()`. The key of every item is computed
+    only once, when the item is queued; the consumer of the
+    queue should call `discard()` for every item it takes, or
+    `clear()` if it takes all of them.
+    '''
+
+    def __init__(self, key):
+        self.key = key
+        self.items = {}  # key -> the last queued item
+        self.keys = {}   # id(item) -> key
+
+    def push(self, ikey, item):
+        if ikey is not None:
+            self.items[ikey] = item
+            self.keys[id(item)] = ikey
+
+    def pop(self, ikey):
+        # -> the last queued item with the key, or None
+        item = self.items.pop(ikey, None)
+        if item is not None:
+            self.keys.pop(id(item), None)
+        return item
+
+    def discard(self, item):
+        ikey = self.keys.pop(id(item), None)
+        if ikey is not None and self.items.get(ikey) is item:
+            del self.items[ikey]
+
+    def clear(self):
+        self.items.clear()
+        self.keys.clear()
+
+
+def enqueue(items, item, size, policy, index=None, stats=None):
+    '''
+    Append `item` to the `items` list or deque, applying the
+    overflow policy if there are `size` items already; return
+    False if the item is dropped. The 'block' policy is up
+    to the caller, here the item is just appended. The
+    'coalesce' policy needs the `CoalesceIndex` of the items.
+    '''
+    ikey = None
+    if policy == 'coalesce' and index is not None:
+        ikey = index.key(item)
+    if size and len(items) >= size and policy != 'block':
+        if policy == 'drop-newest':
+            stats['dropped'] += 1
+            return False
+        old = index.pop(ikey) if ikey is not None else None
+        if old is not None:
+            # the updates come in bursts, so the previous one
+            # is usually close to the end
+            for idx in range(len(items) - 1, -1, -1):
+                if items[idx] is old:
+                    del items[idx]
+                    stats['coalesced'] += 1
+                    break
+        if len(items) >= size:
+            if index is not None:
+                index.discard(items[0])
+            del items[0]
+            stats['dropped'] += 1
+    items.append(item)
+    if index is not None:
+        index.push(ikey, item)
+    return True
+
+
+class BoundedQueue(Queue):
+    '''
+    A queue with the overflow policy, see "queue bounds".
+
+    `put()` never blocks and never raises `Full`; with the
+    'block' policy the producer should call `wait()` prior
+    to reading the data, or use `put(item, block=False)`,
+    if it can not wait: then the overflow is dropped.
+    '''
+
+    def __init__(self, size=0, policy='drop-oldest', key=None,
+                 stats=None):
+        Queue.__init__(self)
+        self.size = size
+        self.policy = policy
+        self.index = CoalesceIndex(key) if key is not None else None
+        self.stats = stats if stats is not None else {'dropped': 0,
+                                                      'coalesced': 0,
+                                                      'blocked': 0}
+
+    def overflow(self):
+        return self.size and self._qsize() >= self.size
+
+    def _get(self):
+        item = self.queue.popleft()
+        if self.index is not None:
+            self.index.discard(item)
+        return item
+
+    def put(self, item, block=True, timeout=None):
+        policy = self.policy
+        if policy == 'block' and not block:
+            policy = 'drop-newest'
+        with self.mutex:
+            if enqueue(self.queue, item, self.size,
+                       policy, self.index, self.stats):
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+
+    def wait(self, cancel):
+        '''
+        Wait until the queue has free room, or `cancel()`
+        returns True
+        '''
+        with self.not_full:
+            if self.policy != 'block' or not self.overflow():
+                return
+            self.stats['blocked'] += 1
+            while self.overflow() and not cancel():
+                self.not_full.wait(1)
+
+
+class Match(object):
+    '''
+    Compiled match spec: a function or a dict, as used by
+    `nlm_request()` and `RTNL_API`. A dict spec matches the
+    message, if every key matches either the field or the NLA
+    with the name `msg.name2nla(key)`; a function value is
+    called with the field or NLA value and should return
+    True or False. Anything else matches nothing.
+
+    The spec is analyzed once, and the NLA names are resolved
+    once per message class. For dict specs `peek()` returns
+    also a filter to check the raw data before decoding, see
+    `pyroute2.netlink.nlmsg_peek`.
+    '''
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.nla_names = {}
+        self.peekers = {}
+        if hasattr(spec, '__call__'):
+            self.items = None
+        elif isinstance(spec, dict):
+            self.items = tuple([(key,
+                                 value,
+                                 isinstance(value, types.FunctionType))
+                                for (key, value) in spec.items()])
+        else:
+            self.items = ()
+
+    def __call__(self, msg):
+        if self.items is None:
+            return self.spec(msg)
+        elif not isinstance(self.spec, dict):
+            return False
+        msg_class = type(msg)
+        names = self.nla_names.get(msg_class)
+        if names is None:
+            names = self.nla_names[msg_class] = \
+                [msg.name2nla(key) for (key, value, func) in self.items]
+        for ((key, value, func), name) in zip(self.items, names):
+            field = msg.get(key)
+            if func:
+                if field is not None:
+                    if not value(field):
+                        return False
+                else:
+                    attr = msg.get_attr(name)
+                    if attr is None or not value(attr):
+                        return False
+            elif field != value and msg.get_attr(name) != value:
+                return False
+        return True
+
+    def peek(self, msg_class):
+        '''
+        Return the raw data filter for the message class,
+        or `None`
+        '''
+        if msg_class not in self.peekers:
+            self.peekers[msg_class] = None
+            if self.items:
+                try:
+                    self.peekers[msg_class] = compile_peek(msg_class,
+                                                           self.spec)
+                except Exception:
+                    log.debug('can not compile peek: %s' % (self.spec, ))
+        return self.peekers[msg_class]
+
+
+def compile_match(spec):
+    '''
+    Return the `Match` object for the spec
+    '''
+    if isinstance(spec, Match):
+        return spec
+    return Match(spec)
+
+
+def parallel_spec(match):
+    '''
+    Return the part of the match spec, that can be sent to the
+    decoder processes, or `None`: the functions can not be
+    pickled, so the caller checks them
+    '''
+    if match is None or not isinstance(match.spec, dict):
+        return None
+    return dict([(key, value) for (key, value) in match.spec.items()
+                 if not callable(value)]) or None
+
+
+def parallel_parse(marshal_class, msg_map, data, seq, spec):
+    '''
+    Filter the data in a decoder process, see "parallel decoding";
+    return the raw data of the messages, that match the spec
+    '''
+    marshal = marshal_class()
+    marshal.msg_map = msg_map
+    match = compile_match(spec)
+    ret = bytearray()
+    for msg in marshal.parse(data, seq, None, match):
+        if msg.data is not data:
+            # a broken header, let the caller fail on it
+            return data
+        header = msg['header']
+        if header.get('error') is None and \
+                header['type'] >= NLMSG_MIN_TYPE and \
+                header['sequence_number'] == seq and \
+                not match(msg):
+            continue
+        ret += data[msg.offset:msg.offset + msg.length]
+    return bytes(ret)
+
 
 class Marshal(object):
     '''
@@ -141,16 +567,27 @@ class Marshal(object):
         self.msg_map = self.msg_map or {}
         self.defragmentation = {}
 
-    def parse(self, data, seq=None, callback=None):
+    def parse(self, data, seq=None, callback=None, match=None):
         '''
         Parse string data.
 
         At this moment all transport, except of the native
         Netlink is deprecated in this library, so we should
         not support any defragmentation on that level
+
+        If the data is a `memoryview`, every message that is not
+        dropped by `match` gets the copy of its own bytes; so the
+        underlying buffer can be reused right after the parsing,
+        and the messages don't keep the whole datagram.
+
+        If `match` is set, see `Match`, the messages with the
+        sequence number `seq` that don't match are dropped prior
+        to decoding, as far as it can be decided by the raw data.
+        Control messages are never dropped.
         '''
         offset = 0
         result = []
+        view = isinstance(data, memoryview)
         # there must be at least one header in the buffer,
         # 'IHHII' == 16 bytes
         while offset <= len(data) - 16:
@@ -168,16 +605,29 @@ class Marshal(object):
                     error = NetlinkError(code)
 
             msg_class = self.msg_map.get(msg_type, nlmsg)
-            msg = msg_class(data, offset=offset)
+            if match is not None and error is None:
+                mtype, _, mseq = struct.unpack_from('HHI', data, offset + 4)
+                if mtype >= NLMSG_MIN_TYPE and mseq == seq:
+                    peek = match.peek(msg_class)
+                    if peek is not None and not peek(data, offset):
+                        offset += length
+                        continue
+            if view:
+                buf = bytearray(data[offset:offset + length])
+                base = 0
+            else:
+                buf = data
+                base = offset
+            msg = msg_class(buf, offset=base)
 
             try:
                 msg.decode()
                 msg['header']['error'] = error
                 # try to decode encapsulated error message
                 if error is not None:
-                    enc_type = struct.unpack_from('H', data, offset + 24)[0]
+                    enc_type = struct.unpack_from('H', buf, base + 24)[0]
                     enc_class = self.msg_map.get(enc_type, nlmsg)
-                    enc = enc_class(data, offset=offset + 20)
+                    enc = enc_class(buf, offset=base + 20)
                     enc.decode()
                     msg['header']['errmsg'] = enc
                 if callback and seq == msg['header']['sequence_number']:
@@ -274,6 +724,65 @@ class LockFactory(object):
         del self.locks[key]
 
 
+class BufferRing(object):
+    '''
+    A ring of preallocated receive buffers.
+
+    A buffer returned by `get()` is in use until it is given
+    back with `release()`, e.g. the `memoryview` returned by
+    `NetlinkSocket.recv_ft()` after the parsing.
+    '''
+
+    def __init__(self, size=DEFAULT_RCVBUF, count=16):
+        self.size = size
+        self.count = count
+        self.lock = threading.Lock()
+        self.ring = deque([bytearray(size)])
+        self.used = set()
+        self.stats = {'allocated': 1,
+                      'reused': 0}
+
+    def is_free(self, buf):
+        return id(buf) not in self.used
+
+    def get(self, size=None):
+        '''
+        Return a free buffer at least of `size` bytes
+        '''
+        size = max(size or 0, self.size)
+        with self.lock:
+            for _ in range(len(self.ring)):
+                buf = self.ring[0]
+                self.ring.rotate(-1)
+                if self.is_free(buf):
+                    if len(buf) < size:
+                        buf.extend(bytearray(size - len(buf)))
+                    self.used.add(id(buf))
+                    self.stats['reused'] += 1
+                    return buf
+            buf = bytearray(size)
+            self.stats['allocated'] += 1
+            if len(self.ring) < self.count:
+                self.ring.append(buf)
+                self.used.add(id(buf))
+            return buf
+
+    def release(self, data):
+        '''
+        Return the buffer to the ring. `data` is the buffer or
+        a `memoryview` of it, the view is released; any other
+        data is ignored, so the readers can release whatever
+        `recv_ft()` returns.
+        '''
+        if isinstance(data, memoryview):
+            buf = data.obj
+            data.release()
+        else:
+            buf = data
+        with self.lock:
+            self.used.discard(id(buf))
+
+
 class NetlinkMixin(object):
     '''
     Generic netlink socket
@@ -286,7 +795,8 @@ class NetlinkMixin(object):
                  fileno=None,
                  sndbuf=1048576,
                  rcvbuf=1048576,
-                 all_ns=False):
+                 all_ns=False,
+                 demux=False):
         #
         # That's a trick. Python 2 is not able to construct
         # sockets from an open FD.
@@ -313,22 +823,50 @@ class NetlinkMixin(object):
         self._sndbuf = sndbuf
         self._rcvbuf = rcvbuf
         self.backlog = {0: []}
+        self.backlog_index = CoalesceIndex(self.coalesce_key)
         self.callbacks = []     # [(predicate, callback, args), ...]
         self.pthread = None
+        self.overrun = None
+        self.overrun_stats = {'enobufs': 0,
+                              'overrun': 0,
+                              'resync': 0,
+                              'rcvbuf': rcvbuf}
+        self.rcvbuf_max = 0
+        self.bpf = None
+        self.decoders = None
+        self.decoders_window = 0
+        self.recorder = None
+        self.cache_size = 0
+        self.backlog_size = 0
+        self.queue_policy = 'drop-oldest'
+        self.queue_stats = {'cache': {'dropped': 0,
+                                      'coalesced': 0,
+                                      'blocked': 0},
+                            'backlog': {'dropped': 0,
+                                        'coalesced': 0,
+                                        'blocked': 0}}
+        self.demux = demux
+        self.demux_queues = {0: BoundedQueue(key=self.coalesce_key,
+                                             stats=self.queue_stats
+                                             ['backlog'])}
+        self.demux_thread = None
         self.closed = False
         self.uname = config.uname
         self.capabilities = {'create_bridge': config.kernel > [3, 2, 0],
                              'create_bond': config.kernel > [3, 2, 0],
                              'create_dummy': True,
-                             'provide_master': config.kernel[0] > 2}
+                             'provide_master': config.kernel[0] > 2,
+                             'strict_check': False}
         self.backlog_lock = threading.Lock()
+        self.send_lock = threading.Lock()
         self.read_lock = threading.Lock()
         self.sys_lock = threading.RLock()
         self.change_master = threading.Event()
         self.lock = LockFactory()
         self._sock = None
         self._ctrl_read, self._ctrl_write = os.pipe()
-        self.buffer_queue = Queue()
+        self.buffer_queue = BoundedQueue(stats=self.queue_stats['cache'])
+        self.buffer_ring = BufferRing()
         self.qsize = 0
         self.log = []
         self.get_timeout = 30
@@ -370,7 +908,10 @@ class NetlinkMixin(object):
         return type(self)(family=self.family)
 
     def close(self):
+        self.stop_decoders()
+        self.stop_recording()
         if self.pthread:
+            self.buffer_queue.policy = 'drop-oldest'
             self.buffer_queue.put(struct.pack('IHHQIQQ',
                                               28, 2, 0, 0, 104, 0, 0))
         try:
@@ -535,20 +1076,105 @@ class NetlinkMixin(object):
             events = poll.poll()
             for (fd, event) in events:
                 if fd == sockfd:
+                    self.buffer_queue.wait(lambda: self.closed)
+                    data = self.buffer_ring.get(64000)
                     try:
-                        data = bytearray(64000)
-                        self._sock.recv_into(data, 64000)
+                        length = self._sock.recv_into(data, 64000)
+                        data = memoryview(data)[:length]
+                        recorder = self.recorder
+                        if recorder is not None:
+                            recorder.write(data, self.family)
                         self.buffer_queue.put(data)
                     except Exception as e:
+                        self.buffer_ring.release(data)
                         self.buffer_queue.put(e)
                 else:
                     return
 
+    def coalesce_key(self, msg):
+        '''
+        Return the key of the object the broadcast message is
+        about, for the 'coalesce' queue policy; the messages
+        with the same key replace each other in the queue.
+        None means the message can not be coalesced. The
+        protocol sockets override it.
+        '''
+        return None
+
+    def pending(self):
+        '''
+        Return True, if there are the broadcast messages, that
+        `get()` can return w/o waiting for the socket
+        '''
+        if self.backlog[0]:
+            return True
+        if self.demux:
+            return not self.demux_queues[0].empty()
+        if self.pthread:
+            return self.buffer_queue.qsize() > 0
+        return bool(select.select([self.fileno()], [], [], 0)[0])
+
+    def overrun_event(self, msg=None):
+        '''
+        Register the overrun: update the counters, grow the
+        receive buffer, if `rcvbuf_max` allows, and return the
+        `NLMSG_OVERRUN` message for the broadcast stream. The
+        `msg` parameter is the overrun message from the kernel,
+        if any; otherwise it is ENOBUFS.
+        '''
+        if msg is None:
+            self.overrun_stats['enobufs'] += 1
+            msg = nlmsg()
+            msg['header']['length'] = 16
+            msg['header']['type'] = NLMSG_OVERRUN
+            msg['header']['flags'] = 0
+            msg['header']['sequence_number'] = 0
+            msg['header']['pid'] = 0
+            msg['header']['error'] = None
+            msg['event'] = mtypes[NLMSG_OVERRUN]
+        else:
+            self.overrun_stats['overrun'] += 1
+        size = self.overrun_stats['rcvbuf']
+        if self.rcvbuf_max > size:
+            size = min(size * 2, self.rcvbuf_max)
+            try:
+                self.setsockopt(SOL_SOCKET, SO_RCVBUFFORCE, size)
+            except (OSError, IOError):
+                # no CAP_NET_ADMIN, limited by net.core.rmem_max
+                self.setsockopt(SOL_SOCKET, SO_RCVBUF, size)
+            self.overrun_stats['rcvbuf'] = size
+        log.warning('netlink overrun, events lost: %s' %
+                    (self.overrun_stats, ))
+        return msg
+
+    def resync(self):
+        '''
+        Return fresh dumps of the objects of the subscribed
+        multicast groups, to follow the `NLMSG_OVERRUN` event
+        with `bind(overrun='resync')`. The protocol sockets
+        override it, the default is no dumps.
+        '''
+        return ()
+
+    def broadcast(self, msgs):
+        '''
+        Yield the broadcast messages, appending `resync()` dumps
+        to the overrun events
+        '''
+        for msg in msgs:
+            yield msg
+            if self.overrun == 'resync' and \
+                    msg['header']['type'] == NLMSG_OVERRUN:
+                self.overrun_stats['resync'] += 1
+                for dump in self.resync():
+                    yield dump
+
     def put(self, msg, msg_type,
             msg_flags=NLM_F_REQUEST,
             addr=(0, 0),
             msg_seq=0,
-            msg_pid=None):
+            msg_pid=None,
+            strict=False):
         '''
         Construct a message from a dictionary and send it to
         the socket. Parameters:
@@ -559,6 +1185,8 @@ class NetlinkMixin(object):
             - addr -- `sendto()` addr, default `(0, 0)`
             - msg_seq -- sequence number to use
             - msg_pid -- pid to use, if `None` -- use os.getpid()
+            - strict -- send with NETLINK_GET_STRICT_CHK, see
+              `strict_gate()`
 
         Example::
 
@@ -576,8 +1204,7 @@ class NetlinkMixin(object):
         if msg_seq != 0:
             self.lock[msg_seq].acquire()
         try:
-            if msg_seq not in self.backlog:
-                self.backlog[msg_seq] = []
+            self.backlog_register(msg_seq)
             if not isinstance(msg, nlmsg):
                 msg_class = self.marshal.msg_map[msg_type]
                 msg = msg_class(msg)
@@ -587,25 +1214,70 @@ class NetlinkMixin(object):
             msg['header']['flags'] = msg_flags
             msg['header']['sequence_number'] = msg_seq
             msg['header']['pid'] = msg_pid
-            self.sendto_gate(msg, addr)
+            with self.send_lock:
+                if strict:
+                    self.strict_gate(msg, addr)
+                else:
+                    self.sendto_gate(msg, addr)
+                recorder = self.recorder
+                if recorder is not None:
+                    recorder.write(msg.data[msg.offset:
+                                            msg.offset + msg.length],
+                                   self.family, outgoing=True)
         except:
             raise
         finally:
             if msg_seq != 0:
                 self.lock[msg_seq].release()
 
+    def backlog_register(self, msg_seq):
+        '''
+        Register the sequence number prior to sending the request,
+        so the response will not be taken as a broadcast
+        '''
+        if self.demux:
+            self.demux_start()
+            with self.backlog_lock:
+                if msg_seq not in self.demux_queues:
+                    self.demux_queues[msg_seq] = Queue()
+        elif msg_seq not in self.backlog:
+            self.backlog[msg_seq] = []
+
+    def backlog_unregister(self, msg_seq):
+        '''
+        Drop the sequence number queues, when the request is done
+        or failed, so the late responses become orphaned
+        '''
+        with self.backlog_lock:
+            self.backlog.pop(msg_seq, None)
+            self.demux_queues.pop(msg_seq, None)
+
     def sendto_gate(self, msg, addr):
         raise NotImplementedError()
 
+    def strict_gate(self, msg, addr):
+        '''
+        Send the request with the strict checking turned on:
+        the kernel validates the request header and attributes
+        and applies the dump filters. Available only if
+        `self.capabilities['strict_check']` is True.
+        '''
+        raise NotImplementedError()
+
     def get(self, bufsize=DEFAULT_RCVBUF,
             msg_seq=0,
             terminate=None,
-            callback=None):
+            callback=None,
+            match=None):
         '''
         Get parsed messages list. If `msg_seq` is given, return
         only messages with that `msg['header']['sequence_number']`,
         saving all other messages into `self.backlog`.
 
+        The `match` parameter, a `Match` object, lets the parser
+        drop the messages with `msg_seq` that don't match prior
+        to decoding; the result is not filtered by it otherwise.
+
         The routine is thread-safe.
 
         The `bufsize` parameter can be:
@@ -615,6 +1287,11 @@ class NetlinkMixin(object):
             - 0: bufsize will be calculated from SO_RCVBUF sockopt
             - int >= 0: just a bufsize
         '''
+        if self.demux:
+            for msg in self.demux_get(msg_seq, terminate, callback):
+                yield msg
+            return
+
         ctime = time.time()
 
         with self.lock[msg_seq]:
@@ -628,6 +1305,7 @@ class NetlinkMixin(object):
             tmsg = None
             enough = False
             backlog_acquired = False
+            broadcast = ()
             try:
                 while not enough:
                     # 8<-----------------------------------------------------------
@@ -648,10 +1326,15 @@ class NetlinkMixin(object):
                         # Zero queue.
                         #
                         # Load the backlog, if there is valid
-                        # content in it
-                        for msg in self.backlog[0]:
-                            yield msg
+                        # content in it, and return it out of
+                        # the backlog lock
+                        broadcast = self.backlog[0]
                         self.backlog[0] = []
+                        self.backlog_index.clear()
+                        # Wake up the readers waiting for the room
+                        # in the backlog
+                        if self.backlog_size:
+                            self.change_master.set()
                         # And just exit
                         break
                     elif msg_seq != 0 and len(self.backlog.get(msg_seq, [])):
@@ -745,18 +1428,39 @@ class NetlinkMixin(object):
                                 #
                                 # This is a time consuming process, so all the
                                 # locks, except the read lock must be released
-                                data = self.recv_ft(bufsize)
+                                try:
+                                    data = self.recv_ft(bufsize)
+                                except (OSError, IOError) as e:
+                                    if e.errno != errno.ENOBUFS or \
+                                            not self.groups:
+                                        raise
+                                    event = self.overrun_event()
+                                    if self.overrun is None:
+                                        raise
+                                    with self.backlog_lock:
+                                        self.backlog[0].append(event)
+                                    self.change_master.set()
+                                    if msg_seq != 0:
+                                        # the response can be lost
+                                        raise
+                                    continue
                                 # Parse data
-                                msgs = self.marshal.parse(data,
-                                                          msg_seq,
-                                                          callback)
+                                try:
+                                    msgs = self.marshal.parse(data,
+                                                              msg_seq,
+                                                              callback,
+                                                              match if not
+                                                              self.callbacks
+                                                              else None)
+                                finally:
+                                    self.buffer_ring.release(data)
                                 # Reset ctime -- timeout should be measured
                                 # for every turn separately
                                 ctime = time.time()
                                 #
                                 current = self.buffer_queue.qsize()
                                 delta = current - self.qsize
-                                if delta > 10:
+                                if delta > 10 and not self.cache_size:
                                     delay = min(3, max(0.01,
                                                        float(current) / 60000))
                                     message = ("Packet burst: "
@@ -769,38 +1473,8 @@ class NetlinkMixin(object):
                                     time.sleep(delay)
                                 self.qsize = current
 
-                                # We've got the data, lock the backlog again
-                                with self.backlog_lock:
-                                    for msg in msgs:
-                                        seq = msg['header']['sequence_number']
-                                        if seq not in self.backlog:
-                                            if msg['header']['type'] == \
-                                                    NLMSG_ERROR:
-                                                # Drop orphaned NLMSG_ERROR
-                                                # messages
-                                                continue
-                                            seq = 0
-                                        # 8<-----------------------------------
-                                        # Callbacks section
-                                        for cr in self.callbacks:
-                                            try:
-                                                if cr[0](msg):
-                                                    cr[1](msg, *cr[2])
-                                            except:
-                                                # FIXME
-                                                #
-                                                # Usually such code formatting
-                                                # means that the method should
-                                                # be refactored to avoid such
-                                                # indentation.
-                                                #
-                                                # Plz do something with it.
-                                                #
-                                                lw = log.warning
-                                                lw("Callback fail: %s" % (cr))
-                                                lw(traceback.format_exc())
-                                        # 8<-----------------------------------
-                                        self.backlog[seq].append(msg)
+                                # We've got the data, route it
+                                self.backlog_route(msgs)
 
                                 # Now wake up other threads
                                 self.change_master.set()
@@ -822,19 +1496,460 @@ class NetlinkMixin(object):
                 if backlog_acquired:
                     self.backlog_lock.release()
 
+            for msg in self.broadcast(broadcast):
+                yield msg
+
+    def backlog_route(self, msgs):
+        '''
+        Put the parsed messages into the backlog, running the
+        callbacks; see `demux_route()` for the single reader mode
+        '''
+        with self.backlog_lock:
+            for msg in msgs:
+                seq = msg['header']['sequence_number']
+                if msg['header']['type'] == NLMSG_OVERRUN:
+                    self.overrun_event(msg)
+                if seq not in self.backlog:
+                    if msg['header']['type'] == NLMSG_ERROR:
+                        # Drop orphaned NLMSG_ERROR messages
+                        continue
+                    seq = 0
+                for cr in self.callbacks:
+                    try:
+                        if cr[0](msg):
+                            cr[1](msg, *cr[2])
+                    except:
+                        log.warning("Callback fail: %s" % (cr))
+                        log.warning(traceback.format_exc())
+                if seq == 0:
+                    # the readers here can not block, see "queue bounds"
+                    enqueue(self.backlog[0], msg,
+                            self.backlog_size,
+                            'drop-newest' if self.queue_policy == 'block'
+                            else self.queue_policy,
+                            self.backlog_index,
+                            self.queue_stats['backlog'])
+                else:
+                    self.backlog[seq].append(msg)
+
+    def demux_start(self):
+        '''
+        Start the reader thread, if it is not started yet; see
+        "single reader mode" in the module description
+        '''
+        if self.demux_thread is not None:
+            return
+        with self.sys_lock:
+            if self.demux_thread is None and not self.closed:
+                self.demux_thread = threading.Thread(name='Netlink reader',
+                                                     target=self.demux_recv)
+                self.demux_thread.setDaemon(True)
+                self.demux_thread.start()
+
+    def demux_recv(self):
+        '''
+        The reader thread: receive and parse the data, route
+        the messages to the `get()` queues
+        '''
+        poll = select.poll()
+        poll.register(self._sock, select.POLLIN | select.POLLPRI)
+        poll.register(self._ctrl_read, select.POLLIN | select.POLLPRI)
+        sockfd = self._sock.fileno()
+        try:
+            while True:
+                for (fd, event) in poll.poll():
+                    if fd != sockfd:
+                        return
+                    # don't block the pending requests
+                    self.demux_queues[0].wait(lambda: self.closed or
+                                              len(self.demux_queues) > 1)
+                    try:
+                        data = self.recv_ft(DEFAULT_RCVBUF)
+                    except Exception as e:
+                        # ENOBUFS etc. -- the responses are lost,
+                        # so fail the pending requests
+                        overrun = getattr(e, 'errno', None) == \
+                            errno.ENOBUFS and self.groups
+                        if overrun:
+                            event = self.overrun_event()
+                        else:
+                            log.error('netlink read error: %s' % (e, ))
+                        self.demux_fail(e, broadcast=overrun and
+                                        self.overrun is None)
+                        if overrun and self.overrun is not None:
+                            self.demux_queues[0].put(event)
+                        continue
+                    try:
+                        msgs = self.marshal.parse(data)
+                    finally:
+                        self.buffer_ring.release(data)
+                    self.demux_route(msgs)
+        finally:
+            self.demux_fail(IOError(errno.EBADF, 'socket closed'),
+                            broadcast=True)
+
+    def demux_route(self, msgs):
+        with self.backlog_lock:
+            for msg in msgs:
+                seq = msg['header']['sequence_number']
+                if msg['header']['type'] == NLMSG_OVERRUN:
+                    self.overrun_event(msg)
+                queue = self.demux_queues.get(seq)
+                if queue is None:
+                    if msg['header']['type'] == NLMSG_ERROR:
+                        # drop orphaned NLMSG_ERROR messages
+                        continue
+                    seq = 0
+                    queue = self.demux_queues[0]
+                for cr in self.callbacks:
+                    try:
+                        if cr[0](msg):
+                            cr[1](msg, *cr[2])
+                    except:
+                        log.warning("Callback fail: %s" % (cr))
+                        log.warning(traceback.format_exc())
+                queue.put(msg, block=len(self.demux_queues) == 1)
+
+    def demux_fail(self, error, broadcast=False):
+        with self.backlog_lock:
+            for (seq, queue) in self.demux_queues.items():
+                if seq != 0 or broadcast:
+                    queue.put(error)
+
+    def demux_get(self, msg_seq, terminate, callback):
+        '''
+        `get()` for the single reader mode: wait for the messages
+        on the `msg_seq` queue, with the same terminator rules
+        '''
+        self.demux_start()
+        with self.backlog_lock:
+            if msg_seq not in self.demux_queues:
+                self.demux_queues[msg_seq] = Queue()
+                # wake up the reader, if it is blocked
+                with self.demux_queues[0].not_full:
+                    self.demux_queues[0].not_full.notify_all()
+            queue = self.demux_queues[msg_seq]
+            # the netlink proxy puts its responses into the backlog,
+            # see `IPRSocketMixin._gate()`
+            msgs = self.backlog.pop(msg_seq, [])
+            if msg_seq == 0:
+                self.backlog[0] = []
+                self.backlog_index.clear()
+
+        if msg_seq == 0:
+            # return all the broadcast messages collected so far,
+            # waiting for at least one
+            if not msgs:
+                msgs.append(queue.get())
+            msgs.extend(self.demux_drain(queue))
+            for msg in msgs:
+                if isinstance(msg, Exception):
+                    raise msg
+            for msg in self.broadcast(msgs):
+                yield msg
+            return
+
+        msgs = deque(msgs)
+        enough = False
+        try:
+            with self.lock[msg_seq]:
+                while not enough:
+                    if msgs:
+                        msg = msgs.popleft()
+                    else:
+                        try:
+                            msg = queue.get(timeout=self.get_timeout)
+                        except Empty:
+                            if self.get_timeout_exception:
+                                raise self.get_timeout_exception()
+                            return
+                    if isinstance(msg, Exception):
+                        raise msg
+                    if callback is not None and callback(msg):
+                        continue
+                    if msg['header'].get('error', None) is not None:
+                        raise msg['header']['error']
+                    tmsg = None
+                    if terminate is not None:
+                        tmsg = terminate(msg)
+                        if isinstance(tmsg, nlmsg):
+                            yield msg
+                    if (msg['header']['type'] == NLMSG_DONE) or tmsg:
+                        enough = True
+                    else:
+                        if not msg['header']['flags'] & NLM_F_MULTI:
+                            enough = True
+                        yield msg
+        finally:
+            # requeue the rest to the broadcast queue, as `get()` does
+            with self.backlog_lock:
+                self.demux_queues.pop(msg_seq, None)
+                msgs.extend(self.demux_drain(queue))
+                for msg in msgs:
+                    if not isinstance(msg, Exception):
+                        self.demux_queues[0].put(msg)
+
+    @staticmethod
+    def demux_drain(queue):
+        ret = []
+        while True:
+            try:
+                ret.append(queue.get_nowait())
+            except Empty:
+                return ret
+
+    def start_decoders(self, workers=None):
+        '''
+        Start the decoder processes, see "parallel decoding".
+
+            - workers -- the number of processes, the number
+              of CPUs by default
+        '''
+        with self.sys_lock:
+            if self.decoders is None:
+                workers = workers or cpu_count()
+                self.decoders = config.MpPool(workers)
+                # datagrams in flight, enough to keep the workers
+                # busy while the results are read
+                self.decoders_window = workers * 2
+
+    def stop_decoders(self):
+        '''
+        Stop the decoder processes, if any
+        '''
+        with self.sys_lock:
+            if self.decoders is not None:
+                self.decoders.terminate()
+                self.decoders.join()
+                self.decoders = None
+
+    def start_recording(self, f):
+        '''
+        Save all the datagrams received and sent by the socket
+        into a pcap file, see `pyroute2.netlink.record`. Return
+        the `Recorder` object.
+        '''
+        with self.sys_lock:
+            self.stop_recording()
+            self.recorder = Recorder(f)
+            return self.recorder
+
+    def stop_recording(self):
+        '''
+        Stop the recording, if any
+        '''
+        with self.sys_lock:
+            recorder = self.recorder
+            self.recorder = None
+            if recorder is not None:
+                recorder.close()
+
+    @staticmethod
+    def decoders_scan(data):
+        # -> (sequence number, is it the last datagram)
+        offset = 0
+        seq = None
+        last = False
+        while offset <= len(data) - 16:
+            length, mtype, flags, mseq = struct.unpack_from('IHHI',
+                                                            data, offset)
+            if length == 0:
+                break
+            if seq is None:
+                seq = mseq
+            if mtype in (NLMSG_DONE, NLMSG_ERROR) or \
+                    not flags & NLM_F_MULTI:
+                last = True
+            offset += length
+        return seq, last
+
+    def decoders_get(self, msg_seq, match=None):
+        '''
+        `get()` for the dump responses, that parses the datagrams
+        in the decoder processes, see "parallel decoding"
+        '''
+        spec = parallel_spec(match)
+        marshal_class = type(self.marshal)
+        msg_map = self.marshal.msg_map
+        pending = deque()
+        done = False
+        try:
+            with self.read_lock:
+                # the messages, that another thread has received
+                # for us prior to taking the read lock
+                with self.backlog_lock:
+                    msgs = self.backlog.get(msg_seq) or []
+                    self.backlog[msg_seq] = []
+                if msgs:
+                    pending.append(msgs)
+                    for msg in msgs:
+                        if msg['header'].get('type') in (NLMSG_DONE,
+                                                         NLMSG_ERROR) or \
+                                not msg['header'].get('flags', 0) & \
+                                NLM_F_MULTI:
+                            done = True
+                while pending or not done:
+                    if not done and len(pending) < self.decoders_window:
+                        view = self.recv_ft(DEFAULT_RCVBUF)
+                        data = bytes(view)
+                        self.buffer_ring.release(view)
+                        seq, last = self.decoders_scan(data)
+                        if seq != msg_seq:
+                            # not ours, route it as `get()` does
+                            self.backlog_route(self.marshal.parse(data))
+                            self.change_master.set()
+                            continue
+                        done = last
+                        if done and not pending:
+                            pending.append(self.marshal.parse(data,
+                                                              msg_seq,
+                                                              None,
+                                                              match))
+                        else:
+                            pending.append(self.decoders
+                                           .apply_async(parallel_parse,
+                                                        (marshal_class,
+                                                         msg_map,
+                                                         data,
+                                                         msg_seq,
+                                                         spec)))
+                        continue
+                    msgs = pending.popleft()
+                    if not isinstance(msgs, list):
+                        msgs = self.marshal.parse(msgs.get(), msg_seq)
+                    for msg in msgs:
+                        if msg['header'].get('error', None) is not None:
+                            raise msg['header']['error']
+                        if msg['header']['type'] == NLMSG_DONE:
+                            break
+                        yield msg
+        finally:
+            with self.backlog_lock:
+                self.backlog.pop(msg_seq, None)
+
+    def batch_pack(self, msgs, msg_type, msg_flags, size, copy,
+                   window=None):
+        '''
+        Pack the requests into datagrams of up to `size` bytes
+        and `window` requests, allocating and registering the
+        sequence numbers; yield `(datagram, [msg_seq, ...])`,
+        see `nlm_request_batch()`
+        '''
+        msgs = tuple(msgs)
+        idx = 0
+        while idx < len(msgs):
+            batch = bytearray()
+            seqs = []
+            try:
+                while idx < len(msgs) and len(batch) < size and \
+                        (window is None or len(seqs) < window):
+                    msg = msgs[idx]
+                    msg_seq = self.addr_pool.alloc()
+                    seqs.append(msg_seq)
+                    self.backlog_register(msg_seq)
+                    pid = self.epid or os.getpid()
+                    if copy:
+                        data = bytearray(msg.data[msg.offset:
+                                                  msg.offset + msg.length])
+                        struct.pack_into('HHII', data, 4, msg_type,
+                                         msg_flags, msg_seq, pid)
+                    else:
+                        msg['header']['type'] = msg_type
+                        msg['header']['flags'] = msg_flags
+                        msg['header']['sequence_number'] = msg_seq
+                        msg['header']['pid'] = pid
+                        msg.reset()
+                        msg.encode()
+                        data = msg.data
+                    batch += data
+                    idx += 1
+            except Exception:
+                # nothing is sent, release the partial batch
+                for msg_seq in seqs:
+                    self.backlog_unregister(msg_seq)
+                    self.addr_pool.free(msg_seq)
+                raise
+            yield (batch, seqs)
+
+    def batch_send(self, batch):
+        with self.send_lock:
+            self.sendto(batch, (0, 0))
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.write(batch, self.family, outgoing=True)
+
+    def nlm_request_batch(self, msgs, msg_type,
+                          msg_flags=NLM_F_REQUEST | NLM_F_ACK,
+                          size=65536,
+                          copy=False,
+                          window=None):
+        '''
+        Send the requests packed into datagrams of up to `size`
+        bytes and `window` requests, and return the results in
+        the same order: a tuple of the response messages, or
+        `NetlinkError`, for every request. The kernel runs all
+        the requests of a datagram, and acks or reports the error
+        for every one separately.
+        All the responses to a datagram are collected prior to
+        sending the next one, so the responses must fit into
+        the receive buffer.
+
+        With `copy=True` the messages must be the decoded ones,
+        e.g. the dump results: the requests are copied from the
+        raw data with the new header, without encoding.
+        '''
+        ret = []
+        for (batch, seqs) in self.batch_pack(msgs, msg_type,
+                                             msg_flags, size, copy,
+                                             window):
+            try:
+                self.batch_send(batch)
+                for msg_seq in seqs:
+                    try:
+                        ret.append(tuple(self.get(msg_seq=msg_seq)))
+                    except NetlinkError as e:
+                        ret.append(e)
+            finally:
+                for msg_seq in seqs:
+                    # see `nlm_request()` for the ban
+                    self.backlog_unregister(msg_seq)
+                    self.addr_pool.free(msg_seq, ban=0xff)
+        return ret
+
     def nlm_request(self, msg, msg_type,
                     msg_flags=NLM_F_REQUEST | NLM_F_DUMP,
                     terminate=None,
-                    callback=None):
-
+                    callback=None,
+                    strict=False,
+                    match=None):
+        '''
+        Send the request and return the response messages.
+        If `match` is set, a function or a dict, see `Match`,
+        return only the matching messages; the messages are
+        checked prior to decoding where possible.
+        '''
+        if match is not None:
+            match = compile_match(match)
         msg_seq = self.addr_pool.alloc()
         with self.lock[msg_seq]:
             try:
-                self.put(msg, msg_type, msg_flags, msg_seq=msg_seq)
-                for msg in self.get(msg_seq=msg_seq,
-                                    terminate=terminate,
-                                    callback=callback):
-                    yield msg
+                self.put(msg, msg_type, msg_flags,
+                         msg_seq=msg_seq,
+                         strict=strict)
+                if self.decoders is not None and \
+                        (msg_flags & NLM_F_DUMP) == NLM_F_DUMP and \
+                        parallel_spec(match) is not None and \
+                        terminate is None and callback is None and \
+                        not self.demux and not self.callbacks:
+                    response = self.decoders_get(msg_seq, match)
+                else:
+                    response = self.get(msg_seq=msg_seq,
+                                        terminate=terminate,
+                                        callback=callback,
+                                        match=match)
+                for msg in response:
+                    if match is None or match(msg):
+                        yield msg
 
             except Exception:
                 raise
@@ -851,6 +1966,7 @@ class NetlinkMixin(object):
                 # being received, will become orphaned and just dropped.
                 #
                 # Hack, but true.
+                self.backlog_unregister(msg_seq)
                 self.addr_pool.free(msg_seq, ban=0xff)
 
 
@@ -902,7 +2018,7 @@ class BatchSocket(NetlinkMixin):
         msg.encode()
 
     def get(self, *argv, **kwarg):
-        pass
+        return ()
 
 
 class NetlinkSocket(NetlinkMixin):
@@ -930,6 +2046,12 @@ class NetlinkSocket(NetlinkMixin):
             self.setsockopt(SOL_SOCKET, SO_RCVBUF, self._rcvbuf)
             if self.all_ns:
                 self.setsockopt(SOL_NETLINK, NETLINK_LISTEN_ALL_NSID, 1)
+            # NETLINK_GET_STRICT_CHK is available since 4.20
+            try:
+                self.setsockopt(SOL_NETLINK, NETLINK_GET_STRICT_CHK, 0)
+                self.capabilities['strict_check'] = True
+            except (OSError, IOError):
+                self.capabilities['strict_check'] = False
 
     def __getattr__(self, attr):
         if attr in ('getsockname', 'getsockopt', 'makefile',
@@ -939,8 +2061,6 @@ class NetlinkSocket(NetlinkMixin):
             return getattr(self._sock, attr)
         elif attr in ('_sendto', '_recv', '_recv_into'):
             return getattr(self._sock, attr.lstrip("_"))
-        elif attr == "recv_ft":
-            return self._sock.recv
 
         raise AttributeError(attr)
 
@@ -949,6 +2069,33 @@ class NetlinkSocket(NetlinkMixin):
         msg.encode()
         return self._sock.sendto(msg.data, addr)
 
+    def strict_gate(self, msg, addr):
+        # the kernel checks the flag only when it gets the
+        # request, and `put()` holds `send_lock`, so it is
+        # safe to turn the flag off right after the send
+        self.setsockopt(SOL_NETLINK, NETLINK_GET_STRICT_CHK, 1)
+        try:
+            return self.sendto_gate(msg, addr)
+        finally:
+            self.setsockopt(SOL_NETLINK, NETLINK_GET_STRICT_CHK, 0)
+
+    def recv_ft(self, bufsize=DEFAULT_RCVBUF, flags=0):
+        '''
+        Receive the data into a buffer from the ring, return
+        a `memoryview` of the received data
+        '''
+        data = self.buffer_ring.get(bufsize)
+        try:
+            length = self._sock.recv_into(data, bufsize, flags)
+        except Exception:
+            self.buffer_ring.release(data)
+            raise
+        data = memoryview(data)[:length]
+        recorder = self.recorder
+        if recorder is not None and not flags & MSG_PEEK:
+            recorder.write(data, self.family)
+        return data
+
     def bind(self, groups=0, pid=None, **kwarg):
         '''
         Bind the socket to given multicast groups, using
@@ -957,6 +2104,18 @@ class NetlinkSocket(NetlinkMixin):
             - If pid is None, use automatic port allocation
             - If pid == 0, use process' pid
             - If pid == <int>, use the value instead of pid
+
+        Keyword arguments:
+
+            - async_cache -- start the async cache thread
+            - overrun -- None, 'event' or 'resync'; see
+              "overrun detection" in the module description
+            - rcvbuf_max -- grow the receive buffer up to this
+              size on overruns
+            - cache_size -- limit the async cache queue, datagrams
+            - backlog_size -- limit the broadcast backlog, messages
+            - queue_policy -- 'drop-oldest' (default), 'block',
+              'drop-newest' or 'coalesce'; see "queue bounds"
         '''
         if pid is not None:
             self.port = 0
@@ -970,6 +2129,23 @@ class NetlinkSocket(NetlinkMixin):
             log.warning('use "async_cache" instead of "async", '
                         '"async" is a keyword from Python 3.7')
         async_cache = kwarg.get('async_cache') or kwarg.get('async')
+        # overrun handling, see "overrun detection" above
+        self.overrun = kwarg.get('overrun', self.overrun)
+        self.rcvbuf_max = kwarg.get('rcvbuf_max', self.rcvbuf_max)
+        if self.overrun not in (None, 'event', 'resync'):
+            raise ValueError('overrun must be None, "event" or "resync"')
+        # queue bounds
+        self.cache_size = kwarg.get('cache_size', self.cache_size)
+        self.backlog_size = kwarg.get('backlog_size', self.backlog_size)
+        self.queue_policy = kwarg.get('queue_policy', self.queue_policy)
+        if self.queue_policy not in QUEUE_POLICIES:
+            raise ValueError('queue_policy must be one of %s' %
+                             (QUEUE_POLICIES, ))
+        self.buffer_queue.size = self.cache_size
+        self.buffer_queue.policy = 'block' \
+            if self.queue_policy == 'coalesce' else self.queue_policy
+        self.demux_queues[0].size = self.backlog_size
+        self.demux_queues[0].policy = self.queue_policy
 
         self.groups = groups
         # if we have pre-defined port, use it strictly
@@ -989,8 +2165,9 @@ class NetlinkSocket(NetlinkMixin):
                     self.post_init()
             else:
                 raise KeyError('no free address available')
-        # all is OK till now, so start async recv, if we need
-        if async_cache:
+        # all is OK till now, so start async recv, if we need;
+        # in the single reader mode the reader thread does the job
+        if async_cache and not self.demux:
             def recv_plugin(*argv, **kwarg):
                 data_in = self.buffer_queue.get()
                 if isinstance(data_in, Exception):
@@ -1013,6 +2190,27 @@ class NetlinkSocket(NetlinkMixin):
             self.pthread.setDaemon(True)
             self.pthread.start()
 
+    def attach_filter(self, spec):
+        '''
+        Attach the BPF filter, that drops the unwanted broadcast
+        messages in the kernel; see `pyroute2.netlink.bpf` for the
+        spec format. The messages sent to the socket port id are
+        always accepted, so the socket must be bound first.
+        '''
+        portid = self.getsockname()[0]
+        if not portid:
+            raise ValueError('the socket must be bound first')
+        self.bpf = NetlinkFilter(spec, self.marshal.msg_map, portid)
+        fstring, fprog = compile_bpf(self.bpf.code)
+        self.setsockopt(SOL_SOCKET, SO_ATTACH_FILTER, fstring)
+
+    def detach_filter(self):
+        '''
+        Detach the BPF filter
+        '''
+        self.setsockopt(SOL_SOCKET, SO_DETACH_FILTER, 0)
+        self.bpf = None
+
     def add_membership(self, group):
         self.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, group)
 
@@ -1028,9 +2226,16 @@ class NetlinkSocket(NetlinkMixin):
                 return
             self.closed = True
 
-        if self.pthread:
+        if self.pthread or self.demux_thread:
             os.write(self._ctrl_write, b'exit')
+            # wake up the readers waiting for the room in the queues
+            for queue in (self.buffer_queue, self.demux_queues[0]):
+                with queue.not_full:
+                    queue.not_full.notify_all()
+        if self.pthread:
             self.pthread.join()
+        if self.demux_thread:
+            self.demux_thread.join()
         super(NetlinkSocket, self).close()
 
         # Common shutdown procedure
@@ -0,0 +1,251 @@
+'''
+Netlink traffic recording
+=========================
+
+`Recorder` saves raw netlink datagrams with timestamps and the
+socket family into a pcap file, and `Player` reads them back and
+feeds them to the parser, IPDB or NDB. So one can record an event
+storm on a production system, and profile the decoding or the
+databases later, on any machine and without root::
+
+    from pyroute2 import IPRoute
+
+    ipr = IPRoute()
+    ipr.bind()
+    ipr.start_recording('storm.pcap')
+    ...
+    ipr.close()   # stops the recording as well
+
+And then::
+
+    from pyroute2.netlink.record import Player
+
+    stats = Player('storm.pcap').replay()            # parse only
+    stats = Player('storm.pcap').replay(ipdb)        # feed an IPDB
+    stats = Player('storm.pcap').replay(ndb,         # feed an NDB
+                                        speed=1.0)   # in real time
+
+The recorder writes the same format as `tcpdump -i nlmon0`:
+`LINKTYPE_LINUX_SLL` with the netlink family in the protocol
+field, so the files can be opened with Wireshark, and the nlmon
+captures can be replayed. The player reads also the
+`LINKTYPE_NETLINK` and `LINKTYPE_LINUX_SLL2` files; pcapng is
+not supported, use `editcap -F pcap` to convert.
+
+A recording socket saves all the datagrams it receives, and the
+requests it sends with the outgoing packet type; the player skips
+the outgoing datagrams unless `outgoing=True`.
+'''
+import time
+import struct
+import threading
+from pyroute2.common import basestring
+from pyroute2.netlink import NETLINK_ROUTE
+
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_NETLINK = 253
+LINKTYPE_LINUX_SLL2 = 276
+
+ARPHRD_NETLINK = 824
+PACKET_HOST = 0
+PACKET_OUTGOING = 4
+
+PCAP_MAGIC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+
+
+class Recorder(object):
+    '''
+    Write the netlink datagrams into a pcap file.
+
+        - f -- a file name or a binary file object
+        - snaplen -- the snapshot length in the file header
+
+    The object is thread-safe; a file opened by the recorder
+    is closed by `close()`, and `write()` is a no-op after it.
+    '''
+
+    def __init__(self, f, snaplen=262144):
+        if isinstance(f, basestring):
+            self.f = open(f, 'wb')
+            self.own = True
+        else:
+            self.f = f
+            self.own = False
+        self.lock = threading.Lock()
+        self.closed = False
+        self.stats = {'datagrams': 0,
+                      'bytes': 0}
+        self.f.write(struct.pack('=IHHiIII',
+                                 PCAP_MAGIC, 2, 4, 0, 0,
+                                 snaplen, LINKTYPE_LINUX_SLL))
+
+    def write(self, data, family, outgoing=False, timestamp=None):
+        '''
+        Save one datagram
+        '''
+        if timestamp is None:
+            timestamp = time.time()
+        sec = int(timestamp)
+        usec = int((timestamp - sec) * 1000000)
+        length = len(data) + 16
+        # SLL header: packet type, ARPHRD, address length,
+        # address, protocol -- in the network byte order
+        sll = struct.pack('>HHH8xH',
+                          PACKET_OUTGOING if outgoing else PACKET_HOST,
+                          ARPHRD_NETLINK, 0, family)
+        with self.lock:
+            if self.closed:
+                return
+            self.f.write(struct.pack('=IIII', sec, usec, length, length))
+            self.f.write(sll)
+            self.f.write(data)
+            self.stats['datagrams'] += 1
+            self.stats['bytes'] += len(data)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.f.flush()
+            if self.own:
+                self.f.close()
+
+
+class Player(object):
+    '''
+    Read the netlink datagrams from a pcap file.
+
+        - f -- a file name or a binary file object
+        - family -- the netlink family for `LINKTYPE_NETLINK`
+          files, where it is not recorded
+        - outgoing -- read also the datagrams sent to the kernel
+        - marshal -- `{family: marshal}` to parse the datagrams;
+          `MarshalRtnl` is used for `NETLINK_ROUTE` by default,
+          and the generic `Marshal` for other families
+
+    Iterating the object returns `(timestamp, family, data)`.
+    '''
+
+    def __init__(self, f, family=NETLINK_ROUTE, outgoing=False,
+                 marshal=None):
+        self.f = f
+        self.family = family
+        self.outgoing = outgoing
+        self.marshal = dict(marshal or {})
+
+    def __iter__(self):
+        if isinstance(self.f, basestring):
+            with open(self.f, 'rb') as f:
+                for packet in self.read(f):
+                    yield packet
+        else:
+            for packet in self.read(self.f):
+                yield packet
+
+    def read(self, f):
+        header = f.read(24)
+        if len(header) < 24:
+            raise ValueError('not a pcap file')
+        for order in ('<', '>'):
+            magic, = struct.unpack(order + 'I', header[:4])
+            if magic in (PCAP_MAGIC, PCAP_MAGIC_NSEC):
+                break
+        else:
+            raise ValueError('not a pcap file, or pcapng')
+        scale = 1000000000.0 if magic == PCAP_MAGIC_NSEC else 1000000.0
+        linktype = struct.unpack(order + 'I', header[20:24])[0] & 0xffff
+        if linktype not in (LINKTYPE_LINUX_SLL,
+                            LINKTYPE_NETLINK,
+                            LINKTYPE_LINUX_SLL2):
+            raise ValueError('unsupported link type %i' % linktype)
+        while True:
+            record = f.read(16)
+            if len(record) < 16:
+                return
+            sec, frac, length, _ = struct.unpack(order + 'IIII', record)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            family = self.family
+            ptype = PACKET_HOST
+            if linktype == LINKTYPE_LINUX_SLL:
+                ptype, hatype, _, family = struct.unpack('>HHH8xH',
+                                                         data[:16])
+                data = data[16:]
+            elif linktype == LINKTYPE_LINUX_SLL2:
+                family, _, _, hatype, ptype = struct.unpack('>HHIHB',
+                                                            data[:11])
+                data = data[20:]
+            if ptype == PACKET_OUTGOING and not self.outgoing:
+                continue
+            yield (sec + frac / scale, family, data)
+
+    def get_marshal(self, family):
+        if family not in self.marshal:
+            if family == NETLINK_ROUTE:
+                from pyroute2.netlink.rtnl.marshal import MarshalRtnl
+                self.marshal[family] = MarshalRtnl()
+            else:
+                from pyroute2.netlink.nlsocket import Marshal
+                self.marshal[family] = Marshal()
+        return self.marshal[family]
+
+    def parse(self):
+        '''
+        Parse the datagrams, return the list of messages for
+        every datagram
+        '''
+        for (timestamp, family, data) in self:
+            yield self.get_marshal(family).parse(data)
+
+    @staticmethod
+    def sink(target):
+        # -> callable, that gets the messages of one datagram
+        if target is None:
+            return lambda msgs: None
+        from pyroute2.ipdb.main import IPDB
+        from pyroute2.ndb.main import NDB
+        if isinstance(target, IPDB):
+            return target._serve_messages
+        elif isinstance(target, NDB):
+            return lambda msgs: target._event_queue.put(('localhost',
+                                                         tuple(msgs)))
+        return target
+
+    def replay(self, target=None, speed=None):
+        '''
+        Parse the datagrams and feed the messages to the target,
+        return the stats.
+
+            - target -- an IPDB or NDB object, or a callable, that
+              gets the list of the messages of every datagram;
+              `None` to parse only
+            - speed -- replay the recording in real time with
+              `speed=1.0`, or N times faster with `speed=N`;
+              `None` means as fast as possible
+
+        NDB applies the messages in its own thread, so the call
+        can return before the NDB is done.
+        '''
+        sink = self.sink(target)
+        stats = {'datagrams': 0,
+                 'messages': 0,
+                 'time': 0}
+        start = time.time()
+        first = None
+        for (timestamp, family, data) in self:
+            if speed:
+                if first is None:
+                    first = timestamp
+                delay = (timestamp - first) / speed - \
+                    (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            msgs = self.get_marshal(family).parse(data)
+            sink(msgs)
+            stats['datagrams'] += 1
+            stats['messages'] += len(msgs)
+        stats['time'] = time.time() - start
+        return stats
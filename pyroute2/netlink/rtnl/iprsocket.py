@@ -1,5 +1,9 @@
 import types
+from socket import AF_INET
+from socket import AF_INET6
+from socket import AF_UNSPEC
 from pyroute2 import config
+from pyroute2.config import AF_BRIDGE
 from pyroute2.common import Namespace
 from pyroute2.common import AddrPool
 from pyroute2.common import DEFAULT_RCVBUF
@@ -9,6 +13,11 @@ from pyroute2.netlink.nlsocket import NetlinkSocket
 from pyroute2.netlink.nlsocket import BatchSocket
 from pyroute2.netlink import rtnl
 from pyroute2.netlink.rtnl.marshal import MarshalRtnl
+from pyroute2.netlink.rtnl.ifinfmsg import ifinfmsg
+from pyroute2.netlink.rtnl.ifaddrmsg import ifaddrmsg
+from pyroute2.netlink.rtnl.rtmsg import rtmsg
+from pyroute2.netlink.rtnl.ndmsg import ndmsg
+from pyroute2.netlink.rtnl.fibmsg import fibmsg
 
 if config.kernel < [3, 3, 0]:
     from pyroute2.netlink.rtnl.ifinfmsg.compat import proxy_newlink
@@ -22,11 +31,27 @@ else:
 
 class IPRSocketMixin(object):
 
+    # (group, message class, dump request type, family)
+    resync_dumps = ((rtnl.RTMGRP_LINK, ifinfmsg, rtnl.RTM_GETLINK, AF_UNSPEC),
+                    (rtnl.RTMGRP_IPV4_IFADDR, ifaddrmsg,
+                     rtnl.RTM_GETADDR, AF_INET),
+                    (rtnl.RTMGRP_IPV6_IFADDR, ifaddrmsg,
+                     rtnl.RTM_GETADDR, AF_INET6),
+                    (rtnl.RTMGRP_IPV4_ROUTE, rtmsg,
+                     rtnl.RTM_GETROUTE, AF_INET),
+                    (rtnl.RTMGRP_IPV6_ROUTE, rtmsg,
+                     rtnl.RTM_GETROUTE, AF_INET6),
+                    (rtnl.RTMGRP_NEIGH, ndmsg, rtnl.RTM_GETNEIGH, AF_UNSPEC),
+                    (rtnl.RTMGRP_IPV4_RULE, fibmsg,
+                     rtnl.RTM_GETRULE, AF_INET),
+                    (rtnl.RTMGRP_IPV6_RULE, fibmsg,
+                     rtnl.RTM_GETRULE, AF_INET6))
+
     def __init__(self, fileno=None, sndbuf=1048576, rcvbuf=1048576,
-                 all_ns=False):
+                 all_ns=False, demux=False):
         super(IPRSocketMixin, self).__init__(NETLINK_ROUTE, fileno=fileno,
                                              sndbuf=sndbuf, rcvbuf=rcvbuf,
-                                             all_ns=all_ns)
+                                             all_ns=all_ns, demux=demux)
         self.marshal = MarshalRtnl()
         self._s_channel = None
         send_ns = Namespace(self, {'addr_pool': AddrPool(0x10000, 0x1ffff),
@@ -47,11 +72,49 @@ class IPRSocketMixin(object):
             self.recv_ft = self._p_recv_ft
 
     def clone(self):
-        return type(self)(sndbuf=self._sndbuf, rcvbuf=self._rcvbuf)
+        return type(self)(sndbuf=self._sndbuf, rcvbuf=self._rcvbuf,
+                          demux=self.demux)
 
     def bind(self, groups=rtnl.RTMGRP_DEFAULTS, **kwarg):
         super(IPRSocketMixin, self).bind(groups, **kwarg)
 
+    def resync(self):
+        '''
+        Dump the links, addresses, routes, neighbours and rules,
+        but only of the subscribed groups
+        '''
+        ret = []
+        for (group, msg_class, msg_type, family) in self.resync_dumps:
+            if self.groups & group:
+                msg = msg_class()
+                msg['family'] = family
+                ret.extend(self.nlm_request(msg, msg_type))
+        return ret
+
+    def coalesce_key(self, msg):
+        '''
+        Links, addresses, neighbours and routes are coalesced,
+        the latest message about the object wins
+        '''
+        if isinstance(msg, ifinfmsg):
+            return ('link', msg['index'])
+        elif isinstance(msg, ifaddrmsg):
+            return ('addr', msg['index'], msg['family'], msg['prefixlen'],
+                    msg.get_attr('IFA_ADDRESS'))
+        elif isinstance(msg, ndmsg):
+            # FDB records are identified by the lladdr
+            return ('neigh', msg['ifindex'], msg['family'],
+                    msg.get_attr('NDA_DST'),
+                    msg.get_attr('NDA_LLADDR')
+                    if msg['family'] == AF_BRIDGE else None)
+        elif isinstance(msg, rtmsg):
+            return ('route', msg['family'],
+                    msg.get_attr('RTA_TABLE', msg['table']),
+                    msg['dst_len'], msg['tos'],
+                    msg.get_attr('RTA_DST'),
+                    msg.get_attr('RTA_PRIORITY'))
+        return None
+
     def _gate(self, msg, addr):
         msg.reset()
         msg.encode()
@@ -81,6 +144,7 @@ class IPRSocketMixin(object):
         ret = proxy_linkinfo(data, self._recv_ns)
         if ret is not None:
             if ret['verdict'] in ('forward', 'error'):
+                self.buffer_ring.release(data)
                 return ret['data']
             else:
                 ValueError('Incorrect verdict')
@@ -166,17 +230,20 @@ class IPRSocket(IPRSocketMixin, NetlinkSocket):
             def get(self, bufsize=DEFAULT_RCVBUF,
                     msg_seq=0,
                     terminate=None,
-                    callback=None):
+                    callback=None,
+                    match=None):
                 if msg_seq == 0:
                     return self._brd_socket.get(bufsize,
                                                 msg_seq,
                                                 terminate,
-                                                callback)
+                                                callback,
+                                                match)
                 else:
                     return super(IPRSocket, self).get(bufsize,
                                                       msg_seq,
                                                       terminate,
-                                                      callback)
+                                                      callback,
+                                                      match)
 
             def close(self):
                 with self.sys_lock:
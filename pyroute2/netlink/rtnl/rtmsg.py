@@ -17,6 +17,14 @@ RTNH_F_OFFLOAD = 8
 RTNH_F_LINKDOWN = 16
 (RTNH_F_NAMES, RTNH_F_VALUES) = map_namespace('RTNH_F', globals())
 
+# rtm_flags for the requests
+RTM_F_NOTIFY = 0x100
+RTM_F_CLONED = 0x200
+RTM_F_EQUALIZE = 0x400
+RTM_F_PREFIX = 0x800
+RTM_F_LOOKUP_TABLE = 0x1000
+RTM_F_FIB_MATCH = 0x2000
+
 LWTUNNEL_ENCAP_NONE = 0
 LWTUNNEL_ENCAP_MPLS = 1
 LWTUNNEL_ENCAP_IP = 2
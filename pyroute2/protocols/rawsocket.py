@@ -1,40 +1,17 @@
 import struct
-from ctypes import Structure
-from ctypes import addressof
-from ctypes import string_at
-from ctypes import sizeof
-from ctypes import c_ushort
-from ctypes import c_ubyte
-from ctypes import c_uint
-from ctypes import c_void_p
 from socket import socket
 from socket import htons
 from socket import AF_PACKET
 from socket import SOCK_RAW
 from socket import SOL_SOCKET
 from pyroute2 import IPRoute
+from pyroute2.netlink.bpf import SO_ATTACH_FILTER
+# compat: the structures used to be defined here
+from pyroute2.netlink.bpf import sock_filter  # noqa: F401
+from pyroute2.netlink.bpf import sock_fprog  # noqa: F401
+from pyroute2.netlink.bpf import compile_bpf
 
 ETH_P_ALL = 3
-SO_ATTACH_FILTER = 26
-
-
-class sock_filter(Structure):
-    _fields_ = [('code', c_ushort),  # u16
-                ('jt', c_ubyte),     # u8
-                ('jf', c_ubyte),     # u8
-                ('k', c_uint)]       # u32
-
-
-class sock_fprog(Structure):
-    _fields_ = [('len', c_ushort),
-                ('filter', c_void_p)]
-
-
-def compile_bpf(code):
-    ProgramType = sock_filter * len(code)
-    program = ProgramType(*[sock_filter(*line) for line in code])
-    sfp = sock_fprog(len(code), addressof(program[0]))
-    return string_at(addressof(sfp), sizeof(sfp)), program
 
 
 class RawSocket(socket):
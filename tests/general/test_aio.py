@@ -0,0 +1,116 @@
+import errno
+from pyroute2 import IPRoute
+from pyroute2 import AsyncIPRoute
+from pyroute2 import NetlinkError
+from utils import require_python
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+
+class TestAsyncIPRoute(object):
+
+    def setup(self):
+        require_python(3)
+        self.loop = asyncio.new_event_loop()
+        self.ipr = AsyncIPRoute(loop=self.loop)
+        self.ip = IPRoute()
+
+    def teardown(self):
+        self.ipr.close()
+        self.ip.close()
+        self.loop.close()
+
+    def run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_get_links(self):
+        links = self.run(self.ipr.get_links())
+        assert [x.get_attr('IFLA_IFNAME') for x in links] == \
+            [x.get_attr('IFLA_IFNAME') for x in self.ip.get_links()]
+
+    def test_filters(self):
+        assert len(self.run(self.ipr.get_routes(table=254))) == \
+            len(self.ip.get_routes(table=254))
+        assert len(self.run(self.ipr.get_addr(index=1))) == \
+            len(self.ip.get_addr(index=1))
+        assert self.run(self.ipr.link_lookup(ifname='lo')) == [1]
+
+    def test_concurrent(self):
+        tasks = [self.loop.create_task(self.ipr.get_addr())
+                 for _ in range(20)] + \
+                [self.loop.create_task(self.ipr.link('get', index=1))
+                 for _ in range(20)]
+        ret = self.run(asyncio.gather(*tasks))
+        assert len(set([len(x) for x in ret[:20]])) == 1
+        assert all([x[0].get_attr('IFLA_IFNAME') == 'lo'
+                    for x in ret[20:]])
+
+    def test_error(self):
+        try:
+            self.run(self.ipr.link('get', index=0xffffff))
+        except NetlinkError as e:
+            assert e.code == errno.ENODEV
+        else:
+            raise AssertionError('exception expected')
+        # the socket must be still usable
+        assert len(self.run(self.ipr.link('get', index=1))) == 1
+
+    def test_requests(self):
+        # every API call sends every request only once
+        sent = []
+        nlm_request = self.ipr.nlm_request
+
+        def count(msg, msg_type, *argv, **kwarg):
+            sent.append(msg_type)
+            return nlm_request(msg, msg_type, *argv, **kwarg)
+
+        self.ipr.nlm_request = count
+        self.run(self.ipr.get_addr(index=1))
+        self.run(self.ipr.link_lookup(ifname='lo'))
+        self.run(self.ipr.get_links(1, 1))
+        assert len(sent) == 4
+
+    def test_backlog(self):
+        for _ in range(50):
+            self.run(self.ipr.link('get', index=1))
+        # only the broadcast backlog is left
+        assert list(self.ipr.backlog.keys()) == [0]
+
+    def test_loop(self):
+        # the queue must use the loop of the socket, not the default
+        async def get_event():
+            self.ipr.dispatch([self.ip.link('get', index=1)[0]])
+            return await self.ipr.__anext__()
+
+        self.ipr.bind()
+        msg = self.run(get_event())
+        assert msg.get_attr('IFLA_IFNAME') == 'lo'
+
+    def test_read_limit(self):
+        # the loop calls the reader again for the rest of the data
+        self.ipr.read_limit = 1
+        assert len(self.run(self.ipr.get_addr())) == \
+            len(self.ip.get_addr())
+
+    def test_pipeline(self):
+        async def run():
+            async with self.ipr.pipeline(window=4) as p:
+                for _ in range(10):
+                    p.link('set', index=1, state='up')
+                p.link('set', index=0xffffff, state='up')
+                p.link('get', index=1)
+                # the calls return the operation number
+                assert p.addr('dump') == 12
+            return p
+
+        p = self.run(run())
+        assert len(p.results) == 13
+        assert all([len(x) == 1 for x in p.results[:10]])
+        assert isinstance(p.results[10], NetlinkError)
+        assert p.results[10].code == errno.ENODEV
+        assert p.results[11][0].get_attr('IFLA_IFNAME') == 'lo'
+        assert len(p.results[12]) == len(self.ip.get_addr())
+        assert list(self.ipr.backlog.keys()) == [0]
+        assert not self.ipr.requests
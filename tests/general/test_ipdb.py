@@ -2,6 +2,7 @@
 
 import os
 import json
+import errno
 import time
 import uuid
 import random
@@ -18,6 +19,9 @@ from pyroute2.common import uifname
 from pyroute2.common import AF_MPLS
 from pyroute2.ipdb.exceptions import CreateException
 from pyroute2.ipdb.exceptions import PartialCommitException
+from pyroute2.ipdb.routes import PrefixTrie
+from pyroute2.netlink.rtnl.ifinfmsg import ifinfmsg
+from pyroute2.netlink.rtnl.ifaddrmsg import ifaddrmsg
 from pyroute2.netlink.exceptions import NetlinkError
 from utils import grep
 from utils import create_link
@@ -1213,6 +1217,33 @@ class TestExplicit(BasicSetup):
         assert '172.16.0.0/24' not in self.ip.routes.keys()
         assert not grep('ip ro', pattern='172.16.0.0/24')
 
+    def test_routes_indices(self):
+        require_user('root')
+        table = self.ip.routes.tables[254]
+        count = len(table)
+        with self.ip.routes.add({'dst': '172.16.0.0/24',
+                                 'gateway': '127.0.0.1'}):
+            pass
+        assert len(table) == count + 1
+        assert len(table.filter({'gateway': '127.0.0.1'})) == 1
+        # the index follows the changes
+        with self.ip.routes['172.16.0.0/24'] as r:
+            r.gateway = '127.0.0.2'
+        assert not table.filter({'gateway': '127.0.0.1'})
+        ret = table.filter({'gateway': '127.0.0.2', 'dst_len': 24})
+        assert len(ret) == 1
+        assert ret[0]['route']['dst'] == '172.16.0.0/24'
+        for record in table.idx.values():
+            route = record['route']
+            for field in table.indices:
+                bucket = table.sdx[field][route[field]]
+                assert bucket[id(route)] is record
+        # delete the route
+        with self.ip.routes['172.16.0.0/24'] as r:
+            r.remove()
+        assert len(table) == count
+        assert not table.filter({'gateway': '127.0.0.2'})
+
     def test_routes_multipath_transition(self):
         require_user('root')
         ifR = self.get_ifname()
@@ -2854,6 +2885,28 @@ class TestPartial(BasicSetup):
         assert bp1['index'] in b['ports']
         assert len(t.errors) == 0
 
+    def test_ipaddr(self):
+        require_user('root')
+        ifA = self.get_ifname()
+
+        i = self.ip.create(ifname=ifA, kind='dummy').commit()
+
+        for x in range(1, 65):
+            i.add_ip('172.16.0.%i/24' % x)
+        # the kernel rejects the prefix length
+        i.add_ip('fe80::1/129')
+        t = i.current_tx
+        t.partial = True
+        try:
+            i.commit(transaction=t)
+        except PartialCommitException:
+            pass
+
+        assert len(t.errors) == 1
+        assert len(i.ipaddr.ipv4) == 64
+        assert ('fe80::1', 129) not in i.ipaddr
+        i.drop(t.uid)
+
 
 class TestImplicit(TestExplicit):
     mode = 'implicit'
@@ -2936,6 +2989,272 @@ class TestImplicit(TestExplicit):
         self.ip.unregister_callback(cuid)
 
 
+class TestPrefixTrie(object):
+
+    def test_within(self):
+        trie = PrefixTrie()
+        for addr in ('10.0.0.1', '10.0.0.2', '10.0.1.1', '11.0.0.1',
+                     'fd00::1', 'fd00:1::1', None, 'invalid'):
+            trie.add(addr)
+        assert sorted(trie.within('10.0.0.0', 24)) == ['10.0.0.1',
+                                                       '10.0.0.2']
+        # 11.0.0.1 & 10.0.0.0 == 10.0.0.0, but it is not in 10/8
+        assert sorted(trie.within('10.0.0.0', 8)) == ['10.0.0.1',
+                                                      '10.0.0.2',
+                                                      '10.0.1.1']
+        assert len(trie.within('0.0.0.0', 0)) == 4
+        assert trie.within('fd00::', 64) == ['fd00::1']
+        assert trie.within('192.168.0.0', 16) == []
+        trie.remove('10.0.0.1')
+        trie.remove('10.0.0.2')
+        trie.remove('10.9.9.9')
+        assert trie.within('10.0.0.0', 24) == []
+        assert trie.within('10.0.0.0', 16) == ['10.0.1.1']
+
+    def test_gc_mark_addr(self):
+        require_user('root')
+        ifname = uifname()
+        with IPDB() as ipdb:
+            (ipdb.interfaces
+             .add(ifname=ifname, kind='dummy')
+             .add_ip('172.18.0.2/24')
+             .up()
+             .commit())
+            try:
+                for i in range(10):
+                    (ipdb.routes
+                     .add(dst='172.19.%i.0/24' % i,
+                          gateway='172.18.0.1',
+                          table=100)
+                     .commit())
+                table = ipdb.routes.tables[100]
+                assert len(table.filter_gateway('172.18.0.0', 24)) == 10
+                with ipdb.interfaces[ifname] as i:
+                    i.del_ip('172.18.0.2/24')
+                for record in table.filter_gateway('172.18.0.0', 24):
+                    assert record['route']['ipdb_scope'] == 'gc'
+            finally:
+                with ipdb.interfaces[ifname] as i:
+                    i.remove()
+
+
+class TestLazyRoutingTable(object):
+
+    table = 2310
+
+    def setup(self):
+        require_user('root')
+        self.ip = IPRoute()
+        for i in range(10):
+            self.ip.route('add',
+                          dst='10.231.%i.0/24' % i,
+                          oif=1,
+                          table=self.table)
+        self.ipdb = IPDB(lazy_rtables=self.table, lazy_rtables_cache=4)
+
+    def teardown(self):
+        self.ipdb.release()
+        self.ip.flush_routes(table=self.table)
+        self.ip.close()
+
+    def test_load(self):
+        table = self.ipdb.routes.tables[self.table]
+        assert len(table) == 10
+        assert len(table.compact) == 10
+        assert not table.idx
+        route = table['10.231.5.0/24']
+        assert route['oif'] == 1
+        assert len(table.idx) == 1
+        assert len(table.compact) == 9
+        # the compact records are matched w/o loading
+        assert len(table.filter({'oif': 2})) == 0
+        assert len(table.idx) == 1
+        assert len(table.keys()) == 10
+        assert not isinstance(self.ipdb.routes.tables[254],
+                              type(table))
+
+    def test_evict(self):
+        table = self.ipdb.routes.tables[self.table]
+        route = table['10.231.5.0/24']
+        assert len([x for x in table]) == 10
+        assert len(table.idx) == 4
+        assert len(table) == 10
+        # the evicted object is reused
+        assert table['10.231.5.0/24'] is route
+
+    def test_events(self):
+        table = self.ipdb.routes.tables[self.table]
+        route = table['10.231.5.0/24']
+        self.ip.route('add', dst='10.231.100.0/24', oif=1,
+                      table=self.table)
+        self.ip.route('replace', dst='10.231.5.0/24', oif=1,
+                      table=self.table, proto=4)
+        self.ip.route('del', dst='10.231.6.0/24', oif=1,
+                      table=self.table)
+        for _ in range(10):
+            if route['proto'] == 4:
+                break
+            time.sleep(0.1)
+        assert route['proto'] == 4
+        assert len(table.idx) == 1
+        assert '10.231.100.0/24' in table
+        assert '10.231.6.0/24' not in table
+        assert len(table) == 10
+
+    def test_commit(self):
+        table = self.ipdb.routes.tables[self.table]
+        with table['10.231.5.0/24'] as route:
+            route['proto'] = 5
+        assert self.ip.get_routes(table=self.table,
+                                  match={'dst': '10.231.5.0'})[0]['proto'] \
+            == 5
+
+    def test_gc(self):
+        table = self.ipdb.routes.tables[self.table]
+        len(table)
+        key = [x for x in table.compact if x.dst == '10.231.5.0/24'][0]
+        lost = key._replace(dst='10.231.200.0/24')
+        with table.clock:
+            table._compact_add(lost, table.compact[key])
+            table.suspects[key] = table.suspects[lost] = time.time() - 10
+        table.gc()
+        # the route is there, the suspect record is not
+        assert key in table.compact
+        assert lost not in table.compact
+        assert not table.suspects
+
+    def test_multipath(self):
+        table = self.ipdb.routes.tables[self.table]
+        len(table)
+        key = [x for x in table.compact if x.dst == '10.231.5.0/24'][0]
+        mp = key._replace(dst='10.231.201.0/24')
+        with table.clock:
+            table._compact_add(mp, (table.compact[key][0], None, None, None,
+                                    ((0xfff0, '10.231.250.1'),
+                                     (0xfff1, '10.231.251.1'))))
+        # the nexthops are indexed as well
+        table.suspect('10.231.251.0', 24)
+        assert list(table.suspects) == [mp]
+        table.forget('oif', 0xfff0)
+        assert mp not in table.compact
+        assert key in table.compact
+        assert not table.suspects
+        assert 0xfff1 not in table.cdx['oif']
+        assert '10.231.251.1' not in table.cdx['gateway']
+
+
+class TestCoalesce(object):
+
+    def msg(self, msg_class, event, **kwarg):
+        msg = msg_class()
+        msg.update(kwarg)
+        msg['event'] = event
+        return msg
+
+    def test_coalesce(self):
+        require_user('root')
+        with IPDB() as ipdb:
+            ipdb.interfaces
+            idx = ipdb.interfaces.lo['index']
+            new = self.msg(ifinfmsg, 'RTM_NEWLINK', index=idx, family=0)
+            bridge = self.msg(ifinfmsg, 'RTM_NEWLINK', index=idx, family=7)
+            addr = self.msg(ifaddrmsg, 'RTM_NEWADDR', index=idx, family=2)
+            unknown = self.msg(ifinfmsg, 'RTM_NEWLINK', index=65535,
+                               family=0)
+            unknown_addr = self.msg(ifaddrmsg, 'RTM_NEWADDR', index=65535,
+                                    family=2)
+            delete = self.msg(ifinfmsg, 'RTM_DELLINK', index=idx, family=0)
+            # the last update wins
+            assert ipdb._coalesce([new, new, new]) == [new]
+            # the other family and the other objects don't matter
+            assert ipdb._coalesce([new, bridge, addr, new]) == \
+                [bridge, addr, new]
+            # but the delete does
+            assert ipdb._coalesce([new, delete, new]) == [new, delete, new]
+            # and the messages about a new interface
+            assert ipdb._coalesce([unknown, unknown_addr, unknown]) == \
+                [unknown, unknown_addr, unknown]
+            assert ipdb._coalesce([unknown, unknown]) == [unknown]
+            # the post-callbacks get all the messages
+            stats = dict(ipdb.stats)
+            other = self.msg(ifaddrmsg, 'RTM_NEWADDR', index=idx, family=99)
+            ipdb._serve_messages([other, other])
+            assert ipdb.stats['messages'] == stats['messages'] + 2
+            assert ipdb.stats['coalesced'] == stats['coalesced']
+
+    def test_pre_callbacks(self):
+        require_user('root')
+        with IPDB() as ipdb:
+            ipdb.interfaces
+            idx = ipdb.interfaces.lo['index']
+            applied = []
+            seen = []
+            ipdb._event_map['RTM_TEST'] = [applied.append]
+            # every pre-callback sees the DB prior to its message,
+            # but after the previous ones
+            cuid = ipdb.register_callback(lambda x, msg, action:
+                                          seen.append(len(applied)),
+                                          mode='pre')
+            try:
+                msgs = [self.msg(ifinfmsg, 'RTM_TEST', index=idx, family=0)
+                        for _ in range(3)]
+                ipdb._serve_messages(msgs)
+            finally:
+                ipdb.unregister_callback(cuid, mode='pre')
+                del ipdb._event_map['RTM_TEST']
+            assert seen == [0, 1, 2]
+            assert applied == msgs
+
+    def test_post_callbacks_bound(self):
+        require_user('root')
+        with IPDB() as ipdb:
+            ipdb.interfaces
+            idx = ipdb.interfaces.lo['index']
+            seen = []
+            cuid = ipdb.register_callback(lambda x, msg, action:
+                                          seen.append(msg))
+            msgs = [self.msg(ifinfmsg, 'RTM_TEST', index=idx, family=0)
+                    for _ in range(5)]
+            # the queue is bound by the messages, not by the batches
+            with ipdb._cbq_lock:
+                ipdb._cbq_count += ipdb._cbq_size - 2
+            try:
+                ipdb._cbq_put(tuple(msgs))
+                for _ in range(50):
+                    if len(seen) == 2:
+                        break
+                    time.sleep(0.1)
+            finally:
+                with ipdb._cbq_lock:
+                    ipdb._cbq_count -= ipdb._cbq_size - 2
+                ipdb.unregister_callback(cuid)
+            assert seen == msgs[:2]
+
+
+class TestRunBatch(object):
+
+    def test_keys(self):
+        require_user('root')
+        with IPDB() as ipdb:
+            lo = ipdb.interfaces.lo
+            lo.partial = True
+            lo.errors = []
+            try:
+                # the dump captures no requests, so the results
+                # must be mapped by the captured ranges
+                failed = lo._run_batch([('dump', 'get_links', (), {}),
+                                        ('ok', 'link', ('set', ),
+                                         {'index': 1, 'state': 'up'}),
+                                        ('bad', 'link', ('set', ),
+                                         {'index': 0xffffff,
+                                          'state': 'up'})])
+            finally:
+                lo.partial = False
+            assert failed == set(['bad'])
+            assert len(lo.errors) == 1
+            assert lo.errors[0].code == errno.ENODEV
+
+
 class TestMisc(object):
 
     def setup(self):
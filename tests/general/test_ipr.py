@@ -2,14 +2,26 @@ import os
 import time
 import errno
 import socket
+import threading
 from functools import partial
+from pyroute2 import config
 from pyroute2 import IPRoute
+from pyroute2 import IPRoutePool
 from pyroute2 import NetlinkError
 from pyroute2.common import uifname
+from pyroute2.common import load_dump
 from pyroute2.common import AF_MPLS
+from pyroute2.config import AF_BRIDGE
 from pyroute2.netlink import nlmsg
+from pyroute2.netlink.rtnl import RTM_GETLINK
+from pyroute2.netlink.rtnl import RTM_NEWLINK
+from pyroute2.netlink.rtnl import RTM_DELLINK
+from pyroute2.netlink.rtnl import RTM_DELROUTE
 from pyroute2.netlink.rtnl.req import IPRouteRequest
 from pyroute2.netlink.rtnl.ifinfmsg import ifinfmsg
+from pyroute2.netlink.rtnl.rtmsg import rtmsg
+from pyroute2.netlink.rtnl.marshal import MarshalRtnl
+from pyroute2.netlink.nlsocket import parallel_parse
 from pyroute2.netlink.rtnl.rtmsg import RTNH_F_ONLINK
 from utils import grep
 from utils import require_user
@@ -82,6 +94,234 @@ class TestSetup(object):
                 raise
 
 
+class TestDemux(object):
+
+    def setup(self):
+        self.ip = IPRoute(demux=True)
+
+    def teardown(self):
+        self.ip.close()
+
+    def test_requests(self):
+        ip = IPRoute()
+        try:
+            assert [x.get_attr('IFLA_IFNAME') for x in
+                    self.ip.get_links()] == \
+                [x.get_attr('IFLA_IFNAME') for x in ip.get_links()]
+            assert len(self.ip.get_addr()) == len(ip.get_addr())
+        finally:
+            ip.close()
+        with assert_raises(NetlinkError):
+            self.ip.link('get', index=0xffffff)
+
+    def test_threads(self):
+        ret = []
+
+        def t():
+            for _ in range(50):
+                ret.append(self.ip.link('get', index=1)[0]['index'])
+
+        pool = [threading.Thread(target=t) for _ in range(16)]
+        for th in pool:
+            th.start()
+        for th in pool:
+            th.join()
+        assert ret == [1] * 800
+        # all the request queues must be released
+        assert list(self.ip.demux_queues.keys()) == [0]
+
+    def test_close(self):
+        self.ip.get_links()
+        self.ip.close()
+        assert not self.ip.demux_thread.is_alive()
+
+
+class TestPipeline(object):
+
+    def setup(self):
+        self.ip = IPRoute()
+
+    def teardown(self):
+        self.ip.close()
+
+    def test_results(self):
+        with self.ip.pipeline(window=4) as p:
+            for _ in range(10):
+                p.link('set', index=1, state='up')
+            p.link('set', index=0xffffff, state='up')
+            p.link('get', index=1)
+            # the calls return the operation number
+            assert p.get_links() == 12
+        assert len(p.results) == 13
+        assert all([len(x) == 1 for x in p.results[:10]])
+        assert isinstance(p.results[10], NetlinkError)
+        assert p.results[10].code == errno.ENODEV
+        assert p.results[11][0].get_attr('IFLA_IFNAME') == 'lo'
+        assert len(p.results[12]) == len(self.ip.get_links())
+
+
+class TestPool(object):
+
+    def setup(self):
+        self.pool = IPRoutePool(size=4)
+
+    def teardown(self):
+        self.pool.close()
+
+    def test_threads(self):
+        ret = []
+
+        def t():
+            for _ in range(50):
+                ret.append(self.pool.link('get', index=1)[0]['index'])
+
+        pool = [threading.Thread(target=t) for _ in range(16)]
+        for th in pool:
+            th.start()
+        for th in pool:
+            th.join()
+        assert ret == [1] * 800
+        assert self.pool.stats['created'] <= 4
+        assert not self.pool.busy
+
+    def test_errors(self):
+        with assert_raises(NetlinkError):
+            self.pool.link('get', index=0xffffff)
+        # netlink errors don't affect the socket
+        assert len(self.pool.free) == 1
+        with assert_raises(OSError):
+            with self.pool.socket() as ipr:
+                raise OSError(errno.EBADF, os.strerror(errno.EBADF))
+        assert ipr.closed
+        assert len(self.pool.free) == 0
+
+    def test_health(self):
+        with self.pool.socket() as ipr:
+            ipr.get_links()
+        # stale data in the idle socket
+        ipr.put(None, RTM_GETLINK)
+        time.sleep(0.1)
+        with self.pool.socket() as sock:
+            assert sock is not ipr
+        assert ipr.closed
+
+    def test_timeout(self):
+        self.pool.size = 1
+        self.pool.timeout = 0.1
+        with self.pool.socket():
+            with assert_raises(RuntimeError):
+                self.pool.get_links()
+
+    def test_idle(self):
+        self.pool.idle = 0
+        self.pool.get_links()
+        time.sleep(0.01)
+        self.pool.get_links()
+        assert self.pool.stats['created'] == 2
+        assert self.pool.stats['closed'] == 1
+
+
+class TestDecoders(object):
+
+    def setup(self):
+        self.ip = IPRoute()
+        self.ip.start_decoders(workers=2)
+
+    def teardown(self):
+        self.ip.close()
+
+    def dump(self, msgs):
+        return [(x['header']['type'], x.get_attr('RTA_DST'),
+                 x.get_attr('IFLA_IFNAME')) for x in msgs]
+
+    def test_dumps(self):
+        with IPRoute() as ip:
+            links = ip.get_links()
+            routes = ip.get_routes(family=socket.AF_INET, table=255)
+        assert self.dump(self.ip.get_links()) == self.dump(links)
+        assert self.dump(self.ip.get_routes(family=socket.AF_INET,
+                                            table=255)) == \
+            self.dump(routes)
+
+    def test_match(self):
+        ret = self.ip.get_links(match={'ifname': 'lo'})
+        assert len(ret) == 1
+        assert ret[0]['index'] == 1
+
+    def test_match_function(self):
+        # the functions are checked in the calling thread
+        ret = self.ip.get_links(match={'ifname': lambda x: x == 'lo',
+                                       'family': 0})
+        assert [x['index'] for x in ret] == [1]
+
+    def test_parse(self):
+        with open('decoder/gre_01', 'r') as f:
+            data = bytes(load_dump(f))
+        marshal = MarshalRtnl()
+        seq = marshal.parse(data)[0]['header']['sequence_number']
+        # the workers return the raw data of the matching messages
+        # and the control messages
+        raw = parallel_parse(MarshalRtnl, MarshalRtnl.msg_map,
+                             data, seq, {'ifname': 'mgre0'})
+        msgs = marshal.parse(raw)
+        assert [x['header']['type'] for x in msgs] == [RTM_NEWLINK, 2]
+        # so the result has the real NLA objects
+        assert msgs[0].get_attr('IFLA_LINKINFO') \
+            .get_attr('IFLA_INFO_KIND') == 'gre'
+        raw = parallel_parse(MarshalRtnl, MarshalRtnl.msg_map,
+                             data, seq, {'ifname': 'eth0'})
+        assert [x['header']['type'] for x in marshal.parse(raw)] == [2]
+
+    def test_not_dump(self):
+        assert self.ip.link('get', index=1)[0]['index'] == 1
+        with assert_raises(NetlinkError):
+            self.ip.link('get', index=0xffffff)
+
+    def test_stop(self):
+        self.ip.stop_decoders()
+        assert self.ip.decoders is None
+        assert len(self.ip.get_links()) > 0
+
+
+class TestOverrun(object):
+
+    def setup(self):
+        self.ip = IPRoute()
+
+    def teardown(self):
+        self.ip.close()
+
+    def enobufs(self):
+        recv_ft = self.ip.recv_ft
+        state = []
+
+        def f(*argv):
+            if not state:
+                state.append(True)
+                raise OSError(errno.ENOBUFS, os.strerror(errno.ENOBUFS))
+            return recv_ft(*argv)
+
+        self.ip.recv_ft = f
+
+    def test_raise(self):
+        self.ip.bind()
+        self.enobufs()
+        with assert_raises(OSError):
+            self.ip.get()
+        assert self.ip.overrun_stats['enobufs'] == 1
+
+    def test_resync(self):
+        self.ip.bind(overrun='resync', rcvbuf_max=4 * 1024 * 1024)
+        rcvbuf = self.ip.overrun_stats['rcvbuf']
+        self.enobufs()
+        msgs = self.ip.get()
+        assert msgs[0]['event'] == 'NLMSG_OVERRUN'
+        assert 'RTM_NEWLINK' in [x['event'] for x in msgs[1:]]
+        assert self.ip.overrun_stats['resync'] == 1
+        assert self.ip.overrun_stats['rcvbuf'] == \
+            min(rcvbuf * 2, 4 * 1024 * 1024)
+
+
 class TestMisc(object):
 
     def setup(self):
@@ -126,10 +366,257 @@ class TestMisc(object):
         assert lvalue != 42
 
 
+class TestFlush(object):
+
+    def setup(self):
+        require_user('root')
+        self.ip = IPRoute()
+        self.table = 2301
+        self.ip.flush_routes(table=self.table)
+
+    def teardown(self):
+        self.ip.flush_routes(table=self.table)
+        self.ip.close()
+
+    def add_routes(self, count):
+        with self.ip.pipeline(window=256) as p:
+            for i in range(count):
+                p.route('add', dst='10.%i.%i.0/24' % (i // 256, i % 256),
+                        oif=1, table=self.table)
+        assert len(self.ip.get_routes(table=self.table)) == count
+
+    def test_flush_routes(self):
+        self.add_routes(2000)
+        ret = self.ip.flush_routes(table=self.table)
+        assert len(ret) == 2000
+        assert not [x for x in ret if x['header']['error']]
+        assert not self.ip.get_routes(table=self.table)
+
+    def test_errors(self):
+        self.add_routes(10)
+        routes = self.ip.get_routes(table=self.table)
+        self.ip.flush_routes(table=self.table)
+        ret = self.ip.nlm_request_batch(routes, RTM_DELROUTE)
+        assert len(ret) == 10
+        for result in ret:
+            assert isinstance(result, NetlinkError)
+            assert result.code == errno.ESRCH
+
+    def test_encode(self):
+        self.add_routes(300)
+        routes = self.ip.get_routes(table=self.table)
+        ret = self.ip.nlm_request_batch(routes, RTM_DELROUTE, size=1024)
+        assert [x for x in ret if isinstance(x, NetlinkError)] == []
+        assert not self.ip.get_routes(table=self.table)
+
+    def test_backlog(self):
+        self.add_routes(10)
+        routes = self.ip.get_routes(table=self.table)
+        allocated = self.ip.addr_pool.allocated
+        self.ip.nlm_request_batch(routes, RTM_DELROUTE)
+        assert list(self.ip.backlog.keys()) == [0]
+        # a broken message in the middle: nothing is sent
+        routes = [rtmsg() for _ in range(4)]
+        for msg in routes:
+            msg['family'] = socket.AF_INET
+            msg['attrs'] = [['RTA_TABLE', self.table]]
+        routes[2]['attrs'].append(['RTA_DST', 'not an address'])
+        assert_raises(Exception, self.ip.nlm_request_batch,
+                      routes, RTM_DELROUTE)
+        assert list(self.ip.backlog.keys()) == [0]
+        assert self.ip.addr_pool.allocated == allocated + 10
+
+
+class TestResolver(object):
+
+    def setup(self):
+        config.link_resolver = True
+        self.ip = IPRoute()
+
+    def teardown(self):
+        self.ip.close()
+        config.link_resolver = False
+
+    def event(self, msg_type, index, ifname, family=0):
+        msg = ifinfmsg()
+        msg['header']['type'] = msg_type
+        msg['family'] = family
+        msg['index'] = index
+        msg['attrs'] = [['IFLA_IFNAME', ifname]]
+        self.ip.get_resolver().nl.backlog[0].append(msg)
+
+    def test_lookup(self):
+        for link in self.ip.get_links():
+            ifname = link.get_attr('IFLA_IFNAME')
+            address = link.get_attr('IFLA_ADDRESS')
+            assert self.ip.link_lookup(ifname=ifname) == [link['index']]
+            assert link['index'] in self.ip.link_lookup(address=address)
+            assert link['index'] in \
+                self.ip.link_lookup(IFLA_ADDRESS=address)
+        assert self.ip.link_lookup(ifname='not_exists') == []
+        assert self.ip.get_resolver().stats['loads'] == 1
+
+    def test_events(self):
+        self.event(RTM_NEWLINK, 0xfff0, 'fake0')
+        assert self.ip.link_lookup(ifname='fake0') == [0xfff0]
+        # rename
+        self.event(RTM_NEWLINK, 0xfff0, 'fake1')
+        assert self.ip.link_lookup(ifname='fake0') == []
+        assert self.ip.link_lookup(ifname='fake1') == [0xfff0]
+        # bridge port released
+        self.event(RTM_DELLINK, 0xfff0, 'fake1', family=AF_BRIDGE)
+        assert self.ip.link_lookup(ifname='fake1') == [0xfff0]
+        self.event(RTM_DELLINK, 0xfff0, 'fake1')
+        assert self.ip.link_lookup(ifname='fake1') == []
+        assert self.ip.get_resolver().get(0xfff0) is None
+
+    def test_disabled(self):
+        config.link_resolver = False
+        with IPRoute() as ip:
+            assert ip.link_lookup(ifname='lo') == [1]
+            assert ip.get_resolver() is None
+
+    def test_consistent(self):
+        # the same results with the resolver and without it
+        config.link_resolver = False
+        with IPRoute() as ip:
+            for link in self.ip.get_links():
+                linkinfo = link.get_attr('IFLA_LINKINFO')
+                kind = linkinfo.get_attr('IFLA_INFO_KIND') \
+                    if linkinfo is not None else None
+                for spec in ({'index': link['index']},
+                             {'ifname': link.get_attr('IFLA_IFNAME')},
+                             {'kind': kind}):
+                    assert sorted(ip.link_lookup(**spec)) == \
+                        self.ip.link_lookup(**spec)
+            assert ip.link_lookup(index=0xfff0) == []
+            assert ip.get_resolver() is None
+
+
 def _callback(msg, obj):
     obj.cb_counter += 1
 
 
+class TestRouteLookup(object):
+
+    def setup(self):
+        require_user('root')
+        self.ip = IPRoute()
+        self.dst = '10.255.255.0'
+        self.ip.route('add', dst='%s/24' % self.dst, type='unreachable')
+
+    def teardown(self):
+        self.ip.flush_routes(table=254, match={'dst': self.dst,
+                                               'dst_len': 24})
+        self.ip.close()
+
+    def test_order(self):
+        dsts = ['127.0.0.1', '10.255.255.1', '::1', '127.0.0.2'] * 100
+        ret = self.ip.route_lookup_many(dsts, window=64)
+        assert len(ret) == len(dsts)
+        for (dst, result) in zip(dsts, ret):
+            if dst == '10.255.255.1':
+                assert isinstance(result, NetlinkError)
+                assert result.code == errno.EHOSTUNREACH
+                continue
+            route = self.ip.route('get', dst=dst)[0]
+            assert result == {'oif': route.get_attr('RTA_OIF'),
+                              'gateway': route.get_attr('RTA_GATEWAY'),
+                              'prefsrc': route.get_attr('RTA_PREFSRC'),
+                              'table': route.get_attr('RTA_TABLE')}
+
+    def test_fields(self):
+        ret = self.ip.route_lookup_many(['127.0.0.1'],
+                                        fields=('oif', 'dst_len', 'type'))
+        assert ret == [{'oif': 1, 'dst_len': 32, 'type': 2}]
+
+    def test_table(self):
+        # 127.0.0.1 is in the local table
+        ret = self.ip.route_lookup_many(['127.0.0.1', '127.0.0.2'],
+                                        fields=('table', ),
+                                        table=255)
+        assert ret == [{'table': 255}] * 2
+        ret = self.ip.route_lookup_many([{'dst': '127.0.0.1'}],
+                                        fields=('table', ),
+                                        table=254)
+        assert ret == [None]
+
+
+class TestReconcile(object):
+
+    def setup(self):
+        require_user('root')
+        self.ip = IPRoute()
+        self.table = 2302
+        self.ip.flush_routes(table=self.table)
+
+    def teardown(self):
+        self.ip.flush_routes(table=self.table)
+        self.ip.close()
+
+    def routes(self, count, **kwarg):
+        ret = []
+        for i in range(count):
+            route = {'dst': '10.%i.%i.0/24' % (i // 256, i % 256),
+                     'oif': 1,
+                     'table': self.table}
+            route.update(kwarg)
+            ret.append(route)
+        return ret
+
+    def count(self, report):
+        return dict([(x, len(y) if isinstance(y, list) else y)
+                     for (x, y) in report.items()])
+
+    def test_converge(self):
+        scope = {'table': self.table}
+        desired = self.routes(100)
+        desired.append({'dst': 'fd00:2302::/64',
+                        'oif': 1,
+                        'table': self.table})
+        report = self.ip.reconcile('routes', desired, scope=scope)
+        assert self.count(report) == {'add': 101,
+                                      'replace': 0,
+                                      'delete': 0,
+                                      'keep': 0,
+                                      'errors': 0}
+        assert len(self.ip.get_routes(table=self.table)) == 101
+        # nothing to do
+        report = self.ip.reconcile('routes', desired, scope=scope)
+        assert report['keep'] == 101
+        assert not (report['add'] or report['replace'] or report['delete'])
+        # drift
+        desired = desired[10:]
+        desired[0] = {'dst': desired[0]['dst'],
+                      'type': 'blackhole',
+                      'table': self.table}
+        desired[1] = dict(desired[1], proto='boot')
+        desired.append({'dst': '10.1.0.0/24', 'oif': 1, 'table': self.table})
+        plan = self.ip.reconcile('routes', desired, scope=scope,
+                                 dry_run=True)
+        assert len(self.ip.get_routes(table=self.table)) == 101
+        report = self.ip.reconcile('routes', desired, scope=scope)
+        assert self.count(plan) == self.count(report) == {'add': 1,
+                                                          'replace': 2,
+                                                          'delete': 10,
+                                                          'keep': 89,
+                                                          'errors': 0}
+        assert report['add'] == [desired[-1]]
+        assert report['replace'] == desired[:2]
+        routes = self.ip.get_routes(table=self.table, type=6)
+        assert len(routes) == 1   # blackhole
+        assert routes[0].get_attr('RTA_DST') == desired[0]['dst'][:-3]
+        report = self.ip.reconcile('routes', desired, scope=scope)
+        assert report['keep'] == 92
+        # delete the rest
+        report = self.ip.reconcile('routes', [], scope=scope)
+        assert len(report['delete']) == 92
+        assert not self.ip.get_routes(table=self.table)
+
+    def test_kind(self):
+        assert_raises(ValueError, self.ip.reconcile, 'links', [])
+
+
 class TestIPRoute(object):
 
     def setup(self):
@@ -335,6 +822,31 @@ class TestIPRoute(object):
         assert len(self.ip.get_addr(match=lambda x: x['index'] ==
                                     self.ifaces[0])) == 2
 
+    def test_strict_filter(self):
+        require_user('root')
+        if not self.ip.capabilities['strict_check']:
+            raise SkipTest('NETLINK_GET_STRICT_CHK not supported')
+        self.ip.addr('add',
+                     index=self.ifaces[0],
+                     address='172.16.0.1',
+                     prefixlen=24)
+        self.ip.link('set', index=self.ifaces[0], state='up')
+        requests = (('get_addr', {'index': self.ifaces[0]}),
+                    ('get_routes', {'oif': self.ifaces[0]}),
+                    ('get_routes', {'table': 255, 'oif': self.ifaces[0]}),
+                    ('get_neighbours', {'ifindex': self.ifaces[0]}))
+        for (method, kwarg) in requests:
+            strict = getattr(self.ip, method)(**kwarg)
+            legacy = getattr(self.ip, method)(match=kwarg)
+            assert len(strict) == len(legacy)
+            for (x, y) in zip(strict, legacy):
+                assert x['family'] == y['family']
+                assert [nla[0] for nla in x['attrs']] == \
+                    [nla[0] for nla in y['attrs']]
+        # unknown interfaces should not fail
+        assert len(self.ip.get_routes(oif=0xffff)) == 0
+        assert len(self.ip.get_neighbours(ifindex=0xffff)) == 0
+
     @skip_if_not_supported
     def _create_ipvlan(self, smode):
         master = uifname()
@@ -1,6 +1,22 @@
+import io
 import socket
+import struct
 from utils import require_user
+from utils import require_python
+from nose.tools import assert_raises
+from pyroute2 import IPRoute
+from pyroute2.common import load_dump
 from pyroute2.netlink.nlsocket import NetlinkSocket
+from pyroute2.netlink.nlsocket import BufferRing
+from pyroute2.netlink.nlsocket import BoundedQueue
+from pyroute2.netlink.rtnl import RTM_NEWLINK
+from pyroute2.netlink.rtnl import RTM_DELLINK
+from pyroute2.netlink.rtnl import RTM_NEWROUTE
+from pyroute2.netlink.rtnl.marshal import MarshalRtnl
+from pyroute2.netlink.bpf import NetlinkFilter
+from pyroute2.netlink.record import Player
+from pyroute2.netlink.record import Recorder
+from pyroute2.netlink.record import LINKTYPE_NETLINK
 
 
 class _TestNL(object):
@@ -69,3 +85,244 @@ class _TestNL(object):
             fail.close()
         except AssertionError:
             pass
+
+
+class TestBufferRing(object):
+
+    def test_reuse(self):
+        ring = BufferRing(size=1024, count=2)
+        buf = ring.get()
+        view = memoryview(buf)[:16]
+        # the buffer is in use, so get() must return another one
+        other = ring.get()
+        assert other is not buf
+        ring.release(view)
+        ring.release(other)
+        assert ring.get() is buf
+        assert ring.get() is other
+        assert ring.stats['allocated'] == 2
+        # the views are released with the buffer
+        assert_raises(ValueError, bytes, view)
+        # the data that doesn't belong to the ring is ignored
+        ring.release(b'data')
+        ring.release(memoryview(bytearray(16)))
+        assert not ring.is_free(buf)
+
+    def test_grow(self):
+        ring = BufferRing(size=1024, count=1)
+        assert len(ring.get(4096)) == 4096
+        assert len(ring.ring) == 1
+
+    def test_parse_view(self):
+        with open('decoder/gre_01', 'r') as f:
+            data = load_dump(f)
+        ring = BufferRing(size=len(data))
+        buf = ring.get()
+        buf[:len(data)] = data
+        view = memoryview(buf)[:len(data)]
+        msgs = MarshalRtnl().parse(view)
+        ring.release(view)
+        assert ring.is_free(buf)
+        # every message gets the copy of its own bytes
+        assert len(msgs) == 2
+        buf[:len(data)] = bytearray(len(data))
+        for msg in msgs:
+            assert msg.offset == 0
+            assert len(msg.data) == msg['header']['length']
+        assert msgs[0].get_attr('IFLA_IFNAME') == 'mgre0'
+
+
+class TestBoundedQueue(object):
+
+    def queue(self, policy):
+        queue = BoundedQueue(size=3, policy=policy,
+                             key=lambda x: x % 10)
+        for item in (1, 2, 3, 11):
+            queue.put(item)
+        return queue
+
+    def items(self, queue):
+        return list(queue.queue)
+
+    def test_drop_oldest(self):
+        queue = self.queue('drop-oldest')
+        assert self.items(queue) == [2, 3, 11]
+        assert queue.stats['dropped'] == 1
+
+    def test_drop_newest(self):
+        queue = self.queue('drop-newest')
+        assert self.items(queue) == [1, 2, 3]
+        assert queue.stats['dropped'] == 1
+
+    def test_coalesce(self):
+        queue = self.queue('coalesce')
+        assert self.items(queue) == [2, 3, 11]
+        assert queue.stats['coalesced'] == 1
+        queue.put(4)
+        assert self.items(queue) == [3, 11, 4]
+        assert queue.stats['dropped'] == 1
+
+    def test_coalesce_keys(self):
+        # the key is computed once per item
+        calls = []
+
+        def key(item):
+            calls.append(item)
+            return item % 10
+
+        queue = BoundedQueue(size=3, policy='coalesce', key=key)
+        for item in (1, 2, 3, 11, 12, 4, 21):
+            queue.put(item)
+        assert calls == [1, 2, 3, 11, 12, 4, 21]
+        assert self.items(queue) == [12, 4, 21]
+        assert queue.stats['coalesced'] == 3
+        # the consumed items are not coalesced anymore
+        assert queue.get() == 12
+        queue.put(32)
+        assert self.items(queue) == [4, 21, 32]
+        assert queue.stats['coalesced'] == 3
+
+    def test_block(self):
+        queue = self.queue('block')
+        assert self.items(queue) == [1, 2, 3, 11]
+        # the queue is full, wait() returns on cancel
+        queue.wait(lambda: True)
+        assert queue.stats['blocked'] == 1
+        queue.get()
+        queue.get()
+        # there is free room now
+        queue.wait(lambda: False)
+        assert queue.stats['blocked'] == 1
+        # the producer that can not wait drops the overflow
+        queue.put(21)
+        queue.put(31, block=False)
+        assert self.items(queue) == [3, 11, 21]
+        assert queue.stats['dropped'] == 1
+
+    def test_block_requests(self):
+        # a full backlog must not block the requests
+        with IPRoute() as ip:
+            ip.bind(backlog_size=1, queue_policy='block')
+            ip.get_timeout = 3
+            ip.backlog[0].extend(ip.link('get', index=1) * 2)
+            assert len(ip.link('get', index=1)) == 1
+
+
+class TestNetlinkFilter(object):
+
+    def compile(self, spec):
+        return NetlinkFilter(spec, MarshalRtnl.msg_map).code
+
+    def run(self, code, data):
+        # a tiny classic BPF interpreter for the generated code
+        pc = 0
+        while True:
+            (op, jt, jf, k) = code[pc]
+            if op == 0x06:
+                return k
+            elif op & 0x07 == 0x00:
+                size = {0x00: 4, 0x08: 2, 0x10: 1}[op & 0x18]
+                acc = int.from_bytes(data[k:k + size], 'big')
+                pc += 1
+            else:
+                pc += 1 + (jt if acc == k else jf)
+
+    def msg(self, msg_type, pid=0, body=b''):
+        header = struct.pack('IHHII', 16 + len(body), msg_type, 0, 0, pid)
+        return header + body
+
+    def test_types(self):
+        require_python(3)
+        code = self.compile({'header': {'type': (RTM_NEWLINK,
+                                                 RTM_DELLINK)}})
+        assert self.run(code, self.msg(RTM_NEWLINK))
+        assert self.run(code, self.msg(RTM_DELLINK))
+        assert not self.run(code, self.msg(RTM_NEWROUTE))
+
+    def test_fields(self):
+        require_python(3)
+        code = NetlinkFilter([{'header': {'type': RTM_NEWLINK},
+                               'index': 2},
+                              {'header': {'type': RTM_NEWROUTE},
+                               'table': 254}],
+                             MarshalRtnl.msg_map,
+                             portid=1234).code
+        link = struct.pack('BBHiII', 0, 0, 0, 2, 0, 0)
+        route = struct.pack('BBBBBBBBI', 2, 0, 0, 0, 254, 0, 0, 0, 0)
+        assert self.run(code, self.msg(RTM_NEWLINK, body=link))
+        assert not self.run(code, self.msg(RTM_NEWLINK, body=route))
+        assert self.run(code, self.msg(RTM_NEWROUTE, body=route))
+        assert not self.run(code, self.msg(RTM_NEWROUTE, body=link))
+        # the messages to the socket port id are accepted
+        assert self.run(code, self.msg(RTM_NEWROUTE, pid=1234, body=link))
+
+    def test_attach(self):
+        ip = IPRoute()
+        try:
+            ip.bind()
+            ip.attach_filter({'header': {'type': RTM_NEWLINK},
+                              'index': 0xffff})
+            # the responses must pass the filter
+            assert len(ip.get_links()) > 0
+            ip.detach_filter()
+        finally:
+            ip.close()
+
+    def test_fail(self):
+        assert_raises(ValueError, self.compile, {'index': 2})
+        assert_raises(KeyError, self.compile,
+                      {'header': {'type': RTM_NEWLINK},
+                       'IFLA_IFNAME': 'lo'})
+
+
+class TestRecord(object):
+
+    def test_record(self):
+        f = io.BytesIO()
+        with IPRoute() as ip:
+            ip.start_recording(f)
+            links = ip.get_links()
+            ip.stop_recording()
+            ip.get_links()
+        f.seek(0)
+        packets = list(Player(f))
+        assert packets
+        assert set([x[1] for x in packets]) == set([socket.NETLINK_ROUTE])
+        f.seek(0)
+        msgs = []
+        stats = Player(f).replay(msgs.extend)
+        assert stats['datagrams'] == len(packets)
+        assert [x['index'] for x in msgs
+                if x['event'] == 'RTM_NEWLINK'] == \
+            [x['index'] for x in links]
+        # the requests are recorded as well
+        f.seek(0)
+        assert len(list(Player(f, outgoing=True))) == len(packets) + 1
+
+    def test_speed(self):
+        f = io.BytesIO()
+        recorder = Recorder(f)
+        data = struct.pack('IHHII', 16, 3, 0, 0, 0)
+        recorder.write(data, 0, timestamp=100)
+        recorder.write(data, 0, timestamp=100.2)
+        f.seek(0)
+        stats = Player(f).replay(speed=2)
+        assert stats['messages'] == 2
+        assert 0.09 < stats['time'] < 1
+
+    def test_closed(self):
+        # the readers may still hold the recorder after close()
+        recorder = Recorder('/dev/null')
+        recorder.close()
+        recorder.write(struct.pack('IHHII', 16, 3, 0, 0, 0), 0)
+        recorder.close()
+        assert recorder.stats['datagrams'] == 0
+
+    def test_netlink_linktype(self):
+        data = struct.pack('IHHII', 16, 3, 0, 0, 0)
+        f = io.BytesIO(struct.pack('=IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0,
+                                   65535, LINKTYPE_NETLINK) +
+                       struct.pack('=IIII', 1, 0, 16, 16) + data)
+        assert list(Player(f, family=16)) == [(1, 16, data)]
+        f = io.BytesIO(b'\x0a\x0d\x0d\x0a' + b'\x00' * 20)
+        assert_raises(ValueError, list, Player(f))
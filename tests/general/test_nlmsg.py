@@ -1,5 +1,11 @@
 from pyroute2.common import load_dump
 from pyroute2.netlink import nlmsg
+from pyroute2.netlink import nlmsg_base
+from pyroute2.netlink import compile_struct
+from pyroute2.netlink import compile_nla_encoder
+from pyroute2.netlink import compile_peek
+from pyroute2.netlink.nlsocket import Match
+from pyroute2.netlink.rtnl.rtmsg import rtmsg
 from pyroute2.netlink.rtnl.iprsocket import MarshalRtnl
 from pyroute2.netlink.nl80211 import MarshalNl80211
 
@@ -79,3 +85,175 @@ class TestNl80211(TestNL):
 
     def _test_iw_scan(self):
         self.load_data(fname='decoder/iw_scan_rsp', packets=4)
+
+
+class codec_msg(nlmsg_base):
+    header = None
+    fields = (('a', 'B'),
+              ('__pad', '3x'),
+              ('b', '>I'),
+              ('c', '!H'),
+              ('d', 'H'),
+              ('e', '2H'),
+              ('f', '4s'))
+
+
+class TestCodec(object):
+
+    def test_segments(self):
+        codec = compile_struct(codec_msg.fields)
+        assert codec is compile_struct(codec_msg.fields)
+        # '>I' and '!H' are merged, as well as native 'H', '2H', '4s'
+        assert [x[0].format for x in codec.segments] == ['=B3x',
+                                                         '>IH',
+                                                         '=H2H4s']
+        assert codec.size == codec_msg.get_size() == 20
+
+    def test_variable(self):
+        codec = compile_struct((('a', 'I'), ('b', 'z')))
+        assert codec.segments is None
+
+    def test_encode_decode(self):
+        msg = codec_msg()
+        msg.setvalue({'a': 1, 'b': 2, 'c': 3, 'd': 4,
+                      'e': (5, 6), 'f': 'test'})
+        msg.encode()
+        ret = codec_msg(msg.data)
+        ret.decode()
+        assert ret['a'] == 1
+        assert ret['b'] == 2
+        assert ret['c'] == 3
+        assert ret['d'] == 4
+        assert ret['e'] == (5, 6)
+        assert ret['f'] == b'test'
+        assert ret['__pad'] == ()
+
+
+class TestLazy(object):
+
+    def parse(self):
+        with open('decoder/gre_01', 'r') as f:
+            return MarshalRtnl().parse(load_dump(f))
+
+    def test_slots(self):
+        msg = self.parse()[0]
+        linkinfo = [x for x in msg['attrs'] if x[0] == 'IFLA_LINKINFO'][0]
+        # not created yet
+        assert linkinfo.cell[1] is None
+        assert linkinfo.src is not None
+        assert msg.get_nested('IFLA_LINKINFO', 'IFLA_INFO_KIND') == 'gre'
+        assert linkinfo.src is None
+        assert linkinfo.cell[1].decoded
+
+    def test_unreferenced(self):
+        attrs = self.parse()[0]['attrs']
+        assert attrs[0][1] is not None
+
+    def test_index(self):
+        msg = nlmsg()
+        msg.setvalue(prime)
+        assert msg.get_attrs('A') == [2, 3, 4]
+        msg['attrs'].append(['A', 5])
+        assert msg.get_attrs('A') == [2, 3, 4, 5]
+        # the same length, but other names
+        msg['attrs'][0] = ['C', 6]
+        assert msg.get_attrs('A') == [3, 4, 5]
+        assert msg.get_attrs('C') == [6]
+        msg['attrs'][1][0] = 'D'
+        assert msg.get_attrs('A') == [4, 5]
+        msg['attrs'] = [['C', 1]]
+        assert msg.get_attr('A') is None
+        assert msg.get_attr('C') == 1
+        msg['attrs'][0] = ['A', 2]
+        assert msg.get_attr('A') == 2
+        assert msg.get_attr('C') is None
+
+
+class TestEncoder(object):
+
+    def test_compile(self):
+        assert compile_nla_encoder(rtmsg.uint32) is not None
+        assert compile_nla_encoder(rtmsg.target) is not None
+        # custom encode() and nested NLA chains use NLA objects
+        assert compile_nla_encoder(rtmsg.array) is None
+        assert compile_nla_encoder(rtmsg.metrics) is None
+
+    def test_encode(self):
+        msg = rtmsg()
+        msg['family'] = 2
+        msg['dst_len'] = 24
+        msg['attrs'] = [['RTA_DST', '10.0.0.0'],
+                        ['RTA_GATEWAY', '10.1.1.1'],
+                        ['RTA_METRICS', {'attrs': [['RTAX_MTU', 1400]]}],
+                        ['RTA_TABLE', 100]]
+        msg.encode()
+        ret = rtmsg(msg.data)
+        ret.decode()
+        assert ret['header']['length'] == len(msg.data)
+        assert ret.get_attr('RTA_DST') == '10.0.0.0'
+        assert ret.get_attr('RTA_GATEWAY') == '10.1.1.1'
+        assert ret.get_nested('RTA_METRICS', 'RTAX_MTU') == 1400
+        assert ret.get_attr('RTA_TABLE') == 100
+
+
+def route_dump():
+    data = bytearray()
+    for (table, dst, oif) in ((254, '10.0.0.0', 1),
+                              (254, '10.0.1.0', 2),
+                              (1000, '10.0.2.0', 2),
+                              (255, 'fd00::', 1)):
+        msg = rtmsg()
+        msg['header']['sequence_number'] = 5
+        msg['header']['type'] = 24
+        msg['family'] = 10 if dst.find(':') > -1 else 2
+        msg['table'] = table if table < 256 else 252
+        msg['attrs'] = [['RTA_DST', dst],
+                        ['RTA_OIF', oif],
+                        ['RTA_TABLE', table]]
+        msg.encode()
+        data.extend(msg.data)
+    return data
+
+
+class TestMatch(object):
+
+    data = route_dump()
+    marshal = MarshalRtnl()
+
+    def parse(self, spec):
+        match = Match(spec)
+        full = [x for x in self.marshal.parse(self.data, 5) if match(x)]
+        peek = self.marshal.parse(self.data, 5, None, match)
+        assert [x.get_attr('RTA_DST') for x in full] == \
+            [x.get_attr('RTA_DST') for x in peek if match(x)]
+        return peek
+
+    def test_compile(self):
+        assert compile_peek(rtmsg, {'table': 254}) is not None
+        # functions and strings can not be checked on raw data
+        assert compile_peek(rtmsg, {'oif': lambda x: x > 1}) is None
+        assert compile_peek(rtmsg, {'event': 'RTM_NEWROUTE'}) is None
+        assert compile_peek(rtmsg, lambda x: True) is None
+
+    def test_peek(self):
+        assert len(self.parse({'table': 254})) == 2
+        assert len(self.parse({'table': 1000})) == 1
+        assert len(self.parse({'table': 254, 'oif': 2})) == 1
+        assert len(self.parse({'dst': '10.0.2.0'})) == 1
+        assert len(self.parse({'dst': 'fd00::'})) == 1
+        assert len(self.parse({'dst': '10.0.3.0'})) == 0
+        assert len(self.parse({'oif': 3, 'table': 254})) == 0
+
+    def test_fallback(self):
+        assert len(self.parse({'oif': lambda x: x == 2})) == 4
+        assert len(self.parse({'dst': '10.0.0.0/24'})) == 4
+        assert len(self.parse(lambda x: x['family'] == 10)) == 4
+
+    def test_match(self):
+        msgs = self.marshal.parse(self.data, 5)
+        assert len([x for x in msgs if Match({'oif': 2})(x)]) == 2
+        assert len([x for x in msgs
+                    if Match({'table': lambda x: x > 253})(x)]) == 3
+        assert len([x for x in msgs if Match({'family': 10})(x)]) == 1
+        assert len([x for x in msgs if Match({})(x)]) == 4
+        assert len([x for x in msgs if Match(None)(x)]) == 0
@@ -107,6 +107,38 @@ class TestAddrPool(object):
         except KeyError:
             pass
 
+    def test_ban(self):
+
+        ap = AddrPool(minaddr=1, maxaddr=1024)
+        f = ap.alloc()
+        ap.free(f, ban=3)
+        # banned addresses remain allocated for `ban` rounds
+        for i in range(3):
+            assert ap.alloc() != f
+            assert ap.locate(f)[2]
+        assert ap.alloc() == f
+        assert ap.allocated == 4
+
+    def test_ban_long(self):
+
+        ap = AddrPool(minaddr=1, maxaddr=4096)
+        f = ap.alloc()
+        ap.free(f, ban=ap.ban_ring_size * 2 + 1)
+        for i in range(ap.ban_ring_size * 2 + 1):
+            assert ap.alloc() != f
+        assert ap.alloc() == f
+
+    def test_lowest_free(self):
+
+        ap = AddrPool(minaddr=1, maxaddr=1024)
+        addrs = [ap.alloc() for i in range(200)]
+        assert addrs == list(range(1, 201))
+        ap.free(150)
+        ap.free(3)
+        assert ap.alloc() == 3
+        assert ap.alloc() == 150
+        assert ap.alloc() == 201
+
 
 class TestCommon(object):
 